@@ -0,0 +1,465 @@
+'''Benchmarks for the Schedule of Classes scraper. Runs every stage against the offline corpus
+   and a local stand-in server so results can be compared from one commit to the next.
+   Created by Aykan Fonseca.'''
+
+# Builtins
+import argparse
+import glob
+import json
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from collections import defaultdict
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+# Scraper being measured.
+import catalog_index
+import controller
+import fixtures
+import httpcache
+import soc
+import table
+import upload
+
+# Stages in the order they run.
+STAGES = ['fetch', 'extract', 'format', 'records', 'parse', 'group', 'prepare', 'transform', 'upload']
+
+# Seconds between samples of the resident memory, without tracemalloc.
+RSS_INTERVAL = 0.005
+
+# KiB per page of /proc/self/statm.
+PAGE_KIB = os.sysconf('SC_PAGE_SIZE') // 1024 if hasattr(os, 'sysconf') else 4
+
+
+def load_pages(directory):
+    '''Loads every saved results page in a directory, in page order.'''
+
+    paths = [path for path in glob.glob(os.path.join(directory, '*.html'))
+             if os.path.basename(path).partition('.')[0].isdigit()]
+
+    # Files are named by page number, so sort numerically: 2.html before 10.html.
+    paths.sort(key=lambda path: int(os.path.basename(path).partition('.')[0]))
+
+    pages = []
+    for path in paths:
+        with open(path, 'rb') as file:
+            pages.append(file.read())
+
+    return pages
+
+
+def bench_extractors(pages, rounds=3):
+    '''Times every extractor in soc.EXTRACTORS over the pages and checks they all produce
+       the same class strings and emails as the bs4 reference.'''
+
+    results = {}
+    reference = None
+
+    for name in sorted(soc.EXTRACTORS, key=lambda x: x != 'bs4'):
+        best = None
+
+        for _ in range(rounds):
+            teacher_email_map = {}
+            current_dept = None
+            master = []
+
+            start = time.time()
+            for content in pages:
+                page_list, current_dept = soc.parse_page(content, teacher_email_map, current_dept, name)
+                master.append(page_list)
+            elapsed = time.time() - start
+
+            best = elapsed if best is None else min(best, elapsed)
+
+        if reference is None:
+            reference = (master, teacher_email_map)
+
+        results[name] = {'pages/sec': round(len(pages) / best, 1),
+                         'matches bs4': (master, teacher_email_map) == reference}
+
+    return results
+
+
+def bench_processes(pages, processes, rounds=3):
+    '''Times parsing the pages into records in this process and with soc.parse_pages_in_processes,
+       and checks both produce the same records, in the same order, and the same emails.'''
+
+    results = {}
+    reference = None
+
+    for name, count in (('serial', 0), ('{} processes'.format(processes), processes)):
+        best = None
+
+        for _ in range(rounds):
+            teacher_email_map = {}
+
+            start = time.time()
+            if count:
+                courses = list(soc.parse_pages_in_processes(iter(pages), teacher_email_map, count))
+            else:
+                master = []
+                current_dept = None
+                for content in pages:
+                    page_list, current_dept = soc.parse_page(content, teacher_email_map, current_dept)
+                    master.append(page_list)
+
+                courses = list(soc.parse_courses(soc.format_list(master)))
+            elapsed = time.time() - start
+
+            best = elapsed if best is None else min(best, elapsed)
+
+        if reference is None:
+            reference = (courses, teacher_email_map)
+
+        results[name] = {'pages/sec': round(len(pages) / best, 1),
+                         'matches serial': (courses, teacher_email_map) == reference}
+
+    return results
+
+
+def percentile(samples, point):
+    '''The value below which point percent of the samples fall.'''
+
+    if not samples:
+        return 0.0
+
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * point / 100.0))]
+
+
+def timed(iterable, latencies):
+    '''Yields from iterable, recording how long each item took to produce.'''
+
+    iterator = iter(iterable)
+
+    while True:
+        start = time.time()
+        try:
+            item = next(iterator)
+        except StopIteration:
+            return
+        latencies.append(time.time() - start)
+
+        yield item
+
+
+def rss_kib():
+    '''The resident memory of this process in KiB. Where there is no /proc, the peak so far.'''
+
+    try:
+        with open('/proc/self/statm') as file:
+            return int(file.read().split()[1]) * PAGE_KIB
+    except (IOError, OSError):
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+        # Bytes on macOS, KiB elsewhere.
+        return peak // 1024 if sys.platform == 'darwin' else peak
+
+
+class RssPeak(object):
+    '''Samples the resident memory in a thread from start to stop, for its peak above where it
+       started. What Recorder measures without tracemalloc, ex: on Python 2.'''
+
+    def start(self):
+        self.first = self.peak = rss_kib()
+        self.done = threading.Event()
+        self.thread = threading.Thread(target=self.sample)
+        self.thread.daemon = True
+        self.thread.start()
+
+        return self
+
+    def sample(self):
+        while not self.done.wait(RSS_INTERVAL):
+            self.peak = max(self.peak, rss_kib())
+
+    def stop(self):
+        self.done.set()
+        self.thread.join()
+        self.peak = max(self.peak, rss_kib())
+
+    def kib(self):
+        return self.peak - self.first
+
+
+class Recorder(object):
+    '''Collects the time, item count, per item latencies and peak memory of each stage. Peak
+       memory comes from tracemalloc where there is one, else from sampling the resident memory.'''
+
+    def __init__(self, trace_memory):
+        self.trace_memory = trace_memory
+        self.stages = {}
+
+    def run(self, name, function):
+        '''Runs function(latencies) as the stage name. It returns (result, number of items).'''
+
+        latencies = []
+        rss = None
+
+        if self.trace_memory and tracemalloc is not None:
+            tracemalloc.start()
+        elif self.trace_memory:
+            rss = RssPeak().start()
+
+        start = time.time()
+        try:
+            result, items = function(latencies)
+        finally:
+            if rss is not None:
+                rss.stop()
+        elapsed = time.time() - start
+
+        stage = {'items': items, 'seconds': round(elapsed, 4),
+                 'items/sec': round(items / elapsed, 1) if elapsed else 0.0}
+
+        for point in (50, 90, 99):
+            stage['p{} ms'.format(point)] = round(percentile(latencies, point) * 1000, 3)
+
+        if rss is not None:
+            stage['peak KiB'] = rss.kib()
+        elif self.trace_memory:
+            stage['peak KiB'] = tracemalloc.get_traced_memory()[1] // 1024
+            tracemalloc.stop()
+
+        self.stages[name] = stage
+
+        return result
+
+
+def run_pipeline(server, recorder, workers):
+    '''Runs each stage of soc.runner one after the other against the stand-in server.'''
+
+    number_pages = fixtures.count_pages(server.directory)
+    url_page_tuple = [(soc.SOC_URL + str(x), x) for x in range(1, number_pages + 1)]
+
+    def fetch(latencies):
+        fetch_page = soc.fetch_page
+
+        # Times each request, wherever the worker thread making it runs.
+        def timed_fetch_page(url, session=None):
+            start = time.time()
+            content = fetch_page(url, session)
+            latencies.append(time.time() - start)
+
+            return content
+
+        soc.fetch_page = timed_fetch_page
+        try:
+            contents = [content for _, content in soc.fetch_pages(url_page_tuple, workers)]
+        finally:
+            soc.fetch_page = fetch_page
+
+        return contents, len(contents)
+
+    def extract(latencies):
+        teacher_email_map = {}
+        current_dept = None
+        master = []
+
+        for content in contents:
+            start = time.time()
+            page_list, current_dept = soc.parse_page(content, teacher_email_map, current_dept)
+            latencies.append(time.time() - start)
+
+            master.append(page_list)
+
+        return (teacher_email_map, master), len(master)
+
+    def format(latencies):
+        formatted = list(timed(soc.format_list(master), latencies))
+        return formatted, len(formatted)
+
+    def records(latencies):
+        courses = list(timed(soc.parse_courses(formatted), latencies))
+        return courses, len(courses)
+
+    def parse(latencies):
+        parsed = list(timed(soc.iter_parse_list(formatted), latencies))
+        return parsed, len(parsed)
+
+    def group(latencies):
+        grouped = soc.group_list(parsed)
+        return grouped, len(grouped)
+
+    def prepare(latencies):
+        # The catalog is read in one request, as prepare_for_db does without a local copy.
+        catalog = catalog_index.CatalogIndex.from_firebase(soc.FIREBASE_DB)
+        prepared = soc.prepare_for_db(grouped, teacher_email_map, catalog)
+        return prepared, len(prepared[0])
+
+    def transform(latencies):
+        # What runner does instead of parse, group and prepare: the db schema straight from the records.
+        catalog = catalog_index.CatalogIndex.from_firebase(soc.FIREBASE_DB)
+        grouped_by_teachers = defaultdict(lambda: [set(), set()])
+        sections_table = table.SectionTable(courses)
+        transformed = dict(timed(soc.prepare_courses(soc.group_courses(courses), teacher_email_map,
+                                                     grouped_by_teachers, catalog, sections_table), latencies))
+        return (transformed, soc.finish_teachers(grouped_by_teachers)), len(transformed)
+
+    def upload_stage(latencies):
+        grouped, grouped_by_teachers = prepared
+
+        # Latencies are per request, each a batch of nodes.
+        with upload.BulkWriter(soc.FIREBASE_DB) as writer:
+            writer.put_all('/quarter/BENCH/', grouped)
+            writer.put_all('/quarter/BENCH teachers/', grouped_by_teachers)
+
+        latencies.extend(writer.latencies)
+        uploads.update(nodes=writer.nodes, requests=writer.requests, bytes=writer.bytes)
+
+        return None, writer.nodes
+
+    uploads = {}
+    contents = recorder.run('fetch', fetch)
+    teacher_email_map, master = recorder.run('extract', extract)
+    formatted = recorder.run('format', format)
+    courses = recorder.run('records', records)
+    parsed = recorder.run('parse', parse)
+    grouped = recorder.run('group', group)
+    prepared = recorder.run('prepare', prepare)
+    transformed = recorder.run('transform', transform)
+    recorder.run('upload', upload_stage)
+
+    recorder.stages['upload'].update(uploads)
+
+    # Both must give the db exactly the same classes and teachers.
+    recorder.stages['transform']['matches prepare'] = all(
+        json.dumps(new, sort_keys=True) == json.dumps(old, sort_keys=True) for new, old in zip(transformed, prepared))
+
+    return recorder.stages
+
+
+def bench_pipeline(directory, workers=soc.WORKERS, delay=0, rate=None):
+    '''Times every stage, then runs them again under tracemalloc, or sampling the resident
+       memory without it, for their peak memory. Timing and memory are measured separately as
+       tracing slows everything down. Requests
+       per second to the stand-in are limited to rate, if given.'''
+
+    server = fixtures.StandInServer(directory, delay=delay).start()
+    urls = (soc.SOC_URL, soc.FIREBASE_DB)
+    ca_bundle = os.environ.get('REQUESTS_CA_BUNDLE')
+    session = soc.SESSION
+    cache_dir = tempfile.mkdtemp()
+
+    try:
+        fixtures.point_soc_at(server)
+
+        # Every run starts with an empty http cache, so runs compare.
+        soc.SESSION = httpcache.session(httpcache.DiskCache(cache_dir), controller.Controller(rate=rate))
+
+        stages = run_pipeline(server, Recorder(False), workers)
+        memory = run_pipeline(server, Recorder(True), workers)
+    finally:
+        soc.SOC_URL, soc.FIREBASE_DB = urls
+        soc.SESSION = session
+        shutil.rmtree(cache_dir, ignore_errors=True)
+        if ca_bundle is None:
+            os.environ.pop('REQUESTS_CA_BUNDLE', None)
+        else:
+            os.environ['REQUESTS_CA_BUNDLE'] = ca_bundle
+        server.stop()
+
+    for name in stages:
+        stages[name]['peak KiB'] = memory[name].get('peak KiB')
+
+    return {'pages': fixtures.count_pages(directory), 'workers': workers, 'delay': delay, 'rate': rate,
+            'python': sys.version.split()[0], 'memory': 'tracemalloc' if tracemalloc is not None else 'rss',
+            'stages': stages}
+
+
+def print_report(report, previous=None):
+    '''Prints each stage, and its change in seconds from a previous report if given.'''
+
+    columns = ['items', 'seconds', 'items/sec', 'p50 ms', 'p90 ms', 'p99 ms', 'peak KiB']
+
+    print("{:<10}".format('stage') + "".join("{:>12}".format(x) for x in columns) + ("{:>10}".format('change') if previous else ""))
+
+    for name in STAGES:
+        stage = report['stages'][name]
+        line = "{:<10}".format(name) + "".join("{:>12}".format(str(stage[x])) for x in columns)
+
+        if previous and name in previous['stages'] and previous['stages'][name]['seconds']:
+            change = stage['seconds'] / previous['stages'][name]['seconds'] - 1
+            line += "{:>+10.0%}".format(change)
+
+        print(line)
+
+
+def main():
+    '''The main function.'''
+    print(sys.version)
+
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('directory', nargs='?', default=fixtures.FIXTURES_DIR, help='corpus of saved result pages')
+    parser.add_argument('--extractors', action='store_true', help='only compare the html extractors')
+    parser.add_argument('--processes', type=int, help='only compare parsing in this many processes against one')
+    parser.add_argument('--workers', type=int, default=soc.WORKERS, help='pages fetched at once')
+    parser.add_argument('--rate', type=float, help='requests per second allowed to the stand-in, unlimited if not given')
+    parser.add_argument('--delay', type=float, default=0, help='seconds the stand-in waits before each page')
+    parser.add_argument('--output', help='write the report as json to this file')
+    parser.add_argument('--compare', help='a previous json report to compare against')
+    args = parser.parse_args()
+
+    # Nothing recorded yet, so make up a quarter.
+    if not fixtures.count_pages(args.directory):
+        print("No pages in {}, synthesizing a quarter.".format(args.directory))
+        fixtures.synthesize(args.directory)
+
+    if args.extractors:
+        pages = load_pages(args.directory)
+        print("Benchmarking extractors on {} pages\n".format(len(pages)))
+
+        for name, result in sorted(bench_extractors(pages).items()):
+            print("  - {}: {} pages/sec, matches bs4: {}".format(name, result['pages/sec'], result['matches bs4']))
+        return
+
+    if args.processes:
+        pages = load_pages(args.directory)
+        print("Benchmarking parsing on {} pages\n".format(len(pages)))
+
+        for name, result in sorted(bench_processes(pages, args.processes).items()):
+            print("  - {}: {} pages/sec, matches serial: {}".format(name, result['pages/sec'], result['matches serial']))
+        return
+
+    report = bench_pipeline(args.directory, args.workers, args.delay, args.rate)
+
+    previous = None
+    if args.compare:
+        with open(args.compare) as file:
+            previous = json.load(file)
+
+    print("Benchmarking {} pages with {} workers\n".format(report['pages'], report['workers']))
+    print_report(report, previous)
+
+    # Parsing, grouping and preparing is what parsing into records and transform replace.
+    stages = report['stages']
+    legacy = sum(stages[name]['seconds'] for name in ('parse', 'group', 'prepare'))
+    current = stages['records']['seconds'] + stages['transform']['seconds']
+    print("\nRecords and transform: {:.4f}s against {:.4f}s for parse, group and prepare ({:.1f}x), matches prepare: {}".format(
+        current, legacy, legacy / current if current else 0, stages['transform']['matches prepare']))
+    print("Peak KiB of each stage, summed: {} against {}".format(
+        sum(stages[name]['peak KiB'] or 0 for name in ('records', 'transform')),
+        sum(stages[name]['peak KiB'] or 0 for name in ('parse', 'group', 'prepare'))))
+
+    uploaded = report['stages']['upload']
+    print("\nUploaded {} nodes in {} requests ({} KiB)".format(uploaded['nodes'], uploaded['requests'], uploaded['bytes'] // 1024))
+
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump(report, file, indent=2, sort_keys=True)
+
+
+if __name__ == '__main__':
+    main()
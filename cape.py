@@ -6,12 +6,15 @@ import time
 
 # Pip install packages.
 from bs4 import BeautifulSoup
-from cachecontrol import CacheControl
 from firebase import firebase
-import requests
+
+# Our modules.
+import httpcache
+import instructors
+import metrics
 
 # Global Variables.
-SESSION = CacheControl(requests.Session())
+SESSION = httpcache.session()
 
 # A timestamp for the scrape in year-month-day-hour-minute.
 TIMESTAMP = int(time.strftime("%Y%m%d%H%M"))
@@ -80,8 +83,9 @@ def get_teacher_and_classes(data):
     return course_teacher_mapping
 
 
-def get_distributions_for_course(course, teachers, print_errors):
-    """ Gets all the averages for a particular course on a per teacher basis."""
+def get_distributions_for_course(course, teachers, print_errors, run_metrics=None):
+    """ Gets all the averages for a particular course on a per teacher basis. Rows that can't be
+        parsed are counted in run_metrics, a metrics.Metrics, if given."""
 
     course_data = {}
     for teacher in teachers:
@@ -130,6 +134,8 @@ def get_distributions_for_course(course, teachers, print_errors):
                         if (print_errors):
                             print "ISN'T A VALID ROW."
                 except:
+                    if run_metrics is not None:
+                        run_metrics.count('parse errors')
                     continue
 
         hours = 0
@@ -154,18 +160,22 @@ def get_distributions_for_course(course, teachers, print_errors):
 
 
 def update_db(quarter, data):
-    """ Updates nodes with grade distribution data."""
+    """ Updates nodes with grade distribution data. Returns the number of nodes written."""
 
     print("Updating information in database.")
 
     keys_exclude = {'restrictions', 'code', 'description', 'title', 'prerequisites', 'units', 'dei', 'key', 'waitlist', 'podcast'}
     database = firebase.FirebaseApplication(FIREBASE_DB)
+    writes = 0
 
     for course in data:
         path = "/quarter/" + quarter + "/" + str(course) + "/"
 
         course_node = database.get(path, None)
 
+        # Names are matched like the instructors registry matches them, ex: if the spelling changed.
+        course_data = dict((instructors.normalize(teacher), value) for teacher, value in data[course].items())
+
         sections = list(set(course_node.keys()) - keys_exclude)
 
         for section in sections:
@@ -178,13 +188,18 @@ def update_db(quarter, data):
             if (section_info != None): 
                 name = section_info['section'][1]['name']
 
-                relevant_data = (data[course])[name]
+                # Sections without an instructor, ex: Staff, have no CAPEs.
+                relevant_data = course_data.get(instructors.normalize(name), [])
 
                 if (relevant_data != []):
                     database.put(section_path, 'cape', {'study': relevant_data[0], 'expected': relevant_data[1], 'received': relevant_data[2]})
                 else:
                     database.put(section_path, 'cape', "N/A")
 
+                writes += 1
+
+    return writes
+
 
 def reset_db():
     """ Deletes data to firebase."""
@@ -209,20 +224,40 @@ def main():
         # Harcode needed quarter.
         quarter = "SP18"
 
-    data = get_data_from_db(quarter)
+    # Time spent in each stage, requests made and so on, written to metrics.METRICS_DIR at the end.
+    run_metrics = metrics.Metrics('cape', {'quarter': quarter})
+
+    with run_metrics.stage('read'):
+        registry = instructors.Registry.load()
 
-    course_teacher_mapping = get_teacher_and_classes(data)
+        # The instructors registry knows who teaches what if soc.py recorded the quarter.
+        course_teacher_mapping = registry.course_teachers(quarter)
+
+        if not course_teacher_mapping:
+            data = get_data_from_db(quarter)
+
+            course_teacher_mapping = get_teacher_and_classes(data)
 
     print("Parsing Data! Will take some time.")
     all_course_data = {}
-    for course, teachers in course_teacher_mapping.items():
-        all_course_data[course] = get_distributions_for_course(course, teachers, print_errors)
+
+    with run_metrics.watch(SESSION), run_metrics.stage('scrape'):
+        for course, teachers in course_teacher_mapping.items():
+            all_course_data[course] = get_distributions_for_course(course, teachers, print_errors, run_metrics)
+
+            # A page for every teacher, and a record if it had CAPEs.
+            run_metrics.count('pages', len(teachers))
+            run_metrics.count('records', sum(1 for x in all_course_data[course].values() if x))
 
     if (reset_db):
         reset_db()
 
     if (upload_data):
-        update_db(quarter, all_course_data)
+        with run_metrics.stage('upload'):
+            run_metrics.count('firebase writes', update_db(quarter, all_course_data))
+
+    print(run_metrics.summary())
+    print("Metrics written to " + run_metrics.write())
 
 if __name__ == '__main__':
     main()
\ No newline at end of file
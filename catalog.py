@@ -7,10 +7,14 @@ import itertools
 # Pip installed packages.
 from firebase import firebase
 from bs4 import BeautifulSoup
-import requests
+
+# Our modules.
+import catalog_index
+import httpcache
+import metrics
 
 # Global Variables.
-SESSION = requests.Session()
+SESSION = httpcache.session()
 SUBJECTS_URL = 'http://blink.ucsd.edu/instructors/courses/schedule-of-classes/subject-codes.html'
 URL_CATALOG = 'http://www.ucsd.edu/catalog/courses/'
 URL_CATALOG2 = 'http://www.ucsd.edu/catalog/front/courses.html'
@@ -40,13 +44,8 @@ def get_data(url_subject_tuple):
     s = SESSION
 
     for url, subject in url_subject_tuple:
-        # Occasionally, the first call will fail.
-        try:
-            post = s.get(url, stream=True)
-        except requests.exceptions.HTTPError:
-            post = s.get(url, stream=True)
-        except requests.exceptions.ConnectionError:
-            post = s.get(url, stream=True)
+        # Paced and retried by controller.CONTROLLER, under the http cache.
+        post = s.get(url, stream=True)
 
         if post.status_code != 404:
             # Parse the response into HTML.
@@ -272,21 +271,27 @@ def write_to_db(dictionary):
 
 
 def main():
+    # Time spent in each stage, requests made and so on, written to metrics.METRICS_DIR at the end.
+    run_metrics = metrics.Metrics('catalog')
+
     reset_db()
 
-    global s
+    with run_metrics.watch(SESSION):
+        with run_metrics.stage('subjects'):
+            subjects = get_subjects()
 
-    s = requests.Session()
-    subjects = get_subjects()
+        # Forms pairs of (URL, subject code).
+        url_subject_tuples = ((URL_CATALOG + x + ".html", x) for x in subjects)
 
-    # Forms pairs of (URL, subject code).
-    url_subject_tuples = ((URL_CATALOG + x + ".html", x) for x in subjects)
+        with run_metrics.stage('scrape'):
+            raw_data = get_data(url_subject_tuples)
 
-    raw_data = get_data(url_subject_tuples)
+    run_metrics.count('pages', len(raw_data))
 
-    formatted_data, problem_data = format_data(raw_data)
+    with run_metrics.stage('format'):
+        formatted_data, problem_data = format_data(raw_data)
 
-    case_two_problem_data, final = handle_problem_data_partially(formatted_data, problem_data)
+        case_two_problem_data, final = handle_problem_data_partially(formatted_data, problem_data)
 
     # Convert final 'dictionary' back to list.
     converted = [val for key, val in final.items()]
@@ -320,6 +325,10 @@ def main():
 
     finalized = convert_to_dictionary_final(cleaned_final)
 
+    # Courses with only a title, and codes that aren't a department and number.
+    run_metrics.count('parse errors', len(case_two_problem_data) + len(errors))
+    run_metrics.count('records', len(finalized))
+
     print len(finalized)
     # for key, value in lister.items():
     #     split_by_dash = key.split('-')
@@ -468,7 +477,16 @@ def main():
     #         file.write(str(i))
     #         file.write("\n")
 
-    write_to_db(finalized)
+    with run_metrics.stage('upload'):
+        write_to_db(finalized)
+
+    run_metrics.count('firebase writes', len(finalized))
+
+    # Local copy for soc.prepare_for_db, so it doesn't read the catalog back from firebase.
+    catalog_index.CatalogIndex(finalized).save()
+
+    print(run_metrics.summary())
+    print("Metrics written to " + run_metrics.write())
 
     # for key, value in lister2.items():
     #     print key
@@ -0,0 +1,98 @@
+'''In memory index of the course catalog, loaded once instead of read course by course from
+   firebase. Created by Aykan Fonseca.'''
+
+# Builtins
+import json
+import os
+import re
+import time
+
+# Pip install packages.
+import requests
+from firebase import firebase
+
+# Where a copy of the catalog is kept between runs. catalog.py writes it whenever it scrapes.
+CATALOG_PATH = 'catalog.json'
+
+# Seconds a copy is used for before the catalog is read from firebase again, ex: after catalog.py
+# ran somewhere else.
+MAX_AGE = 24 * 60 * 60
+
+# Department, then the course number, ex: 'cse  132 a' -> ('cse', '132 a').
+CODE_REGEX = re.compile(r'\s*([A-Za-z]+)\s*(.*?)\s*$')
+
+
+def normalize(code):
+    '''The form courses are keyed by in the catalog, ex: 'cse 132 a' and 'CSE132A' -> 'CSE 132A'.'''
+
+    match = CODE_REGEX.match(code)
+
+    if not match or not match.group(2):
+        return code.strip().upper()
+
+    return match.group(1).upper() + ' ' + ''.join(match.group(2).split()).upper()
+
+
+class CatalogIndex(object):
+    '''The title, units, description and prerequisites of every course, keyed by normalized code.'''
+
+    def __init__(self, catalog=None):
+        self.courses = dict((normalize(code), value) for code, value in (catalog or {}).items())
+
+    def __len__(self):
+        return len(self.courses)
+
+    def __contains__(self, code):
+        return normalize(code) in self.courses
+
+    def get(self, code, default=None):
+        '''The catalog entry of a course, or default if it isn't listed.'''
+
+        return self.courses.get(normalize(code), default)
+
+    def save(self, path=CATALOG_PATH):
+        '''Writes the catalog to a file for load to read next time.'''
+
+        with open(path + '.tmp', 'w') as file:
+            json.dump(self.courses, file)
+
+        os.rename(path + '.tmp', path)
+
+    @classmethod
+    def from_file(cls, path=CATALOG_PATH):
+        with open(path) as file:
+            return cls(json.load(file))
+
+    @classmethod
+    def from_firebase(cls, dsn):
+        '''Reads the whole catalog node in a single request.'''
+
+        return cls(firebase.FirebaseApplication(dsn).get('/catalog', None))
+
+
+def load(dsn, path=CATALOG_PATH, max_age=MAX_AGE):
+    '''The catalog from the local copy at path if it was written less than max_age seconds ago,
+       or else from firebase, saving a copy for next time. An older copy is still used if
+       firebase can't be read or has no catalog.'''
+
+    copy = path and os.path.exists(path)
+
+    if copy and time.time() - os.path.getmtime(path) < max_age:
+        return CatalogIndex.from_file(path)
+
+    try:
+        catalog = CatalogIndex.from_firebase(dsn)
+    except requests.exceptions.RequestException:
+        if not copy:
+            raise
+
+        print("Couldn't read the catalog from firebase, using the copy in " + path)
+        return CatalogIndex.from_file(path)
+
+    if not len(catalog) and copy:
+        return CatalogIndex.from_file(path)
+
+    if path and len(catalog):
+        catalog.save(path)
+
+    return catalog
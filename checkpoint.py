@@ -0,0 +1,149 @@
+'''Checkpoints of a run of soc.runner, so a run that dies part way can be resumed instead of
+   redone from the first page. Every page fetched and every batch uploaded is saved under the
+   run's id before the run moves on. Created by Aykan Fonseca.'''
+
+# Builtins
+import hashlib
+import json
+import os
+import shutil
+import threading
+
+# Where each run keeps its checkpoints, in a directory named by its id.
+RUNS_DIR = 'runs'
+
+# Files of a run: what was searched, its pages, and the upload batches sent.
+META_FILE = 'meta.json'
+PAGES_DIR = 'pages'
+BATCHES_FILE = 'batches.log'
+
+
+def write_durably(path, content):
+    '''Writes a file so that after a crash it either holds all of content or doesn't exist.'''
+
+    with open(path + '.tmp', 'wb') as file:
+        file.write(content)
+        file.flush()
+        os.fsync(file.fileno())
+
+    os.rename(path + '.tmp', path)
+
+
+def digest(changes):
+    '''A hash of the writes of an upload, to tell whether a resumed upload sends the same ones.'''
+
+    return hashlib.sha1(json.dumps(changes, sort_keys=True).encode('utf_8')).hexdigest()
+
+
+class Run(object):
+    '''The checkpoints of one run. meta holds the term, subjects, number of pages and timestamp
+       of the run, so a resumed run parses exactly what the first attempt would have, and the
+       stages it finished.'''
+
+    def __init__(self, run_id, directory=RUNS_DIR):
+        self.id = run_id
+        self.path = os.path.join(directory, run_id)
+        self.lock = threading.Lock()
+
+        with open(os.path.join(self.path, META_FILE)) as file:
+            self.meta = json.load(file)
+
+    @classmethod
+    def create(cls, term, subjects, number_pages, timestamp, directory=RUNS_DIR):
+        '''Starts the checkpoints of a new run, with an id like FA19-201910011200.'''
+
+        run_id = '{}-{}'.format(term, timestamp)
+        path = os.path.join(directory, run_id)
+
+        # A run started again in the same minute starts over.
+        shutil.rmtree(path, ignore_errors=True)
+        os.makedirs(os.path.join(path, PAGES_DIR))
+
+        meta = {'term': term, 'subjects': subjects, 'number pages': number_pages, 'timestamp': timestamp,
+                'stages': [], 'finished': False}
+        write_durably(os.path.join(path, META_FILE), json.dumps(meta).encode('utf_8'))
+
+        return cls(run_id, directory)
+
+    @classmethod
+    def latest(cls, term=None, directory=RUNS_DIR):
+        '''The most recent run that didn't finish, of a term if given, or None.'''
+
+        runs = []
+
+        for run_id in os.listdir(directory) if os.path.isdir(directory) else []:
+            try:
+                run = cls(run_id, directory)
+            except (IOError, OSError, ValueError):
+                continue
+
+            if not run.meta['finished'] and term in (None, run.meta['term']):
+                runs.append((run.meta['timestamp'], run_id, run))
+
+        return max(runs)[2] if runs else None
+
+    def save_meta(self):
+        with self.lock:
+            write_durably(os.path.join(self.path, META_FILE), json.dumps(self.meta).encode('utf_8'))
+
+    def page_path(self, page):
+        return os.path.join(self.path, PAGES_DIR, '{}.html'.format(page))
+
+    def pages(self):
+        '''The numbers of every page saved.'''
+
+        return set(int(name.partition('.')[0]) for name in os.listdir(os.path.join(self.path, PAGES_DIR))
+                   if name.endswith('.html'))
+
+    def save_page(self, page, content):
+        write_durably(self.page_path(page), content)
+
+    def load_page(self, page):
+        with open(self.page_path(page), 'rb') as file:
+            return file.read()
+
+    def finished_stage(self, stage):
+        return stage in self.meta['stages']
+
+    def finish_stage(self, stage):
+        '''Records that a stage with side effects, ex: adding seats to their history, is done so
+           a resumed run doesn't do it twice.'''
+
+        self.meta['stages'].append(stage)
+        self.save_meta()
+
+    def batches(self, changes_digest):
+        '''The numbers of the upload batches already sent for these changes. If the last attempt
+           was uploading different changes, its batches are forgotten.'''
+
+        path = os.path.join(self.path, BATCHES_FILE)
+
+        try:
+            with open(path) as file:
+                lines = file.read().split('\n')
+        except IOError:
+            lines = []
+
+        if lines and lines[0] == changes_digest:
+            # Every finished batch ends in a newline, so the last piece is empty or was cut short by a crash.
+            return set(int(x) for x in lines[1:-1] if x.isdigit())
+
+        write_durably(path, (changes_digest + '\n').encode('utf_8'))
+
+        return set()
+
+    def finish_batch(self, number):
+        '''Records that an upload batch was sent.'''
+
+        with self.lock, open(os.path.join(self.path, BATCHES_FILE), 'a') as file:
+            file.write('{}\n'.format(number))
+            file.flush()
+            os.fsync(file.fileno())
+
+    def finish(self):
+        '''Marks the run done and drops its pages, which are no longer needed.'''
+
+        self.meta['finished'] = True
+        self.save_meta()
+
+        shutil.rmtree(os.path.join(self.path, PAGES_DIR), ignore_errors=True)
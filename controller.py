@@ -0,0 +1,219 @@
+'''Paces the requests sent to each site the scrapers read from, so more threads never means
+   hammering it. Every host gets a token bucket limiting requests per second and a concurrency
+   limit adjusted like TCP's congestion window: raised a little after every quick answer, halved
+   when answers slow down or come back 429 / 5xx. Failed requests are sent again after an
+   exponential backoff with jitter. Created by Aykan Fonseca.'''
+
+# Builtins
+import random
+import threading
+import time
+
+# Pip install packages.
+import requests
+from requests.adapters import HTTPAdapter
+from requests.compat import urlparse
+
+# Requests per second and the most sent in a burst, per host. None for no limit.
+RATE = 20
+BURST = 20
+
+# Requests a host is sent at once: to start with, and the bounds of the adjustments.
+INITIAL_CONCURRENCY = 4
+MIN_CONCURRENCY = 1
+MAX_CONCURRENCY = 16
+
+# Added to the concurrency limit over each limit's worth of good answers, and multiplied by on a bad one.
+INCREASE = 1.0
+DECREASE = 0.5
+
+# Answers are slow when their average latency is this many times the fastest average seen, and
+# also this many seconds more.
+LATENCY_TOLERANCE = 2.0
+LATENCY_SLACK = 0.1
+
+# Weight of the newest latency in the average.
+SMOOTHING = 0.2
+
+# Times a request is sent again, seconds waited before the first retry at most, and the longest wait.
+RETRIES = 4
+BACKOFF = 0.5
+MAX_BACKOFF = 30
+
+# Statuses meaning the host is struggling, worth sending again later.
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+class HostLimiter(object):
+    '''The token bucket, concurrency limit and latency of a single host.'''
+
+    def __init__(self, rate=RATE, burst=BURST, initial=INITIAL_CONCURRENCY, minimum=MIN_CONCURRENCY, maximum=MAX_CONCURRENCY):
+        self.rate = rate
+        self.burst = burst
+        self.minimum = minimum
+        self.maximum = maximum
+        self.condition = threading.Condition()
+
+        self.tokens = float(burst or 0)
+        self.updated = time.time()
+
+        self.limit = float(initial)
+        self.active = 0
+
+        # Average latency, the fastest average so far, and when the limit last went down.
+        self.latency = None
+        self.baseline = None
+        self.decreased = 0
+
+        self.stats = {'requests': 0, 'retries': 0, 'overloaded': 0, 'decreases': 0}
+
+    def acquire(self):
+        '''Waits for a free slot under the concurrency limit, then for a token.'''
+
+        with self.condition:
+            while self.active >= int(self.limit):
+                self.condition.wait()
+
+            self.active += 1
+            self.stats['requests'] += 1
+
+            while self.rate:
+                now = time.time()
+                self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    break
+
+                self.condition.wait((1 - self.tokens) / self.rate)
+
+    def release(self, latency=None, overloaded=False):
+        '''Frees the slot and adjusts the limit: down if the host was overloaded or is slowing
+           down, at most once per average latency, otherwise up.'''
+
+        with self.condition:
+            self.active -= 1
+            now = time.time()
+
+            if latency is not None:
+                self.latency = latency if self.latency is None else (1 - SMOOTHING) * self.latency + SMOOTHING * latency
+                self.baseline = self.latency if self.baseline is None else min(self.baseline, self.latency)
+
+            slow = latency is not None and self.latency > max(self.baseline * LATENCY_TOLERANCE, self.baseline + LATENCY_SLACK)
+
+            if overloaded:
+                self.stats['overloaded'] += 1
+
+            if overloaded or slow:
+                if now - self.decreased > (self.latency or 0):
+                    self.limit = max(self.minimum, self.limit * DECREASE)
+                    self.decreased = now
+                    self.stats['decreases'] += 1
+            else:
+                self.limit = min(self.maximum, self.limit + INCREASE / self.limit)
+
+            self.condition.notify_all()
+
+
+class Controller(object):
+    '''Sends requests through the HostLimiter of their host, retrying connection errors, timeouts
+       and RETRY_STATUSES. Shared by every session of httpcache.session().
+
+       response = controller.send(url, lambda: adapter.send(request))'''
+
+    def __init__(self, retries=RETRIES, backoff=BACKOFF, max_backoff=MAX_BACKOFF, **limits):
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.limits = limits
+        self.hosts = {}
+        self.lock = threading.Lock()
+
+    def host(self, url):
+        '''The HostLimiter of a url's host, made the first time it's needed.'''
+
+        host = urlparse(url).netloc
+
+        with self.lock:
+            if host not in self.hosts:
+                self.hosts[host] = HostLimiter(**self.limits)
+
+            return self.hosts[host]
+
+    def configure(self, host, **limits):
+        '''Sets the limits of a single host, ex: configure('act.ucsd.edu', rate=5, maximum=4).'''
+
+        with self.lock:
+            self.hosts[host] = HostLimiter(**dict(self.limits, **limits))
+
+    def delay(self, attempt, response=None):
+        '''Seconds to wait before a retry: what Retry-After asks for, or a random time up to the
+           exponential backoff so threads that failed together don't retry together.'''
+
+        retry_after = response.headers.get('Retry-After', '') if response is not None else ''
+
+        if retry_after.isdigit():
+            return min(self.max_backoff, int(retry_after))
+
+        return random.uniform(0, min(self.max_backoff, self.backoff * 2 ** attempt))
+
+    def send(self, url, function):
+        '''Calls function, which sends a request to url and returns the response, whenever the
+           host allows. Returns the last response even if the host kept failing; raises the last
+           error if it never answered.'''
+
+        limiter = self.host(url)
+
+        for attempt in range(self.retries + 1):
+            limiter.acquire()
+            start = time.time()
+
+            try:
+                response = function()
+
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+                limiter.release(overloaded=True)
+                response, error = None, e
+
+            else:
+                overloaded = response.status_code in RETRY_STATUSES
+                limiter.release(time.time() - start, overloaded)
+
+                if not overloaded or attempt == self.retries:
+                    return response
+
+            if attempt == self.retries:
+                raise error
+
+            with limiter.condition:
+                limiter.stats['retries'] += 1
+
+            wait = self.delay(attempt, response)
+
+            if response is not None:
+                response.close()
+
+            time.sleep(wait)
+
+    def report(self):
+        '''One line summary per host.'''
+
+        return "\n".join("  - {}: {requests} requests, {retries} retries, {overloaded} overloaded, concurrency {limit:.1f}".format(
+            host, limit=limiter.limit, **limiter.stats) for host, limiter in sorted(self.hosts.items()))
+
+
+class ControlledAdapter(HTTPAdapter):
+    '''Sends every request of a session through a Controller, or the shared CONTROLLER, for
+       sessions that don't go through the http cache, ex: upload.BulkWriter's.'''
+
+    def __init__(self, request_controller=None, *args, **kwargs):
+        super(ControlledAdapter, self).__init__(*args, **kwargs)
+        self.controller = request_controller or CONTROLLER
+
+    def send(self, request, **kwargs):
+        return self.controller.send(request.url, lambda: super(ControlledAdapter, self).send(request, **kwargs))
+
+
+# Shared by every session from httpcache.session() and by upload.BulkWriter.
+CONTROLLER = Controller()
@@ -0,0 +1,64 @@
+'''Writes and reads the prepared classes one per line (NDJSON), so a quarter is never held as
+   one big json string. Files ending in .gz are gzipped. Created by Aykan Fonseca.'''
+
+# Builtins
+import gzip
+import json
+import os
+
+
+def open_file(path, mode, gzipped=None):
+    '''Opens path in binary mode, through gzip if gzipped or, by default, if it ends in .gz.'''
+
+    if path.endswith('.gz') if gzipped is None else gzipped:
+        return gzip.open(path, mode + 'b')
+
+    return open(path, mode + 'b')
+
+
+def dump(courses, path):
+    '''Writes (code, class) pairs as they come, one class per line, and returns how many were
+       written. Written to a new file first so readers never see half an export.'''
+
+    count = 0
+
+    with open_file(path + '.tmp', 'w', path.endswith('.gz')) as file:
+        for _, course in courses:
+            file.write((json.dumps(course) + '\n').encode('utf_8'))
+            count += 1
+
+    os.rename(path + '.tmp', path)
+
+    return count
+
+
+def load(path):
+    '''Yields the (code, class) pairs of a file written by dump, one line at a time.'''
+
+    with open_file(path, 'r') as file:
+        for line in file:
+            if line.strip():
+                course = json.loads(line.decode('utf_8'))
+
+                yield course['code'], course
+
+
+def merge(courses, path, drop=None):
+    '''Writes (code, class) pairs into the file at path, written by dump: a class already in it is
+       replaced, and the others are kept unless drop(code) is true. Classes new to the file go
+       at the end. Returns how many classes the file has now.'''
+
+    courses = dict(courses)
+
+    def merged():
+        if os.path.exists(path):
+            for code, course in load(path):
+                if code in courses:
+                    yield code, courses.pop(code)
+                elif drop is None or not drop(code):
+                    yield code, course
+
+        for code, course in sorted(courses.items()):
+            yield code, course
+
+    return dump(merged(), path)
@@ -0,0 +1,458 @@
+'''Offline fixtures for the Schedule of Classes scraper. Records result pages to disk and serves
+   them back, along with a stand-in for the firebase REST api. Created by Aykan Fonseca.'''
+
+# Builtins
+import hashlib
+import json
+import os
+import random
+import shutil
+import ssl
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+try:
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from socketserver import ThreadingMixIn
+    from urllib.parse import unquote, urlparse, parse_qs
+except ImportError:
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+    from SocketServer import ThreadingMixIn
+    from urllib import unquote
+    from urlparse import urlparse, parse_qs
+
+# Scraper being recorded.
+import soc
+
+# Where the corpus lives unless told otherwise.
+FIXTURES_DIR = 'fixtures'
+
+# Path of SOC_URL on the stand-in server.
+SOC_PATH = '/scheduleOfClasses/scheduleOfClassesStudentResult.htm'
+
+# Made up values used by synthesize.
+FAKE_DEPARTMENTS = [('Anthropology', 'ANTH'), ('Computer Science & Engineering', 'CSE'), ('Mathematics', 'MATH'),
+                    ('Literature/English', 'LTEN'), ('Biology/Ecology, Behavior, & Evolution', 'BIEB'), ('Physics', 'PHYS')]
+FAKE_NAMES = [u'Gillespie, Gary', u'Ord, Rick', u'N\xfa\xf1ez, Jos\xe9', u'Politz, Joseph Gibbs', u'Staff',
+              u'Alvarado, Christine J.', u'Smith, Anne', u'Li, Wei']
+FAKE_BUILDINGS = ['CENTR', 'WLH', 'PCYNH', 'CSB', 'YORK', 'RCLAS', 'SOLIS', 'LEDDN']
+FAKE_DAYS = ['MWF', 'TuTh', 'M', 'W', 'F', 'MW', 'Th', 'Tu', 'S', 'MTuWThF']
+FAKE_TIMES = ['8:00a-8:50a', '9:00a-9:50a', '11:00a-12:20p', '12:30p-1:50p', '2:00p-2:50p', '5:00p-7:50p', '11:30a-2:29p']
+FAKE_RESTRICTIONS = ['', '', 'UD', 'LD', 'D', 'N O', 'FR XSR']
+
+# Every how many pages synthesize leaves out the charset of a page.
+CHARSETLESS_EVERY = 3
+
+
+def page_path(directory, page):
+    '''Path of a saved results page.'''
+
+    return os.path.join(directory, str(page) + '.html')
+
+
+def record(directory=FIXTURES_DIR):
+    '''Saves every results page of the current quarter to disk exactly as it was received.'''
+
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+
+    context = soc.setup()
+
+    with open(os.path.join(directory, 'quarters.html'), 'wb') as file:
+        file.write(soc.SESSION.get(soc.SOC_URL, stream=True).content)
+
+    for url, page in context.url_page_tuple():
+        with open(page_path(directory, page), 'wb') as file:
+            file.write(soc.fetch_page(url, context.session))
+
+        print("Recorded Page {} of {}".format(page, context.number_pages))
+
+    return context.term
+
+
+def _row(row_class, cells):
+    '''A table row of the results page.'''
+
+    return u'<tr class="%s">%s</tr>' % (row_class, u'\n'.join(u'<td>%s</td>' % c for c in cells))
+
+
+def _section_row(rng, section_id, meeting_type, number):
+    '''A section row: id, type, number, days, time, building, room, teacher and seats.'''
+
+    cells = [section_id, meeting_type, number]
+
+    # Sections to be announced list one TBA for the days and time, and another for the location.
+    if rng.random() < 0.08:
+        cells += ['TBA', 'TBA']
+    else:
+        cells += [rng.choice(FAKE_DAYS), rng.choice(FAKE_TIMES), rng.choice(FAKE_BUILDINGS), str(rng.randint(1, 400))]
+
+    name = rng.choice(FAKE_NAMES)
+
+    if name == 'Staff':
+        cells.append(name)
+    else:
+        email = name.partition(',')[0].lower().encode('ascii', 'ignore').decode('ascii') + '@ucsd.edu'
+        cells.append(u'<a href="mailto:%s">%s</a>' % (email, name))
+
+    seats = rng.random()
+
+    if seats < 0.1:
+        cells += [u'<span>FULL Waitlist(%d)</span>' % rng.randint(1, 40), str(rng.randint(20, 300))]
+    elif seats < 0.15:
+        cells.append(u'Unlim')
+    elif seats > 0.2:
+        cells += [str(rng.randint(0, 100)), str(rng.randint(100, 300))]
+
+    return _row('sectxt', cells)
+
+
+def _course_rows(rng, ids):
+    '''The header, sections and exams of a single made up course.'''
+
+    number = str(rng.randint(1, 299)) + rng.choice(['', '', 'A', 'B', 'L'])
+
+    rows = [u'<tr><td class="crsheader">%s</td>\n<td class="crsheader">%s</td>\n<td class="crsheader">'
+            u'<span class="boldtxt">Course %s Title</span> ( %s Units)</td>\n<td><a>Prereq</a></td></tr>'
+            % (rng.choice(FAKE_RESTRICTIONS), number, number, rng.choice(['4', '2', '1-4']))]
+
+    for letter in 'AB'[:rng.randint(1, 2)]:
+        # Either a lecture with enrollable discussions / labs or just an enrollable lecture.
+        if rng.random() < 0.7:
+            rows.append(_section_row(rng, '', 'LE', letter + '00'))
+
+            for number in range(1, rng.randint(2, 5)):
+                rows.append(_section_row(rng, str(next(ids)), rng.choice(['DI', 'LA']), '%s%02d' % (letter, number)))
+        else:
+            rows.append(_section_row(rng, str(next(ids)), 'LE', letter + '00'))
+
+        if rng.random() < 0.2:
+            rows.append(_row('nonenrtxt', ['MI', '10/30/2019', 'W', rng.choice(FAKE_TIMES), rng.choice(FAKE_BUILDINGS), '101']))
+
+        if rng.random() < 0.9:
+            exam = ['FI', '12/14/2019', rng.choice(['S', 'M', 'Tu', 'Th']), rng.choice(FAKE_TIMES + ['TBA'])]
+
+            if rng.random() < 0.8:
+                exam += [rng.choice(FAKE_BUILDINGS), '101']
+
+            rows.append(_row('nonenrtxt', exam))
+
+    if rng.random() < 0.05:
+        rows.append(_row('sectxt', [str(next(ids)), 'LE', 'C00', 'Cancelled']))
+
+    return rows
+
+
+def _write_pages(directory, rows, rows_per_page):
+    '''Splits rows into numbered results pages. Returns how many were written.'''
+
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+
+    pages = max(1, (len(rows) + rows_per_page - 1) // rows_per_page)
+
+    for page in range(1, pages + 1):
+        body = u''.join(rows[(page - 1) * rows_per_page:page * rows_per_page])
+        # Some pages don't declare their charset, like some served by the real site.
+        head = u'' if page % CHARSETLESS_EVERY == 0 else u'<meta charset="utf-8">'
+        html = (u'<html><head>%s</head><body><table>%s</table>\n'
+                u'<td>Page&nbsp;(%d&nbsp;of&nbsp;%d)</td></body></html>' % (head, body, page, pages))
+
+        with open(page_path(directory, page), 'wb') as file:
+            file.write(html.encode('utf-8'))
+
+    return pages
+
+
+def synthesize(directory=FIXTURES_DIR, pages=400, rows_per_page=120, seed=0):
+    '''Writes a made up but realistically shaped quarter when a recorded one isn't available.
+       The same seed always gives the same corpus. Courses are split across page boundaries.
+       Each department's classes are also written on their own, to a folder named after it,
+       for searches of a single subject.'''
+
+    rng = random.Random(seed)
+    ids = iter(range(100000, 999999))
+    rows = []
+    by_department = {}
+    department = None
+
+    while len(rows) < pages * rows_per_page:
+        if department is None or rng.random() < 0.03:
+            department = rng.choice(FAKE_DEPARTMENTS)
+            header = u'<tr><td colspan="13"><h2>%s (%s)</h2></td></tr>' % (department[0].replace('&', '&amp;'), department[1])
+
+            rows.append(header)
+            by_department.setdefault(department[1], [header])
+
+        course = _course_rows(rng, ids)
+        rows.extend(course)
+        by_department[department[1]].extend(course)
+
+    _write_pages(directory, rows[:pages * rows_per_page], rows_per_page)
+
+    for code, department_rows in by_department.items():
+        _write_pages(os.path.join(directory, code), department_rows, rows_per_page)
+
+    with open(os.path.join(directory, 'quarters.html'), 'wb') as file:
+        # Dated this year so get_quarters doesn't filter it out.
+        file.write('<html><body><select><option value="FA{0}">Fall 20{0}</option></select></body></html>'
+                   .format(time.strftime('%y')).encode('utf-8'))
+
+
+def count_pages(directory):
+    '''Number of results pages saved in the corpus.'''
+
+    page = 0
+    while os.path.exists(page_path(directory, page + 1)):
+        page += 1
+
+    return page
+
+
+class FirebaseTree(object):
+    '''In memory version of a firebase database. Paths are slash separated like the REST api.'''
+
+    def __init__(self, data=None):
+        self.root = data if data is not None else {}
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def split(path):
+        return [unquote(part) for part in path.strip('/').split('/') if part]
+
+    def get(self, path):
+        node = self.root
+
+        for part in self.split(path):
+            if not isinstance(node, dict) or part not in node:
+                return None
+            node = node[part]
+
+        return node
+
+    def put(self, path, value):
+        parts = self.split(path)
+
+        with self.lock:
+            if not parts:
+                self.root = value if isinstance(value, dict) else {}
+                return
+
+            node = self.root
+            for part in parts[:-1]:
+                if not isinstance(node.get(part), dict):
+                    node[part] = {}
+                node = node[part]
+
+            # Like firebase, writing null removes the node.
+            if value is None:
+                node.pop(parts[-1], None)
+            else:
+                node[parts[-1]] = value
+
+    def patch(self, path, updates):
+        for key, value in updates.items():
+            self.put(path.rstrip('/') + '/' + key, value)
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    '''Serves the corpus under the SOC_URL?page= scheme and everything ending in .json as firebase.'''
+
+    # Silence the default logging of each request.
+    def log_message(self, *args):
+        pass
+
+    def respond(self, body, content_type='text/html', cookie=None, etag=None):
+        # Unchanged since the copy the client has, so send nothing.
+        if etag is not None and self.headers.get('If-None-Match') == etag:
+            self.send_response(304)
+            self.send_header('ETag', etag)
+            self.end_headers()
+            return
+
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        if etag is not None:
+            self.send_header('ETag', etag)
+        if cookie is not None:
+            self.send_header('Set-Cookie', 'search={}; Path=/'.format(cookie))
+        self.end_headers()
+        self.wfile.write(body)
+
+        with self.server.lock:
+            self.server.bytes_sent += len(body)
+
+    def read_body(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        body = self.rfile.read(length) if length else b''
+        self.server.count(self.command, len(body))
+
+        return body
+
+    def search_directory(self):
+        '''The folder of the subject last searched for by this client, like the session of the real site.'''
+
+        for cookie in (self.headers.get('Cookie') or '').split(';'):
+            name, _, value = cookie.strip().partition('=')
+
+            if name == 'search' and value:
+                return os.path.join(self.server.directory, value)
+
+        return self.server.directory
+
+    def handle_page(self, page, directory=None, cookie=None):
+        directory = directory or self.search_directory()
+        path = page_path(directory, page) if page else os.path.join(self.server.directory, 'quarters.html')
+
+        if not os.path.exists(path):
+            self.send_error(404)
+            return
+
+        # Pretend to be a slow upstream if asked to.
+        if self.server.delay:
+            time.sleep(self.server.delay)
+
+        with open(path, 'rb') as file:
+            body = file.read()
+
+        # Pages can be revalidated like on a server that sends ETags.
+        self.respond(body, cookie=cookie, etag='"{}"'.format(hashlib.sha1(body).hexdigest()))
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        self.read_body()
+
+        if url.path.endswith('.json'):
+            node = self.server.firebase.get(url.path[:-len('.json')])
+            self.respond(json.dumps(node).encode('utf-8'), 'application/json')
+        elif url.path == SOC_PATH:
+            self.handle_page(parse_qs(url.query).get('page', [''])[0])
+        else:
+            self.send_error(404)
+
+    def do_POST(self):
+        form = parse_qs(self.read_body().decode('utf-8'))
+        subjects = form.get('selectedSubjects', [])
+
+        # A search for a single subject only sees that subject's classes, if the corpus has them.
+        search = ''
+        if len(subjects) == 1 and os.path.isdir(os.path.join(self.server.directory, subjects[0])):
+            search = subjects[0]
+
+        # Submitting the search form always lands on the first page.
+        self.handle_page('1', os.path.join(self.server.directory, search), cookie=search)
+
+    def do_PUT(self):
+        value = json.loads(self.read_body().decode('utf-8'))
+        self.server.firebase.put(urlparse(self.path).path[:-len('.json')], value)
+        self.respond(json.dumps(value).encode('utf-8'), 'application/json')
+
+    def do_PATCH(self):
+        value = json.loads(self.read_body().decode('utf-8'))
+        self.server.firebase.patch(urlparse(self.path).path[:-len('.json')], value)
+        self.respond(json.dumps(value).encode('utf-8'), 'application/json')
+
+    def do_DELETE(self):
+        self.read_body()
+        self.server.firebase.put(urlparse(self.path).path[:-len('.json')], None)
+        self.respond(b'null', 'application/json')
+
+
+def make_certificate(directory):
+    '''Makes a throwaway self signed certificate for localhost with openssl. Returns its path.'''
+
+    key = os.path.join(directory, 'key.pem')
+    cert = os.path.join(directory, 'cert.pem')
+
+    subprocess.check_call(['openssl', 'req', '-x509', '-newkey', 'rsa:2048', '-nodes', '-days', '1',
+                           '-keyout', key, '-out', cert, '-subj', '/CN=localhost',
+                           '-addext', 'subjectAltName=DNS:localhost,IP:127.0.0.1'],
+                          stdout=open(os.devnull, 'w'), stderr=subprocess.STDOUT)
+
+    return key, cert
+
+
+class StandInServer(ThreadingMixIn, HTTPServer):
+    '''Local stand-in for act.ucsd.edu and firebase. Counts requests and bytes uploaded.
+       Serves https, as the firebase package refuses anything else.'''
+
+    daemon_threads = True
+
+    def __init__(self, directory=FIXTURES_DIR, port=0, delay=0, firebase_data=None):
+        HTTPServer.__init__(self, ('127.0.0.1', port), StandInHandler)
+
+        self.tls_dir = tempfile.mkdtemp()
+        key, self.cert = make_certificate(self.tls_dir)
+
+        context = ssl.SSLContext(ssl.PROTOCOL_SSLv23)
+        context.load_cert_chain(self.cert, key)
+        self.socket = context.wrap_socket(self.socket, server_side=True)
+
+        self.directory = directory
+        self.delay = delay
+        self.firebase = FirebaseTree(firebase_data)
+        self.requests = {}
+        self.bytes_received = 0
+        self.bytes_sent = 0
+        self.lock = threading.Lock()
+
+    @property
+    def url(self):
+        return 'https://localhost:{}/'.format(self.server_address[1])
+
+    def count(self, method, size):
+        with self.lock:
+            self.requests[method] = self.requests.get(method, 0) + 1
+            self.bytes_received += size
+
+    def start(self):
+        '''Serves requests from a background thread.'''
+
+        thread = threading.Thread(target=self.serve_forever)
+        thread.daemon = True
+        thread.start()
+
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+        shutil.rmtree(self.tls_dir, ignore_errors=True)
+
+
+def point_soc_at(server):
+    '''Points the scraper's urls at the stand-in server instead of act.ucsd.edu and firebase.
+       requests trusts the stand-in's certificate through REQUESTS_CA_BUNDLE.'''
+
+    os.environ['REQUESTS_CA_BUNDLE'] = server.cert
+    soc.SOC_URL = server.url + SOC_PATH.lstrip('/') + '?page='
+    soc.FIREBASE_DB = server.url
+
+
+def main():
+    '''The main function.'''
+    print(sys.version)
+
+    command = sys.argv[1] if len(sys.argv) > 1 else 'serve'
+    directory = sys.argv[2] if len(sys.argv) > 2 else FIXTURES_DIR
+
+    if command == 'record':
+        print("Recorded {}".format(record(directory)))
+
+    elif command == 'synthesize':
+        synthesize(directory)
+        print("Synthesized {} pages into {}".format(count_pages(directory), directory))
+
+    else:
+        server = StandInServer(directory, port=8000)
+        print("Serving {} pages from {} at {}".format(count_pages(directory), directory, server.url + SOC_PATH.lstrip('/') + '?page='))
+        print("Trust it with REQUESTS_CA_BUNDLE={}".format(server.cert))
+        server.serve_forever()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,291 @@
+'''HTTP cache on disk shared by every scraper, so pages that haven't changed since the last run
+   aren't downloaded again. Created by Aykan Fonseca.'''
+
+# Builtins
+import calendar
+import email.utils
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+
+# Pip install packages.
+import requests
+from requests.adapters import HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+from requests.utils import get_encoding_from_headers
+
+# Our modules.
+import controller
+
+# Where responses are kept, and the most bytes kept there before the least recently used go.
+CACHE_DIR = '.httpcache'
+MAX_BYTES = 256 * 1024 * 1024
+
+# Headers that describe the transfer rather than the page, so aren't kept.
+SKIPPED_HEADERS = {'connection', 'content-encoding', 'content-length', 'keep-alive', 'set-cookie', 'transfer-encoding'}
+
+MAX_AGE_REGEX = re.compile(r'max-age=(\d+)')
+
+# Names what else a page depends on besides its url, ex: the search posted before it. Requests
+# carrying it are cached under their url and it. It is never sent.
+CACHE_KEY_HEADER = 'X-Cache-Key'
+
+
+def freshness(headers):
+    '''Seconds a response may be used without asking the server again, from Cache-Control or Expires.'''
+
+    cache_control = headers.get('Cache-Control', '').lower()
+
+    if 'no-cache' in cache_control or 'no-store' in cache_control:
+        return 0
+
+    match = MAX_AGE_REGEX.search(cache_control)
+    if match:
+        return int(match.group(1))
+
+    expires = email.utils.parsedate(headers.get('Expires', ''))
+    if expires:
+        return max(0, calendar.timegm(expires) - time.time())
+
+    return 0
+
+
+class DiskCache(object):
+    '''Responses kept one per file, named by the hash of their url. A file is a line of json with
+       the url, headers and when it was stored, followed by the body. The least recently used files
+       are removed once they take more than max_bytes. Safe to share between threads.'''
+
+    def __init__(self, directory=CACHE_DIR, max_bytes=MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+
+        # Name of each file -> its size, least recently used first.
+        self.index = OrderedDict()
+        self.size = 0
+
+        self.stats = {'hits': 0, 'revalidated': 0, 'misses': 0, 'bytes downloaded': 0, 'bytes saved': 0}
+
+        files = []
+        for name in os.listdir(directory) if os.path.isdir(directory) else []:
+            path = os.path.join(directory, name)
+
+            if not name.endswith('.tmp'):
+                stat = os.stat(path)
+                files.append((stat.st_mtime, name, stat.st_size))
+
+        for _, name, size in sorted(files):
+            self.index[name] = size
+            self.size += size
+
+    def path(self, name):
+        return os.path.join(self.directory, name)
+
+    @staticmethod
+    def name(url):
+        return hashlib.sha1(url.encode('utf_8')).hexdigest()
+
+    def get(self, url):
+        '''The entry stored for url: a dictionary of its url, headers, stored time and body. Or None.'''
+
+        name = self.name(url)
+
+        try:
+            with open(self.path(name), 'rb') as file:
+                meta, _, body = file.read().partition(b'\n')
+        except (IOError, OSError):
+            return None
+
+        entry = json.loads(meta.decode('utf_8'))
+
+        # Another url with the same hash, as unlikely as that is.
+        if entry['url'] != url:
+            return None
+
+        entry['body'] = body
+        entry['headers'] = CaseInsensitiveDict(entry['headers'])
+
+        return entry
+
+    def put(self, url, headers, body, stored=None):
+        '''Stores a response, then removes the least recently used ones if over max_bytes.'''
+
+        name = self.name(url)
+        headers = dict((key, value) for key, value in headers.items() if key.lower() not in SKIPPED_HEADERS)
+        meta = json.dumps({'url': url, 'headers': headers, 'stored': stored or time.time()}).encode('utf_8')
+
+        if not os.path.isdir(self.directory):
+            try:
+                os.makedirs(self.directory)
+            except OSError:
+                pass
+
+        # Written to a new file first so no one ever reads half a response.
+        temp = self.path(name + '.{}.tmp'.format(threading.current_thread().ident))
+        with open(temp, 'wb') as file:
+            file.write(meta + b'\n' + body)
+
+        with self.lock:
+            os.rename(temp, self.path(name))
+
+            self.size += len(meta) + 1 + len(body) - self.index.pop(name, 0)
+            self.index[name] = len(meta) + 1 + len(body)
+
+            while self.size > self.max_bytes and len(self.index) > 1:
+                oldest, size = self.index.popitem(last=False)
+                self.size -= size
+
+                try:
+                    os.remove(self.path(oldest))
+                except OSError:
+                    pass
+
+    def touch(self, url):
+        '''Marks an entry as just used.'''
+
+        name = self.name(url)
+
+        with self.lock:
+            if name in self.index:
+                self.index[name] = self.index.pop(name)
+
+                try:
+                    os.utime(self.path(name), None)
+                except OSError:
+                    pass
+
+    def count(self, stat, size=0):
+        with self.lock:
+            self.stats[stat] += 1
+            self.stats['bytes downloaded' if stat == 'misses' else 'bytes saved'] += size
+
+    def report(self):
+        '''One line summary of the stats.'''
+
+        return "{hits} hits, {revalidated} revalidated, {misses} misses, {downloaded} KiB downloaded, {saved} KiB saved".format(
+            downloaded=self.stats['bytes downloaded'] // 1024, saved=self.stats['bytes saved'] // 1024, **self.stats)
+
+
+class CachingAdapter(HTTPAdapter):
+    '''Answers GET requests from a DiskCache. Responses still fresh by Cache-Control or Expires are
+       used without a request, unless cookies are sent as the page may depend on them. Anything
+       else is revalidated with If-None-Match / If-Modified-Since and used on a 304. Responses with
+       an ETag, Last-Modified or a freshness lifetime are stored. Responses from the cache have
+       from_cache set to 'hit' or 'revalidated'. Requests with a CACHE_KEY_HEADER are stored
+       under it as well as their url. Requests that reach the network go through
+       controller, a controller.Controller, which paces and retries them.'''
+
+    def __init__(self, cache, controller=None, *args, **kwargs):
+        super(CachingAdapter, self).__init__(*args, **kwargs)
+        self.cache = cache
+        self.controller = controller
+
+    def send_network(self, request, **kwargs):
+        '''Sends a request to the network, through the controller if there is one.'''
+
+        send = lambda: super(CachingAdapter, self).send(request, **kwargs)
+
+        if self.controller is None:
+            return send()
+
+        return self.controller.send(request.url, send)
+
+    def send(self, request, **kwargs):
+        key = request.headers.pop(CACHE_KEY_HEADER, None)
+
+        if request.method != 'GET':
+            return self.send_network(request, **kwargs)
+
+        # Pages of different searches share their url, so they are told apart by the key.
+        url = request.url if key is None else '{} {}'.format(request.url, key)
+        entry = self.cache.get(url)
+
+        if entry is not None:
+            headers = entry['headers']
+
+            if 'Cookie' not in request.headers and time.time() < entry['stored'] + freshness(headers):
+                self.cache.touch(url)
+                self.cache.count('hits', len(entry['body']))
+
+                return self.build_cached(request, entry)
+
+            if 'ETag' in headers:
+                request.headers['If-None-Match'] = headers['ETag']
+            if 'Last-Modified' in headers:
+                request.headers['If-Modified-Since'] = headers['Last-Modified']
+
+        response = self.send_network(request, **kwargs)
+
+        if response.status_code == 304 and entry is not None:
+            # Unchanged, so the stored body stands in for the empty one. Stored again for new headers.
+            entry['headers'].update(response.headers)
+            self.cache.put(url, entry['headers'], entry['body'])
+            self.cache.count('revalidated', len(entry['body']))
+
+            response.status_code = 200
+            response.reason = 'OK'
+            response.headers = entry['headers']
+            response.encoding = get_encoding_from_headers(entry['headers'])
+            response._content = entry['body']
+            response._content_consumed = True
+            response.from_cache = 'revalidated'
+
+            return response
+
+        if response.status_code == 200 and self.cacheable(response.headers):
+            self.cache.put(url, response.headers, response.content)
+
+        self.cache.count('misses', len(response.content))
+
+        return response
+
+    @staticmethod
+    def cacheable(headers):
+        if 'no-store' in headers.get('Cache-Control', '').lower():
+            return False
+
+        return 'ETag' in headers or 'Last-Modified' in headers or freshness(headers) > 0
+
+    def build_cached(self, request, entry):
+        '''A response made from a cache entry alone.'''
+
+        response = requests.models.Response()
+        response.status_code = 200
+        response.reason = 'OK'
+        response.headers = CaseInsensitiveDict(entry['headers'])
+        response.encoding = get_encoding_from_headers(response.headers)
+        response.url = request.url
+        response.request = request
+        response.connection = self
+        response._content = entry['body']
+        response._content_consumed = True
+        response.from_cache = 'hit'
+
+        return response
+
+
+# Shared by every session from session(), created the first time it's needed.
+CACHE = None
+
+
+def session(cache=None, request_controller=None):
+    '''A requests session that goes through cache, or the shared DiskCache in CACHE_DIR, and
+       request_controller, or the shared controller.CONTROLLER.'''
+
+    global CACHE
+
+    if cache is None:
+        if CACHE is None:
+            CACHE = DiskCache()
+        cache = CACHE
+
+    s = requests.Session()
+    adapter = CachingAdapter(cache, request_controller or controller.CONTROLLER)
+    s.mount('http://', adapter)
+    s.mount('https://', adapter)
+
+    return s
@@ -0,0 +1,204 @@
+'''Keeps every instructor seen across quarters: their name, the spellings it has been listed
+   under, their emails and the classes they taught each quarter. Kept in a file and updated by
+   every scrape, so looking up an instructor by name or email never means reading a quarter
+   again. Created by Aykan Fonseca.'''
+
+# Builtins
+import json
+import os
+import threading
+import unicodedata
+
+# Where the registry is kept.
+REGISTRY_PATH = 'instructors.json'
+
+# Names listed for sections without an instructor.
+NOT_INSTRUCTORS = ("", "Staff", "Blank")
+
+# Held while the registry file is read, updated and written, as quarters can be scraped at once.
+LOCK = threading.Lock()
+
+
+def text(name):
+    '''A name as unicode. Names parsed from the Schedule of Classes are utf-8 bytes in Python 2.'''
+
+    return name.decode('utf_8') if isinstance(name, bytes) else name
+
+
+def normalize(name):
+    '''The form names are looked up by: no accents, periods, case or extra spaces. Ex:
+       'Smith,  Anne M.' -> 'smith, anne m'.'''
+
+    name = ''.join(x for x in unicodedata.normalize('NFKD', text(name)) if not unicodedata.combining(x))
+
+    return ' '.join(name.replace('.', '').split()).lower()
+
+
+def normalize_email(email):
+    return email.strip().lower()
+
+
+class Registry(object):
+    '''Instructors by their normalized name. Each has the name it was last listed under, every
+       spelling seen (aliases), their emails, and for each quarter the classes they taught,
+       code -> whether they lead a section group, ex: lecture A00 rather than a discussion,
+       and the spelling each of those classes listed them under (names).
+
+       Any spelling of a name, and any email, leads to the instructor through a dict, so
+       lookups take the same time however many quarters are kept. A name never seen before
+       listed with the email of a known instructor becomes an alias of theirs.
+
+       registry = Registry.load()
+       registry.get('Gillespie, Gary')['quarters']['FA19']'''
+
+    def __init__(self, instructors=None):
+        self.instructors = instructors or {}
+
+        # Normalized spelling -> instructor, and email -> instructor.
+        self.names = {}
+        self.emails = {}
+
+        for key, instructor in self.instructors.items():
+            self.names[key] = key
+
+            for alias in instructor['aliases']:
+                self.names.setdefault(normalize(alias), key)
+
+            for email in instructor['emails']:
+                self.emails.setdefault(email, key)
+
+    def __len__(self):
+        return len(self.instructors)
+
+    def __contains__(self, name):
+        return normalize(name) in self.names
+
+    def get(self, name, default=None):
+        '''The instructor listed under any spelling of name, or default.'''
+
+        key = self.names.get(normalize(name))
+
+        return self.instructors[key] if key is not None else default
+
+    def add(self, name, email=None):
+        '''Registers a spelling of a name and an email, if known, and returns the instructor.'''
+
+        name = text(name)
+        normalized = normalize(name)
+        email = normalize_email(email) if email else None
+
+        key = self.names.get(normalized)
+
+        if key is None and email is not None:
+            key = self.emails.get(email)
+
+        if key is None:
+            key = normalized
+            self.instructors[key] = {'name': name, 'aliases': [], 'emails': [], 'quarters': {}}
+
+        self.names[normalized] = key
+        instructor = self.instructors[key]
+        instructor['name'] = name
+
+        if name not in instructor['aliases']:
+            instructor['aliases'].append(name)
+
+        if email is not None and email not in instructor['emails']:
+            instructor['emails'].append(email)
+            self.emails.setdefault(email, key)
+
+        return instructor
+
+    def update(self, quarter, courses, teacher_email_mapping, replace=False):
+        '''Adds the instructors of sections.Course records of a quarter and the classes they
+           taught. The classes listed replace what the quarter had for them, so a subject can
+           be scraped again alone. With replace, everything the quarter had is dropped first,
+           for a scrape of the whole quarter.'''
+
+        # Emails by normalized name, as the mapping may spell a name differently than its sections.
+        emails = dict((normalize(name), email) for name, email in teacher_email_mapping.items())
+
+        # Name -> code -> whether they lead one of its section groups.
+        taught = {}
+        codes = set()
+
+        for course in courses:
+            code = '{} {}'.format(course.department, course.number)
+            codes.add(code)
+
+            for index, section in enumerate(course.sections):
+                if section.name is not None and section.name not in NOT_INSTRUCTORS:
+                    listed = taught.setdefault(section.name, {})
+                    listed[code] = listed.get(code, False) or index == 0
+
+        for instructor in self.instructors.values():
+            listed = instructor['quarters'].get(quarter)
+
+            if listed is None:
+                continue
+
+            names = instructor.setdefault('names', {}).get(quarter, {})
+
+            if not replace:
+                for code in [code for code in listed if code in codes]:
+                    del listed[code]
+                    names.pop(code, None)
+
+            if replace or not listed:
+                del instructor['quarters'][quarter]
+                instructor['names'].pop(quarter, None)
+
+        for name, listed in taught.items():
+            instructor = self.add(name, emails.get(normalize(name)))
+            quarter_listed = instructor['quarters'].setdefault(quarter, {})
+            quarter_names = instructor.setdefault('names', {}).setdefault(quarter, {})
+
+            for code, lead in listed.items():
+                quarter_listed[code] = quarter_listed.get(code, False) or lead
+
+                # The spelling firebase has for the class, that of a section group it leads if any.
+                if lead or code not in quarter_names:
+                    quarter_names[code] = text(name)
+
+    def course_teachers(self, quarter, leads=True):
+        '''Class code -> the names of its instructors in a quarter, only those leading a section
+           group unless leads is False. What cape.py looks up CAPEs for. Each name is spelled as
+           the class listed it that quarter, as firebase has it, not as last seen.'''
+
+        teachers = {}
+
+        for instructor in self.instructors.values():
+            names = instructor.get('names', {}).get(quarter, {})
+
+            for code, lead in instructor['quarters'].get(quarter, {}).items():
+                if lead or not leads:
+                    teachers.setdefault(code, set()).add(names.get(code, instructor['name']))
+
+        return teachers
+
+    def save(self, path=REGISTRY_PATH):
+        with open(path + '.tmp', 'w') as file:
+            json.dump(self.instructors, file, sort_keys=True)
+
+        os.rename(path + '.tmp', path)
+
+    @classmethod
+    def load(cls, path=REGISTRY_PATH):
+        '''The registry kept at path, or an empty one.'''
+
+        if not os.path.exists(path):
+            return cls()
+
+        with open(path) as file:
+            return cls(json.load(file))
+
+
+def record(quarter, courses, teacher_email_mapping, replace=False, path=REGISTRY_PATH):
+    '''Updates the registry file with a scrape of a quarter. See Registry.update.'''
+
+    with LOCK:
+        registry = Registry.load(path)
+        registry.update(quarter, courses, teacher_email_mapping, replace)
+        registry.save(path)
+
+    return registry
@@ -0,0 +1,218 @@
+'''Measures where a scraper run spends its time: wall time per stage, http requests, bytes
+   and latencies, pages and records per second, parse errors and firebase writes. Each run is
+   written as a json report and a Prometheus textfile. Created by Aykan Fonseca.'''
+
+# Builtins
+import json
+import os
+import threading
+import time
+from bisect import bisect_left
+from collections import OrderedDict, defaultdict
+from contextlib import contextmanager
+
+# Where reports are written. Point node_exporter's --collector.textfile.directory here.
+METRICS_DIR = 'metrics'
+
+# Upper bounds of the latency histogram buckets, in seconds.
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+# Prefix of every Prometheus metric.
+PREFIX = 'scraper'
+
+
+class Histogram(object):
+    '''Counts of observations at or below each bucket bound, like a Prometheus histogram.'''
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative(self):
+        '''(upper bound, observations at or below it) for every bucket, ending with '+Inf'.'''
+
+        total = 0
+        bounds = [str(x) for x in self.buckets] + ['+Inf']
+
+        for bound, count in zip(bounds, self.counts):
+            total += count
+            yield bound, total
+
+    def to_dict(self):
+        return {'buckets': OrderedDict(self.cumulative()), 'sum': round(self.sum, 6), 'count': self.count}
+
+
+class Metrics(object):
+    '''The measurements of one run of a job, ex: Metrics('soc', {'quarter': 'FA19'}). Safe to
+       share between threads.
+
+       with metrics.stage('prepare'):
+           ...
+       metrics.count('records', len(finished))'''
+
+    def __init__(self, job, labels=None):
+        self.job = job
+        self.labels = OrderedDict(sorted((labels or {}).items()))
+        self.started = time.time()
+        self.lock = threading.Lock()
+
+        # Stage -> seconds, in the order they ran.
+        self.stages = OrderedDict()
+        self.counters = defaultdict(int)
+        self.histograms = defaultdict(Histogram)
+
+    @contextmanager
+    def stage(self, name):
+        '''Adds the wall time of the block to the stage.'''
+
+        start = time.time()
+
+        try:
+            yield
+        finally:
+            with self.lock:
+                self.stages[name] = self.stages.get(name, 0) + time.time() - start
+
+    def count(self, name, amount=1):
+        with self.lock:
+            self.counters[name] += amount
+
+    def observe(self, name, value):
+        with self.lock:
+            self.histograms[name].observe(value)
+
+    def hook(self, response, *args, **kwargs):
+        '''Requests response hook counting requests, bytes and latency. Answers a DiskCache served
+           without a request only count as cache hits.'''
+
+        if getattr(response, 'from_cache', None) == 'hit':
+            self.count('http cache hits')
+            return
+
+        self.count('http requests')
+        self.count('http {}xx'.format(response.status_code // 100))
+        self.observe('http latency seconds', response.elapsed.total_seconds())
+
+        # Revalidated pages came back as a body-less 304.
+        if getattr(response, 'from_cache', None) != 'revalidated':
+            self.count('http bytes received', len(response.content))
+
+    @contextmanager
+    def watch(self, *sessions):
+        '''Measures every response of the sessions during the block.'''
+
+        for session in sessions:
+            session.hooks['response'].append(self.hook)
+
+        try:
+            yield
+        finally:
+            for session in sessions:
+                session.hooks['response'].remove(self.hook)
+
+    def seconds(self):
+        return time.time() - self.started
+
+    def report(self):
+        '''Everything measured so far as a dictionary.'''
+
+        seconds = self.seconds()
+
+        with self.lock:
+            return {
+                'job': self.job,
+                'labels': dict(self.labels),
+                'started': self.started,
+                'seconds': round(seconds, 3),
+                'stages': OrderedDict((name, round(value, 3)) for name, value in self.stages.items()),
+                'counters': dict(self.counters),
+                'rates': {'pages/sec': round(self.counters['pages'] / seconds, 2) if seconds else 0,
+                          'records/sec': round(self.counters['records'] / seconds, 2) if seconds else 0},
+                'histograms': dict((name, histogram.to_dict()) for name, histogram in self.histograms.items())}
+
+    def summary(self):
+        '''One line summary of the run.'''
+
+        report = self.report()
+
+        return "{} in {}s: {} http requests, {} KiB, {} pages/sec, {} records/sec, {} parse errors, {} firebase writes".format(
+            self.job, report['seconds'], report['counters'].get('http requests', 0),
+            report['counters'].get('http bytes received', 0) // 1024, report['rates']['pages/sec'],
+            report['rates']['records/sec'], report['counters'].get('parse errors', 0),
+            report['counters'].get('firebase writes', 0))
+
+    def prometheus(self):
+        '''The report in the Prometheus text exposition format.'''
+
+        report = self.report()
+        lines = []
+
+        def add(name, kind, help_text, samples):
+            lines.append('# HELP {}_{} {}'.format(PREFIX, name, help_text))
+            lines.append('# TYPE {}_{} {}'.format(PREFIX, name, kind))
+
+            for extra, value in samples:
+                lines.append('{}_{}{} {}'.format(PREFIX, name, self.format_labels(extra), value))
+
+        add('run_seconds', 'gauge', 'Wall time of the last run.', [({}, report['seconds'])])
+        add('last_run_timestamp_seconds', 'gauge', 'When the last run started.', [({}, report['started'])])
+        add('stage_seconds', 'gauge', 'Wall time of each stage of the last run.',
+            [({'stage': name}, value) for name, value in report['stages'].items()])
+
+        for name, value in sorted(report['counters'].items()):
+            add(metric_name(name) + '_total', 'counter', name.capitalize() + ' during the last run.', [({}, value)])
+
+        for name, value in sorted(report['rates'].items()):
+            add(metric_name(name.replace('/sec', ' per second')), 'gauge', name.capitalize() + ' over the last run.', [({}, value)])
+
+        for name, histogram in sorted(report['histograms'].items()):
+            name = metric_name(name)
+            samples = [({'le': bound}, count) for bound, count in histogram['buckets'].items()]
+
+            add(name, 'histogram', name.replace('_', ' ').capitalize() + ' during the last run.', [])
+            lines.extend('{}_{}_bucket{} {}'.format(PREFIX, name, self.format_labels(extra), value) for extra, value in samples)
+            lines.append('{}_{}_sum{} {}'.format(PREFIX, name, self.format_labels({}), histogram['sum']))
+            lines.append('{}_{}_count{} {}'.format(PREFIX, name, self.format_labels({}), histogram['count']))
+
+        return '\n'.join(lines) + '\n'
+
+    def format_labels(self, extra):
+        labels = OrderedDict([('job', self.job)])
+        labels.update(self.labels)
+        labels.update(extra)
+
+        return '{' + ','.join('{}="{}"'.format(key, value) for key, value in labels.items()) + '}'
+
+    def write(self, directory=METRICS_DIR):
+        '''Writes the json report and the Prometheus textfile, ex: metrics/soc-FA19.json and
+           metrics/soc-FA19.prom. Each is written to a new file first, as node_exporter may read
+           the textfile at any time. Returns the path of the report.'''
+
+        try:
+            os.makedirs(directory)
+        except OSError:
+            pass
+
+        name = os.path.join(directory, '-'.join([self.job] + list(self.labels.values())))
+
+        for path, content in ((name + '.json', json.dumps(self.report(), indent=2, sort_keys=True)),
+                              (name + '.prom', self.prometheus())):
+            with open(path + '.tmp', 'w') as file:
+                file.write(content)
+
+            os.rename(path + '.tmp', path)
+
+        return name + '.json'
+
+
+def metric_name(name):
+    '''A counter or histogram name as a Prometheus metric name, ex: 'http bytes received' -> 'http_bytes_received'.'''
+
+    return '_'.join(''.join(x if x.isalnum() else ' ' for x in name.lower()).split())
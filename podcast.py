@@ -10,19 +10,24 @@ import sys
 # Pip install packages.
 from bs4 import BeautifulSoup
 from firebase import firebase
-import requests
+
+# Our modules.
+import httpcache
+import metrics
 
 # Used to convert between shortened codes.
 quarter_mapping = {'Fall':'FA', 'Winter':'WI', 'Spring':'SP', 'Summer Med School':'SU', 'Summer Session 1':'S1', 'Summer Session 2':'S2', 'Summer Session 3':'S3', 'Summer':'SA'}
 podcast_url = "https://podcast.ucsd.edu"
 
+SESSION = httpcache.session()
+
 
 def parse_data():
     """ Parses data to upload to firebase."""
 
     print("Parsing data.")
 
-    post = requests.get(podcast_url)
+    post = SESSION.get(podcast_url)
     soup = BeautifulSoup(post.content, 'lxml')
 
     # A list of dictionaries where each list is contains: title of course, professor, authentication, and podcast link.
@@ -49,11 +54,12 @@ def parse_data():
 
 
 def update_db(podcasts, quarter):
-    """ Updates nodes if the node exists."""
+    """ Updates nodes if the node exists. Returns the number of nodes written."""
 
     print("Updating DB with data.")
 
     database = firebase.FirebaseApplication("https://schedule-of-classes-8b222.firebaseio.com/")
+    writes = 0
 
     for item in podcasts:
         # If the podcast is for two courses, just pick the first one. TODO: NEED TO UPDATE.
@@ -65,6 +71,9 @@ def update_db(podcasts, quarter):
         # Updates node when node exists. If not, don't add because we won't use.
         if (database.get(path, None) != None): 
             database.put(path, 'podcast', {'authentication': item['authentication'], 'link': item['link']})
+            writes += 1
+
+    return writes
 
 
 def reset_db():
@@ -88,11 +97,21 @@ def main():
 
     start = time.time()
 
-    podcasts, quarter = parse_data()
+    # Time spent in each stage, requests made and so on, written to metrics.METRICS_DIR at the end.
+    run_metrics = metrics.Metrics('podcast')
+
+    with run_metrics.watch(SESSION), run_metrics.stage('scrape'):
+        podcasts, quarter = parse_data()
+
+    run_metrics.count('pages')
+    run_metrics.count('records', len(podcasts))
 
-    update_db(podcasts, quarter)
+    with run_metrics.stage('upload'):
+        run_metrics.count('firebase writes', update_db(podcasts, quarter))
 
     print("\nTime taken: " + str(time.time() - start))
+    print(run_metrics.summary())
+    print("Metrics written to " + run_metrics.write())
 
 if __name__ == '__main__':
     main()
\ No newline at end of file
@@ -0,0 +1,166 @@
+'''Answers questions about the sections of a quarter, like what a teacher teaches, what meets in
+   a room on Tuesdays or which sections are open after 5pm, from indexes built once instead of
+   scanning every class. Created by Aykan Fonseca.'''
+
+# Builtins
+from bisect import bisect_left, bisect_right
+
+# Pip install packages.
+import numpy
+
+# Our modules.
+import sections
+import table
+
+# Bits of a mask read at once by bit_rows.
+CHUNK = 512
+CHUNK_MASK = (1 << CHUNK) - 1
+
+
+def minutes(value):
+    '''Minutes since midnight from a time like 5:00p, or minutes already.'''
+
+    return value if isinstance(value, int) else sections.parse_clock(value)
+
+
+def is_open(section):
+    '''Whether a section has seats left. Unlimited sections always do.'''
+
+    if section.taken is None or section.available is None:
+        return False
+
+    return section.taken < section.available or section.taken == sections.UNLIMITED
+
+
+def bit_rows(mask):
+    '''The numbers of the bits set in a mask, lowest first. The mask is read CHUNK bits at a
+       time and chunks without any set are skipped, so sparse masks are quick.'''
+
+    rows = []
+    base = 0
+
+    while mask:
+        chunk = mask & CHUNK_MASK
+
+        if chunk:
+            bits = bin(chunk)[:1:-1]
+
+            row = bits.find('1')
+            while row != -1:
+                rows.append(base + row)
+                row = bits.find('1', row + 1)
+
+        mask >>= CHUNK
+        base += CHUNK
+
+    return rows
+
+
+class SectionIndex(object):
+    '''Every section of a quarter, from a table.SectionTable or the sections.Course records like
+       soc.parse_courses yields. Sections are numbered in the order they are listed, and every
+       index is a bit mask of section numbers: by teacher, building, room, day, department,
+       meeting type and whether there are seats left, plus the sections starting at or after
+       and ending at or before each time listed. The masks are made from the table's columns.
+       Filters combine with a single & each.
+
+       index = SectionIndex(soc.parse_courses(soc.format_list(master)))
+       index.query(building='CENTR', room='101', days='Tu')'''
+
+    def __init__(self, courses):
+        sections_table = courses if isinstance(courses, table.SectionTable) else table.SectionTable(courses)
+        length = len(sections_table)
+
+        # Section number -> (course, section).
+        self.rows = sections_table.sections()
+
+        names = [name.lower() if name else None for name in sections_table.name.tolist()]
+        buildings = sections_table.building.tolist()
+
+        self.by_name = table.group_masks(names, length, lambda name: name is not None)
+        self.by_building = table.group_masks(buildings, length, bool)
+        self.by_room = table.group_masks(list(zip(buildings, sections_table.room.tolist())), length, lambda key: key[0])
+        self.by_department = table.group_masks(sections_table.department.tolist(), length)
+        self.by_meeting_type = table.group_masks(sections_table.meeting_type.tolist(), length)
+
+        # Masked straight from the columns.
+        self.by_day = {}
+        for day in sections.DAYS:
+            mask = table.bit_mask(sections_table.days & sections.DAY_BITS[day] != 0)
+
+            if mask:
+                self.by_day[day] = mask
+
+        open_sections = sections_table.is_open()
+        self.by_open = {True: table.bit_mask(open_sections), False: table.bit_mask(~open_sections)}
+
+        # Times listed, sorted, and the sections starting at or after / ending at or before each.
+        # TBA times are MISSING, so they never start after a time, and are left out of the ends.
+        start, end = sections_table.start, sections_table.end
+        timed = start != table.MISSING
+
+        self.starts = numpy.unique(start[timed]).tolist()
+        self.ends = numpy.unique(end[timed]).tolist()
+        self.starting_after = dict((time, table.bit_mask(start >= time)) for time in self.starts)
+        self.ending_before = dict((time, table.bit_mask(timed & (end <= time))) for time in self.ends)
+
+    def __len__(self):
+        return len(self.rows)
+
+    def mask(self, name=None, building=None, room=None, days=None, department=None, meeting_type=None,
+             starts_after=None, ends_before=None, open=None):
+        '''The bit mask of the sections matching every filter given. See query.'''
+
+        mask = (1 << len(self.rows)) - 1
+
+        if name is not None:
+            mask &= self.by_name.get(name.lower(), 0)
+        if building is not None and room is None:
+            mask &= self.by_building.get(building, 0)
+        if room is not None:
+            if building is not None:
+                mask &= self.by_room.get((building, room), 0)
+            else:
+                mask &= sum(rows for key, rows in self.by_room.items() if key[1] == room)
+        if days is not None:
+            for day in sections.day_names(sections.day_mask(days, strict=True)):
+                mask &= self.by_day.get(day, 0)
+        if department is not None:
+            mask &= self.by_department.get(department, 0)
+        if meeting_type is not None:
+            mask &= self.by_meeting_type.get(meeting_type, 0)
+        if open is not None:
+            mask &= self.by_open.get(bool(open), 0)
+
+        if starts_after is not None:
+            # The first time listed at or after starts_after.
+            index = bisect_left(self.starts, minutes(starts_after))
+            mask &= self.starting_after[self.starts[index]] if index < len(self.starts) else 0
+
+        if ends_before is not None:
+            # The last time listed at or before ends_before.
+            index = bisect_right(self.ends, minutes(ends_before))
+            mask &= self.ending_before[self.ends[index - 1]] if index else 0
+
+        return mask
+
+    def query(self, **filters):
+        '''The (course, section) pairs matching every filter given, in listing order. Filters are
+           name, building, room, days, department, meeting_type, starts_after, ends_before and
+           open. name is matched ignoring case. days, ex: 'TuTh', matches sections meeting on all
+           of them. Times are minutes since midnight or like 5:00p, and include sections starting
+           or ending right at them. open is True for sections with seats left, False for the rest.'''
+
+        rows = self.rows
+
+        return [rows[row] for row in bit_rows(self.mask(**filters))]
+
+    def count(self, **filters):
+        '''How many sections query would return, without making the list.'''
+
+        return bin(self.mask(**filters)).count('1')
+
+    def teaches(self, name):
+        '''The codes of the classes a teacher has a section of, ex: ['CSE 100', 'CSE 12'].'''
+
+        return sorted(set('{} {}'.format(course.department, course.number) for course, _ in self.query(name=name)))
@@ -0,0 +1,230 @@
+'''Puts the building, room, days and times of every section together: which rooms are double
+   booked, which are free at a given time, and how busy each building is. Every room keeps the
+   sections meeting in it on each day sorted by start time, so a room and time is a single
+   bisect. Created by Aykan Fonseca.'''
+
+# Builtins
+from bisect import bisect_left, bisect_right
+from collections import defaultdict
+
+# Pip install packages.
+import numpy
+
+# Our modules.
+import query
+import sections
+import table
+
+# The hours utilization counts, in minutes since midnight, and its days.
+DAY_START = 8 * 60
+DAY_END = 22 * 60
+WEEKDAYS = ('M', 'Tu', 'W', 'Th', 'F')
+
+# The schedule of a room, or the slots of a day, with nothing booked.
+EMPTY = ((), (), ())
+NO_SLOTS = ((), ())
+
+
+class RoomIndex(object):
+    '''The sections of a quarter by room and day, from a table.SectionTable or the
+       sections.Course records like soc.parse_courses yields. Sections without days, times,
+       building or room are left out, and so are exams, which meet on a single date.
+
+       For each room and day it keeps the (start, end, row) of its sections sorted by start,
+       the starts alone and, for each, the latest end up to it. A section from start to end
+       overlaps a booking if the booking starts before end and ends after start, so the latest
+       end of the bookings starting before end tells whether the room is free.
+
+       To find every free room at once, rooms are numbered and each day is cut into slots at
+       every time a section starts or ends. Each slot has a bit mask of the rooms booked during
+       it, so the rooms taken between two times are the OR of a few slots.
+
+       index = RoomIndex(soc.parse_courses(soc.format_list(master)))
+       index.free_rooms('Tu', '2:00p', '3:20p', building='CENTR')'''
+
+    def __init__(self, courses):
+        sections_table = courses if isinstance(courses, table.SectionTable) else table.SectionTable(courses)
+        buildings, rooms = sections_table.building.tolist(), sections_table.room.tolist()
+
+        # The sections with a building, room, days and times, picked from the columns at once.
+        placed = numpy.array([bool(building and room) for building, room in zip(buildings, rooms)], dtype=bool)
+        bookable = numpy.flatnonzero(placed & (sections_table.days != 0) & (sections_table.start != table.MISSING)).tolist()
+
+        # Row -> (course, section).
+        every = sections_table.sections()
+        self.rows = [every[index] for index in bookable]
+
+        bookings = defaultdict(list)
+        days, starts, ends = sections_table.days.tolist(), sections_table.start.tolist(), sections_table.end.tolist()
+
+        # Row -> its days and times, and its section id if it has one, which tell a class listed
+        # under two departments from two classes.
+        self.meetings = [(days[index], starts[index], ends[index]) for index in bookable]
+        ids = sections_table.id.tolist()
+        self.ids = [ids[index] or None for index in bookable]
+
+        for row, index in enumerate(bookable):
+            for day in sections.day_names(days[index]):
+                bookings[(buildings[index], rooms[index], day)].append((starts[index], ends[index], row))
+
+        # (building, room, day) -> (bookings, starts, latest end).
+        self.schedule = {}
+
+        # Building -> its rooms, sorted.
+        self.rooms = defaultdict(set)
+
+        for (building, room, day), items in bookings.items():
+            items.sort()
+
+            latest = []
+            end = 0
+            for item in items:
+                end = max(end, item[1])
+                latest.append(end)
+
+            self.schedule[(building, room, day)] = (items, [item[0] for item in items], latest)
+            self.rooms[building].add(room)
+
+        self.rooms = dict((building, sorted(rooms)) for building, rooms in self.rooms.items())
+
+        # Room number -> (building, room), the mask of every room and of the rooms of each building.
+        self.room_names = [(building, room) for building in sorted(self.rooms) for room in self.rooms[building]]
+        numbers = dict((name, number) for number, name in enumerate(self.room_names))
+        self.every_room = (1 << len(self.room_names)) - 1
+        self.by_building = defaultdict(int)
+
+        for number, (building, _) in enumerate(self.room_names):
+            self.by_building[building] |= 1 << number
+
+        # Day -> (times a slot starts at, mask of the rooms booked in each slot).
+        self.slots = {}
+
+        by_day = defaultdict(list)
+        for (building, room, day), (items, _, _) in self.schedule.items():
+            by_day[day].append((1 << numbers[(building, room)], items))
+
+        for day, rooms in by_day.items():
+            times = sorted(set(time for _, items in rooms for start, end, _ in items for time in (start, end)))
+            booked = [0] * (len(times) - 1)
+
+            for bit, items in rooms:
+                for start, end, _ in items:
+                    for slot in range(bisect_left(times, start), bisect_left(times, end)):
+                        booked[slot] |= bit
+
+            self.slots[day] = (times, booked)
+
+    def __len__(self):
+        return len(self.rows)
+
+    def is_free(self, building, room, day, start, end):
+        '''Whether nothing meets in a room on a day between start and end. Times are minutes since
+           midnight or like 5:00p. A class ending right at start, or starting right at end, is fine.'''
+
+        _, starts, latest = self.schedule.get((building, room, day), EMPTY)
+
+        # The bookings starting before end.
+        index = bisect_left(starts, query.minutes(end))
+
+        return not index or latest[index - 1] <= query.minutes(start)
+
+    def bookings(self, building, room, day, start=None, end=None):
+        '''The (course, section) pairs meeting in a room on a day, by start time, or only those
+           between start and end if given.'''
+
+        items, starts, _ = self.schedule.get((building, room, day), EMPTY)
+
+        if end is not None:
+            items = items[:bisect_left(starts, query.minutes(end))]
+
+        if start is not None:
+            start = query.minutes(start)
+            items = [item for item in items if item[1] > start]
+
+        return [self.rows[row] for _, _, row in items]
+
+    def free_rooms(self, day, start, end, building=None):
+        '''The (building, room) pairs with nothing meeting on a day between start and end, of a
+           single building if given. Only rooms that some section meets in are known.'''
+
+        times, booked = self.slots.get(day, NO_SLOTS)
+
+        # The slots from the one start falls in to the last one starting before end.
+        first = max(bisect_right(times, query.minutes(start)) - 1, 0)
+        last = bisect_left(times, query.minutes(end))
+
+        taken = 0
+        for mask in booked[first:last]:
+            taken |= mask
+
+        free = (self.by_building.get(building, 0) if building is not None else self.every_room) & ~taken
+        names = self.room_names
+
+        return [names[number] for number in query.bit_rows(free)]
+
+    def conflicts(self):
+        '''Every pair of sections meeting in the same room at the same time, as (building, room,
+           day, (course, section), (course, section)). A class listed under two departments, ex:
+           CSE and ECE, is one meeting: sections in a room with the same days and times, or the
+           same section id, count once, as the first of them listed.'''
+
+        conflicts = []
+
+        for (building, room, day), (items, _, _) in sorted(self.schedule.items()):
+            kept = self.distinct(items)
+
+            # The latest end of the sections before, so only look back when something is still going.
+            latest = 0
+
+            for index, (start, end, row) in enumerate(kept):
+                if latest > start:
+                    conflicts.extend((building, room, day, self.rows[other], self.rows[row])
+                                     for _, other_end, other in kept[:index] if other_end > start)
+
+                latest = max(latest, end)
+
+        return conflicts
+
+    def distinct(self, items):
+        '''The (start, end, row) bookings of a room and day but those repeating an earlier one's
+           days and times or section id.'''
+
+        seen = set()
+        kept = []
+
+        for item in items:
+            row = item[2]
+            keys = (self.meetings[row], self.ids[row]) if self.ids[row] is not None else (self.meetings[row],)
+
+            if not any(key in seen for key in keys):
+                kept.append(item)
+
+            seen.update(keys)
+
+        return kept
+
+    def utilization(self, days=WEEKDAYS, day_start=DAY_START, day_end=DAY_END):
+        '''How busy each building's rooms are: building -> (rooms, minutes booked, share of the
+           time between day_start and day_end on days booked). Overlapping sections count once.'''
+
+        day_start, day_end = query.minutes(day_start), query.minutes(day_end)
+        booked = defaultdict(int)
+
+        for (building, room, day), (items, _, _) in self.schedule.items():
+            if day not in days:
+                continue
+
+            # The end of the time counted so far.
+            counted = day_start
+
+            for start, end, _ in items:
+                start, end = max(start, counted), min(end, day_end)
+
+                if end > start:
+                    booked[building] += end - start
+                    counted = end
+
+        available = len(days) * (day_end - day_start)
+
+        return dict((building, (len(rooms), booked[building], booked[building] / float(len(rooms) * available)))
+                    for building, rooms in self.rooms.items())
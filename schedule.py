@@ -0,0 +1,214 @@
+'''Finds the schedules a student can take for a few classes, ex: CSE 100, MATH 20C and PHYS 2A,
+   without two sections or finals at the same time. Every way of enrolling in a class is turned
+   into a bit mask of the 5 minute slots of the week it meets in, so checking two of them for a
+   conflict is a single &. Created by Aykan Fonseca.'''
+
+# Builtins
+import heapq
+import itertools
+from collections import defaultdict, namedtuple
+
+# Our modules.
+import sections
+
+# Minutes per slot and slots per day.
+SLOT = 5
+SLOTS_PER_DAY = 24 * 60 // SLOT
+
+# Schedules returned by default.
+TOP = 10
+
+# One way of enrolling in a class: a section with an id and the sections without one that come
+# with it, ex: lecture A00 and discussion A01. meetings and finals are bit masks of slots.
+Option = namedtuple('Option', 'sections meetings days finals')
+
+# A schedule found: days on campus, minutes between classes on those days, and for each class
+# its code and the options that fit, which all meet at the same times.
+Schedule = namedtuple('Schedule', 'days gaps classes')
+
+# How many days are in each day mask.
+DAY_COUNTS = [bin(mask).count('1') for mask in range(1 << len(sections.DAYS))]
+
+# Every slot of a day.
+DAY_SLOTS = (1 << SLOTS_PER_DAY) - 1
+
+
+def slots(start, end):
+    '''The slots of a day from start to end minutes, as a mask. Partial slots count as taken.'''
+
+    first, last = start // SLOT, -(-end // SLOT)
+
+    return ((1 << (last - first)) - 1) << first
+
+
+def meetings_mask(section):
+    '''The slots of the week a section meets in. Sections at TBA times have none.'''
+
+    if not section.days or section.start is None:
+        return 0
+
+    day = slots(section.start, section.end)
+
+    return sum(day << (index * SLOTS_PER_DAY) for index, name in enumerate(sections.DAYS)
+               if section.days & sections.DAY_BITS[name])
+
+
+def letter(section):
+    '''What a section's number starts with, ex: A for A01, which ties it to the lecture A00.'''
+
+    return section.number.rstrip('0123456789')
+
+
+def gaps(meetings):
+    '''Minutes spent on campus between classes over the week: the time from the first class to
+       the end of the last on each day, less the time in class.'''
+
+    total = -bin(meetings).count('1')
+
+    for index in range(len(sections.DAYS)):
+        day = meetings >> (index * SLOTS_PER_DAY) & DAY_SLOTS
+
+        if day:
+            total += day.bit_length() - (day & -day).bit_length() + 1
+
+    return total * SLOT
+
+
+def reduce_or(masks):
+    '''All of the masks ORed together.'''
+
+    total = 0
+    for mask in masks:
+        total |= mask
+
+    return total
+
+
+def reduce_and(masks):
+    '''The bits set in every mask.'''
+
+    total = -1
+    for mask in masks:
+        total &= mask
+
+    return total
+
+
+class Scheduler(object):
+    '''The options of every class of a quarter, from sections.Course records like
+       soc.parse_courses yields, by code, ex: 'CSE 100'. Finals on the same date share the same
+       bits of the finals mask, so they are compared like meetings.
+
+       scheduler = Scheduler(soc.parse_courses(soc.format_list(master)))
+       scheduler.schedules(['CSE 100', 'MATH 20C', 'PHYS 2A'], top=5)'''
+
+    def __init__(self, courses):
+        # Final dates -> their number, in the order they're seen.
+        self.dates = {}
+
+        self.options = defaultdict(list)
+
+        for course in courses:
+            code = '{} {}'.format(course.department, course.number)
+            finals = self.finals_mask(course.final)
+
+            # Sections without an id come with every section with one that has the same letter.
+            # A class with no ids at all is taken a letter at a time.
+            attached = defaultdict(list)
+            for section in course.sections:
+                if not section.id:
+                    attached[letter(section)].append(section)
+
+            enrollable = [[section] for section in course.sections if section.id] or attached.values()
+
+            for option in enrollable:
+                option = attached[letter(option[0])] + option if option[0].id else option
+
+                self.options[code].append(Option(tuple(option), reduce_or(map(meetings_mask, option)),
+                                                 reduce_or(section.days or 0 for section in option), finals))
+
+    def finals_mask(self, exam):
+        '''The slots of an exam, on the day its date is numbered, or 0 if it has no date or time.'''
+
+        if exam is None or exam.start is None:
+            return 0
+
+        index = self.dates.setdefault(exam.date, len(self.dates))
+
+        return slots(exam.start, exam.end) << (index * SLOTS_PER_DAY)
+
+    def choices(self, code, finals=True):
+        '''The options of a class that are worth trying: options meeting at the same times and
+           days, and with the same final if finals are compared, are tried only once. A list of
+           lists of options.'''
+
+        same = defaultdict(list)
+
+        for option in self.options.get(code, ()):
+            same[(option.meetings, option.days, option.finals if finals else 0)].append(option)
+
+        return list(same.values())
+
+    def schedules(self, codes, top=TOP, finals=True):
+        '''The best top schedules taking every class in codes without a conflict, best first.
+           Fewer days on campus is better, then fewer minutes between classes. Finals are
+           checked unless finals is False. An empty list if there are none.
+
+           Classes with the fewest choices are picked first. A schedule is dropped as soon as
+           two of its picks meet at the same time, and once top schedules are found, as soon as
+           it is sure to be on campus more days than the worst of them.'''
+
+        # Each class's choices on the fewest days first, so good schedules are found early.
+        classes = sorted(((code, sorted(self.choices(code, finals), key=lambda same: DAY_COUNTS[same[0].days]))
+                          for code in codes), key=lambda item: len(item[1]))
+
+        if not classes or not classes[0][1]:
+            return []
+
+        # The days every choice of the classes from each depth on meets on, so a schedule can be
+        # dropped before knowing which of them it takes.
+        needed = [0] * (len(classes) + 1)
+        for depth in reversed(range(len(classes))):
+            needed[depth] = needed[depth + 1] | reduce_and(same[0].days for same in classes[depth][1])
+
+        # The worst schedule found on top, as (-days, -gaps, -order, picks).
+        found = []
+        picks = []
+        order = itertools.count()
+
+        def visit(depth, meetings, exams, days):
+            if len(found) == top and DAY_COUNTS[days | needed[depth]] > -found[0][0]:
+                return
+
+            if depth == len(classes):
+                item = (-DAY_COUNTS[days], -gaps(meetings), -next(order), list(picks))
+
+                if len(found) < top:
+                    heapq.heappush(found, item)
+                elif item > found[0]:
+                    heapq.heapreplace(found, item)
+
+                return
+
+            code, choices = classes[depth]
+
+            for same in choices:
+                option = same[0]
+
+                if option.meetings & meetings or finals and option.finals & exams:
+                    continue
+
+                picks.append((code, tuple(same)))
+                visit(depth + 1, meetings | option.meetings, exams | option.finals, days | option.days)
+                picks.pop()
+
+        visit(0, 0, 0, 0)
+
+        found.sort(reverse=True)
+
+        # Back in the order the classes were asked for.
+        asked = dict((code, index) for index, code in enumerate(codes))
+
+        return [Schedule(-days, -minutes, sorted(chosen, key=lambda pick: asked[pick[0]]))
+                for days, minutes, _, chosen in found]
+
@@ -0,0 +1,209 @@
+'''Keeps the seat counts of every section across scrapes of the Schedule of Classes. Created by Aykan Fonseca.'''
+
+# Builtins
+import array
+import bisect
+import os
+import struct
+
+# Where the samples are kept unless told otherwise, and where each quarter's are kept by soc.py.
+# Section ids are reused from one quarter to the next, so quarters can't share a log.
+SEATS_PATH = 'seats.log'
+QUARTER_PATH = 'seats {}.log'
+
+# One sample on disk: section id, timestamp, seats taken and seats available.
+RECORD = struct.Struct('<16sqqq')
+
+# The longest section id a record holds, in bytes of utf-8.
+ID_SIZE = 16
+
+# Python 2's array has no 'q', but its 'l' is 64 bits on the platforms we run on.
+try:
+    array.array('q')
+    INTEGER = 'q'
+except ValueError:
+    INTEGER = 'l'
+
+
+def quarter_path(quarter):
+    '''The log of a quarter, ex: 'seats FA19.log'.'''
+
+    return QUARTER_PATH.format(quarter)
+
+
+def pack(section_id, timestamp, taken, available):
+    '''One sample as a record of the log. Raises ValueError for ids too long to be kept whole.'''
+
+    encoded = section_id.encode('utf_8')
+
+    if len(encoded) > ID_SIZE:
+        raise ValueError('section id {!r} is longer than {} bytes'.format(section_id, ID_SIZE))
+
+    return RECORD.pack(encoded, timestamp, taken, available)
+
+
+def append(samples, timestamp, path=SEATS_PATH):
+    '''Adds a whole scrape, every (section id, taken, available) at timestamp, to the end of the log
+       in a single write, without replaying it. What a scrape that only adds its seats uses, as
+       loading a SeatStore reads every scrape before it. Returns the number of samples written.'''
+
+    records = [pack(section_id, timestamp, taken, available) for section_id, taken, available in samples]
+
+    with open(path, 'ab') as file:
+        file.write(b''.join(records))
+
+    return len(records)
+
+
+def section_key(course_key, section):
+    '''Identifies a section across scrapes. Sections without an id use their class key and number.'''
+
+    if section['id'] != 'Blank':
+        return section['id']
+
+    return '{}-{}'.format(course_key, section['number'])
+
+
+def section_samples(parsed):
+    '''Yields (section id, seats taken, seats available) for every section of parse_list's output
+       that lists its seats.'''
+
+    for course in parsed:
+        for section in course['section'].values():
+            if section['seats taken'] != 'Blank':
+                yield section_key(course['key'], section), section['seats taken'], section['seats available']
+
+
+def record_samples(courses):
+    '''section_samples for sections.Course records.'''
+
+    for course in courses:
+        for section in course.sections:
+            if section.taken is not None:
+                yield section.id or '{}-{}'.format(course.key, section.number), section.taken, section.available
+
+
+class SeatStore(object):
+    '''Append-only time series of (timestamp, seats taken, seats available) for each section. Samples
+       live in arrays per section and each ingest is appended to a log file, which is replayed on load.'''
+
+    def __init__(self, path=SEATS_PATH):
+        self.path = path
+
+        # Section id -> (timestamps, taken, available) arrays.
+        self.series = {}
+
+        # Every time a section's seats changed, in time order, and those times alone for bisect.
+        self.changes = []
+        self.change_times = array.array(INTEGER)
+
+        if path and os.path.exists(path):
+            self.load()
+
+    def __len__(self):
+        return sum(len(timestamps) for timestamps, _, _ in self.series.values())
+
+    def add(self, section_id, timestamp, taken, available):
+        '''Adds a sample in memory only. Returns whether the seats changed since the last sample.'''
+
+        try:
+            timestamps, takens, availables = self.series[section_id]
+        except KeyError:
+            timestamps, takens, availables = self.series[section_id] = (
+                array.array(INTEGER), array.array(INTEGER), array.array(INTEGER))
+
+        changed = not timestamps or takens[-1] != taken or availables[-1] != available
+
+        timestamps.append(timestamp)
+        takens.append(taken)
+        availables.append(available)
+
+        if changed:
+            # Scrapes arrive in order, so this is almost always an append.
+            index = bisect.bisect_right(self.change_times, timestamp)
+            self.change_times.insert(index, timestamp)
+            self.changes.insert(index, section_id)
+
+        return changed
+
+    def ingest(self, samples, timestamp):
+        '''Records a whole scrape: every (section id, taken, available) at timestamp. Appends them to
+           the log in a single write. Returns the number of sections whose seats changed.'''
+
+        records = []
+        changed = 0
+
+        for section_id, taken, available in samples:
+            records.append(pack(section_id, timestamp, taken, available))
+            changed += self.add(section_id, timestamp, taken, available)
+
+        if self.path:
+            with open(self.path, 'ab') as file:
+                file.write(b''.join(records))
+
+        return changed
+
+    def load(self):
+        '''Replays the log file into memory.'''
+
+        with open(self.path, 'rb') as file:
+            data = file.read()
+
+        for offset in range(0, len(data) - len(data) % RECORD.size, RECORD.size):
+            section_id, timestamp, taken, available = RECORD.unpack_from(data, offset)
+            self.add(section_id.rstrip(b'\0').decode('utf_8'), timestamp, taken, available)
+
+    def history(self, section_id, since=None):
+        '''Every (timestamp, taken, available) of a section, oldest first, optionally only after since.'''
+
+        if section_id not in self.series:
+            return []
+
+        timestamps, takens, availables = self.series[section_id]
+        start = bisect.bisect_right(timestamps, since) if since is not None else 0
+
+        return list(zip(timestamps[start:], takens[start:], availables[start:]))
+
+    def changed_since(self, since):
+        '''Ids of every section whose seats changed after since.'''
+
+        return set(self.changes[bisect.bisect_right(self.change_times, since):])
+
+    def compact(self, before):
+        '''Drops samples older than before that repeat the sample kept ahead of them, keeping
+           only the points where seats changed. Rewrites the log. Returns the samples dropped.'''
+
+        dropped = 0
+
+        for section_id, (timestamps, takens, availables) in self.series.items():
+            kept = (array.array(INTEGER), array.array(INTEGER), array.array(INTEGER))
+
+            for index in range(len(timestamps)):
+                repeat = (kept[0] and takens[index] == kept[1][-1] and availables[index] == kept[2][-1])
+
+                if repeat and timestamps[index] < before:
+                    dropped += 1
+                    continue
+
+                kept[0].append(timestamps[index])
+                kept[1].append(takens[index])
+                kept[2].append(availables[index])
+
+            self.series[section_id] = kept
+
+        if self.path:
+            self.save()
+
+        return dropped
+
+    def save(self):
+        '''Writes every sample to a new log, then swaps it in for the old one.'''
+
+        temp = self.path + '.tmp'
+
+        with open(temp, 'wb') as file:
+            for section_id, (timestamps, takens, availables) in self.series.items():
+                file.write(b''.join(pack(section_id, timestamps[index], takens[index], availables[index])
+                                    for index in range(len(timestamps))))
+
+        os.rename(temp, self.path)
@@ -0,0 +1,436 @@
+'''Parses the class strings of the Schedule of Classes into compact records. Created by Aykan Fonseca.'''
+
+# Builtins
+import re
+import sys
+from collections import namedtuple
+
+# Compiled once instead of for every section.
+NUMBER_REGEX = re.compile(r'\d+')
+DAYS_REGEX = re.compile(r'[A-Z][^A-Z]*')
+KEY_REGEX = re.compile(r'\D(\d{6})\D')
+
+# The usual layout of a section line: id, type, number, days, times, building, room, teacher,
+# seats taken and seats available. Anything else falls back to walking the words one at a time.
+SECTION_REGEX = re.compile(r'\.\.\.\.(?:(\d{6}) )?([A-Z]\S*) (\S+) (?!TBA )([A-Z][A-Za-z]*) (\d{1,2}:\d\d[ap]-\d{1,2}:\d\d[ap]) '
+                           r'(?!TBA )(\S+) (?!TBA )(\S+) (\D+) (\d+) (\d+)$')
+
+# Days in the order the Schedule of Classes lists them, and their bit in a day mask.
+DAYS = ('M', 'Tu', 'W', 'Th', 'F', 'S', 'Su')
+DAY_BITS = dict((day, 1 << index) for index, day in enumerate(DAYS))
+
+# Day strings and time ranges already parsed, ex: 'TuTh' -> 10 and '9:00a-9:50a' -> (540, 590).
+DAY_MASKS = {}
+TIME_RANGES = {}
+
+# Minutes since midnight already formatted by format_clock.
+CLOCKS = {}
+
+# Seats taken and available for sections with unlimited seats.
+UNLIMITED = getattr(sys, 'maxint', sys.maxsize)
+
+# Placeholder for anything missing in the dictionaries handed to the rest of soc.py.
+BLANK = 'Blank'
+
+# A single section of a class. Missing values are None. days is a mask of DAY_BITS, or None for
+# TBA, and start / end are minutes since midnight.
+Section = namedtuple('Section', 'id meeting_type number days start end building room name taken available')
+
+# A final (FI) or midterm (MI). date is the date of the exam, ex: 12/14/2019. days is None for TBA.
+Exam = namedtuple('Exam', 'kind date days start end building room')
+
+# A class: its header, sections in the order listed, exams and the seats of its last section.
+Course = namedtuple('Course', 'key department number name units restrictions sections final midterm seats')
+
+
+def day_mask(text, strict=False):
+    '''Turns days like MWF or TuTh into a mask of DAY_BITS. Masks are looked up in DAY_MASKS
+       first, as only a handful of different day strings appear in a quarter. Days it doesn't
+       know are left out, so a class listing one is still parsed, and days of only those are 0,
+       which the parser takes as TBA. With strict, ex: for days asked for in a query, they
+       raise ValueError instead.'''
+
+    mask = DAY_MASKS.get(text)
+
+    if mask is None or strict:
+        mask = 0
+
+        for day in DAYS_REGEX.findall(text):
+            if day in DAY_BITS:
+                mask |= DAY_BITS[day]
+            elif strict:
+                raise ValueError("Unknown day {} in {}".format(day, text))
+
+        DAY_MASKS[text] = mask
+
+    return mask
+
+
+def day_names(mask):
+    '''The days in a mask of DAY_BITS, in the order the Schedule of Classes lists them.'''
+
+    return [day for day in DAYS if mask & DAY_BITS[day]]
+
+
+# The "day 1" to "day 5" values of every possible day mask, padded with Blank.
+DAY_FIELDS = [tuple((day_names(mask) + [BLANK] * 5)[:5]) for mask in range(1 << len(DAYS))]
+
+
+def parse_clock(text):
+    '''Turns a time like 9:00a or 12:50p into minutes since midnight.'''
+
+    hour, _, minute = text[:-1].partition(':')
+    hour = int(hour) % 12
+
+    if text[-1] != 'a':
+        hour += 12
+
+    return hour * 60 + int(minute)
+
+
+def format_clock(minutes):
+    '''Turns minutes since midnight back into a 12 hour time and whether it is am. Ex: ('9:00', True).'''
+
+    hour = minutes // 60 % 12
+
+    return '{}:{:02d}'.format(hour or 12, minutes % 60), minutes < 720
+
+
+def format_clock_24(minutes):
+    '''Turns minutes since midnight into the 24 hour time prepare_for_db stores. Ex: 14:00. Like
+       it always has, only times from 1pm on change, so 12:30a is 12:30.'''
+
+    if minutes < 13 * 60:
+        return format_clock(minutes)[0]
+
+    return '{}:{:02d}'.format(minutes // 60, minutes % 60)
+
+
+def to_24_hour(text, am):
+    '''Turns a 12 hour time and its am flag, as in the dictionaries of course_to_dict, into
+       format_clock_24's time. TBA stays TBA.'''
+
+    if am:
+        return text
+
+    hour, _, minute = text.partition(':')
+
+    return text if hour == '12' else '{}:{}'.format(int(hour) + 12, minute)
+
+
+def parse_times(text):
+    '''Turns a time range like 9:00a-9:50a into start and end minutes since midnight. Like
+       day_mask, ranges are looked up in TIME_RANGES first.'''
+
+    times = TIME_RANGES.get(text)
+
+    if times is None:
+        start, _, end = text.partition('-')
+        times = TIME_RANGES[text] = (parse_clock(start), parse_clock(end))
+
+    return times
+
+
+def parse_seats(text):
+    '''Parses what follows the room of a section: the teacher, seats taken and seats available.'''
+
+    # Find position of first number in string.
+    match = NUMBER_REGEX.search(text)
+    num_loc = match.start() if match else 0
+
+    name = taken = available = None
+
+    # Note for seat enrollments:
+    # A. WAITLIST FULL, the seats taken is the amount over plus the seats available.
+    # B. UNLIMITED seats, the seats taken is max integer.
+    # C. None of those, the seats taken is a positive interger.
+    if 'FULL' in text:
+        temp = text.find('FULL')
+
+        if temp != 0:
+            name = 'Staff' if 'Staff' in text else text[:temp - 1]
+
+        text = text[temp:]
+        close = text.find(')')
+
+        available = int(text[close + 2:])
+        taken = int(text[text.find('(') + 1:close]) + available
+
+    elif 'Unlim' in text:
+        name = 'Staff' if 'Staff ' in text else text[:text.find('Unlim') - 1]
+        taken = available = UNLIMITED
+
+    # Name and seat information.
+    elif num_loc != 0:
+        name = text[:num_loc].strip()
+        temp = text[num_loc:].strip().split(' ')
+        taken, available = int(temp[0]), int(temp[1])
+
+    # Just staff and no seat information.
+    elif text.strip() == 'Staff':
+        name = 'Staff'
+
+    # Name and no seat information.
+    elif ',' in text:
+        name = text.strip()
+
+    # No name but seat info - think discussion sections without teacher name.
+    elif text:
+        temp = text.split(' ')
+
+        try:
+            taken, available = int(temp[0]), int(temp[1])
+        except IndexError:
+            raise ValueError("Can't parse seats in {!r}".format(text))
+
+    return name, taken, available
+
+
+def parse_section(item):
+    '''Parses a section line (starts with ....). Most lines are matched by SECTION_REGEX in one
+       go, the rest take a single pass over their words.'''
+
+    match = SECTION_REGEX.match(item)
+
+    if match:
+        section_id, meeting_type, number, days, times, building, room, name, taken, available = match.groups()
+
+        if 'FULL' not in name and 'Unlim' not in name:
+            start, end = TIME_RANGES.get(times) or parse_times(times)
+            mask = DAY_MASKS.get(days)
+
+            return Section(section_id, meeting_type, number, (mask if mask is not None else day_mask(days)) or None,
+                           start, end, building, room, name.strip(), int(taken), int(available))
+
+    tokens = item.split(' ')
+
+    # ID. Sections that can't be enrolled in on their own, like some lectures, don't have one.
+    if NUMBER_REGEX.search(item).start() == 4:
+        section_id = item[4:10].strip()
+        i = 1
+    else:
+        section_id = None
+        tokens[0] = tokens[0][4:]
+        i = 0
+
+    # Meeting type and Section.
+    meeting_type = tokens[i]
+    number = tokens[i + 1]
+    i += 2
+
+    # Days, ex: MWF. None when TBA, or when none of them are days we know.
+    days = None
+    if tokens[i] != 'TBA':
+        days = day_mask(tokens[i]) or None
+        i += 1
+
+    # The times. None when TBA.
+    start = end = None
+    if tokens[i] != 'TBA':
+        start, end = parse_times(tokens[i])
+        i += 1
+
+    # Skip a TBA because time was given, but not building or room.
+    if len(tokens) - i > 1 and tokens[i] == tokens[i + 1] == 'TBA':
+        i += 1
+
+    # The Building and Room.
+    building = None
+    if tokens[i] != 'TBA':
+        building = tokens[i]
+        i += 1
+
+    room = tokens[i] if tokens[i] != 'TBA' else None
+
+    name, taken, available = parse_seats(' '.join(tokens[i + 1:]))
+
+    return Section(section_id, meeting_type, number, days, start, end, building, room, name, taken, available)
+
+
+def parse_exam(item):
+    '''Parses an exam line (starts with ****). Ex: ****FI 12/14/2019 S 11:30a-2:29p CENTR 101.'''
+
+    exam = item.split(' ')
+
+    building = room = None
+    if len(exam) == 6:
+        building, room = exam[4], exam[5]
+
+    start = end = None
+    if exam[3] != 'TBA':
+        start, end = parse_times(exam[3])
+
+    kind = 'FI' if 'FI' in item else 'MI'
+
+    # Exams whose day isn't known yet list TBA, like their time.
+    days = (day_mask(exam[2]) or None) if exam[2] not in ('TBA', '') else None
+
+    return Exam(kind, exam[1], days, start, end, building, room)
+
+
+def parse_header(item):
+    '''Parses a class header into department, course number, name, units and restrictions.'''
+
+    department = item.partition(' ')[0]
+    num_loc = NUMBER_REGEX.search(item).start()
+    number = item[num_loc:].partition(' ')[0]
+    temp = item.partition('( ')
+
+    name = temp[0][len(number) + 1 + num_loc: -1]
+    units = temp[2].partition(')')[0]
+
+    # Restriction codes sit between the department and the course number.
+    restrictions = None
+    if num_loc != len(department) + 1:
+        restrictions = item[len(department) + 1: num_loc - 1]
+
+    return department, number, name, units, restrictions
+
+
+def parse_course(lst):
+    '''Parses all the strings of a single class into a Course.'''
+
+    header = (None, None, None, None, None)
+    sections = []
+    final = midterm = seats = None
+
+    for item in lst:
+        if 'Units' in item:
+            header = parse_header(item)
+
+        if '....' in item:
+            section = parse_section(item)
+            sections.append(section)
+
+            # section.taken.
+            if section[9] is not None:
+                seats = (section[9], section[10])
+
+        if '****' in item:
+            exam = parse_exam(item)
+
+            if exam[0] == 'FI':
+                final = exam
+            else:
+                midterm = exam
+
+    # Uses first 6-digit id as key.
+    key = None
+    for item in lst:
+        match = KEY_REGEX.search(' ' + item + ' ')
+
+        if match:
+            key = int(match.group(1))
+            break
+
+    return Course(key, header[0], header[1], header[2], header[3], header[4], tuple(sections), final, midterm, seats)
+
+
+def clock_fields(fields, start, end):
+    '''Adds the 12 hour start / end times and their am flags, or TBA.'''
+
+    if start is None:
+        fields["start time"] = "TBA"
+        fields["end time"] = "TBA"
+        fields["start time am"] = True
+        fields["end time am"] = True
+    else:
+        fields["start time"], fields["start time am"] = CLOCKS.get(start) or clock(start)
+        fields["end time"], fields["end time am"] = CLOCKS.get(end) or clock(end)
+
+
+def clock(minutes):
+    '''format_clock, remembered in CLOCKS.'''
+
+    CLOCKS[minutes] = format_clock(minutes)
+
+    return CLOCKS[minutes]
+
+
+def section_to_dict(section):
+    '''The dictionary soc.parse_list has always produced for a section.'''
+
+    section_id, meeting_type, number, days, start, end, building, room, name, taken, available = section
+
+    fields = {"id": section_id or BLANK, "meeting type": meeting_type, "number": number,
+              "building": building or BLANK, "room": room or BLANK,
+              "name": name if name is not None else BLANK,
+              "seats taken": taken if taken is not None else BLANK,
+              "seats available": available if available is not None else BLANK}
+
+    # Days: so MWF would have separate entries, M, W, F. Max = 5, assumed Blank.
+    if days is not None:
+        fields["day 1"], fields["day 2"], fields["day 3"], fields["day 4"], fields["day 5"] = DAY_FIELDS[days]
+
+    clock_fields(fields, start, end)
+
+    return fields
+
+
+def exam_days(exam):
+    '''The days of an exam as listed, ex: S, or TBA.'''
+
+    return ''.join(day_names(exam.days)) if exam.days is not None else 'TBA'
+
+
+def exam_to_dict(exam):
+    '''The dictionary soc.parse_list has always produced for a final or midterm.'''
+
+    if exam is None:
+        return {}
+
+    fields = {"number": exam.date, "day 1": exam_days(exam), "meeting type": exam.kind,
+              "building": exam.building or BLANK, "room": exam.room or BLANK,
+              "seats taken": BLANK, "seats available": BLANK}
+
+    clock_fields(fields, exam.start, exam.end)
+
+    return fields
+
+
+def course_to_dict(course, timestamp):
+    '''The dictionary soc.parse_list has always produced for a class.'''
+
+    return {"section": dict((index, section_to_dict(section)) for index, section in enumerate(course.sections, 1)),
+            "midterm": exam_to_dict(course.midterm), "final": exam_to_dict(course.final),
+            "seats": {timestamp: course.seats or (BLANK, BLANK)}, "key": course.key,
+            "department": course.department, "course number": course.number, "course name": course.name,
+            "units": course.units,
+            "restrictions": course.restrictions if course.restrictions is not None else "No Restrictions"}
+
+
+# The days of every day mask as prepare_for_db stores them, ex: MWF or TR, and - for none. Like
+# the day fields they come from, at most 5 days.
+DB_DAYS = [''.join(day for day in fields if day != BLANK).replace('Th', 'R').replace('Tu', 'T') or '-'
+           for fields in DAY_FIELDS]
+
+# Every minute of the day as format_clock_24 writes it.
+CLOCKS_24 = [format_clock_24(minutes) for minutes in range(24 * 60)]
+
+
+def section_to_db(section):
+    '''The dictionary prepare_for_db makes of a section, but for its email, straight from the record.'''
+
+    section_id, meeting_type, number, days, start, end, building, room, name, taken, available = section
+
+    return {"id": section_id or BLANK, "meeting type": meeting_type, "number": number,
+            "building": building or BLANK, "room": room or BLANK,
+            "name": name if name is not None else BLANK,
+            "seats taken": taken if taken is not None else BLANK,
+            "seats available": available if available is not None else BLANK,
+            "days": DB_DAYS[days] if days is not None else '-',
+            "start time": CLOCKS_24[start] if start is not None else "TBA",
+            "end time": CLOCKS_24[end] if start is not None else "TBA"}
+
+
+def final_to_db(exam):
+    '''The dictionary prepare_for_db makes of a final, straight from the record.'''
+
+    if exam is None:
+        return {}
+
+    return {"number": exam.date, "days": exam_days(exam).replace('Th', 'R').replace('Tu', 'T'),
+            "meeting type": exam.kind, "building": exam.building or BLANK, "room": exam.room or BLANK,
+            "seats taken": BLANK, "seats available": BLANK,
+            "start time": CLOCKS_24[exam.start] if exam.start is not None else "TBA",
+            "end time": CLOCKS_24[exam.end] if exam.start is not None else "TBA"}
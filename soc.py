@@ -1,22 +1,67 @@
 '''Python program to scrape UC San Diego's Schedule of Classes. Created by Aykan Fonseca.'''
 
 # Builtins
+import hashlib
 import itertools
 import re
+import shutil
 import sys
 import time
-from collections import defaultdict
+from collections import defaultdict, deque
 import json
+from multiprocessing import Pool
+from multiprocessing.pool import ThreadPool
 
 # Pip install packages.
-from bs4 import BeautifulSoup
-from cachecontrol import CacheControl
+from bs4 import BeautifulSoup, UnicodeDammit
+from bs4.dammit import EncodingDetector
 from firebase import firebase
-import requests
+from lxml import html as lxml_html
+
+# Our modules.
+import catalog_index
+import checkpoint
+import controller
+import export
+import httpcache
+import instructors
+import metrics
+import seats
+import sections
+import table
+import upload
+import validate
 
 # Global Variables.
-SESSION = CacheControl(requests.Session())
-NUMBER_PAGES = 0
+SESSION = httpcache.session()
+
+# The number of pages fetched at once by get_data. Use 1 to fetch one page at a time.
+WORKERS = 8
+
+# The most pages requested ahead of the page being parsed.
+BUFFER_SIZE = 2 * WORKERS
+
+# Processes turning pages into classes in runner, ex: multiprocessing.cpu_count(). 0 does it all in
+# this process, where the GIL keeps it to a single core.
+PROCESSES = 0
+
+# Classes sent to a process at once.
+COURSE_BATCH = 64
+
+# Stands in for the department of classes listed before a page's first department header, as a
+# worker process can't know the department the previous page ended with.
+PENDING_DEPT = '\x00'
+
+# Where runner saves the prepared classes, one per line, and where each quarter's go when
+# scraping several. Add .gz to gzip them.
+GROUPED_PATH = 'grouped.ndjson'
+QUARTER_GROUPED_PATH = 'grouped {}.ndjson'
+
+# Where incremental_runner remembers each subject's fingerprint and teachers between runs.
+INCREMENTAL_PATH = 'incremental.json'
+
+# How each page's HTML is turned into class strings. One of EXTRACTORS: 'lxml' or 'bs4'.
+EXTRACTOR = 'lxml'
 
 # A timestamp for the scrape in year-month-day-hour-minute.
 TIMESTAMP = int(time.strftime("%Y%m%d%H%M"))
@@ -34,6 +79,9 @@ SUBJECTS_URL = 'http://blink.ucsd.edu/instructors/courses/schedule-of-classes/su
 
 CATALOG_URL = 'http://www.ucsd.edu/catalog/courses/'
 
+# Pulls the department code out of a department header. Ex: Anthropology (ANTH).
+DEPT_REGEX = re.compile(r'\((.*?)\)')
+
 # Input data besides classes.
 POST_DATA = {'loggedIn': 'false', 'instructorType': 'begin', 'titleType': 'contain',
              'schDay': ['M', 'T', 'W', 'R', 'F', 'S'], 'schedOption1': 'true',
@@ -80,407 +128,445 @@ def get_quarters():
 def get_subjects():
     '''Gets all the subjects listed in select menu.'''
 
-    subject_post = requests.post(SUBJECTS_URL)
+    subject_post = SESSION.get(SUBJECTS_URL)
     soup = BeautifulSoup(subject_post.content, 'lxml').findAll('td')
 
     return {'selectedSubjects': [i.text for i in soup if len(i.text) <= 4]}
 
 
-def setup():
-    '''Updates post request with quarter and subjects selected. Also gets NUMBER_PAGES.'''
+class ScrapeContext(object):
+    '''Everything the scrape of one quarter needs: its term, subjects, post request, number of
+       pages and a session of its own. The site remembers the last search of each session, so
+       quarters scraped at the same time each need their own.'''
 
-    # Global Variable.
-    global NUMBER_PAGES
+    def __init__(self, term, subjects, session=None):
+        self.term = term
+        self.subjects = subjects
+        self.post_data = dict(POST_DATA, selectedTerm=term, selectedSubjects=subjects)
+        self.session = session or httpcache.session()
+        self.number_pages = 0
 
-    # The subjects to parse.
-    POST_DATA.update({'selectedTerm': get_quarters()[0]})
-    # POST_DATA.update({'selectedTerm': "SP18"})
-    # POST_DATA.update({'selectedTerm': "WI18"})
+    def search(self):
+        '''Submits the search of this quarter and gets its number of pages.'''
 
-    # The quarter to parse.
-    POST_DATA.update(get_subjects())
-    # POST_DATA.update({'selectedSubjects': ['CSE', 'ANTH']})
+        self.number_pages = count_pages(self.post_data, self.session)
 
-    # The total number of pages to parse.
-    post = str(SESSION.post(SOC_URL, data=POST_DATA, stream=True).content)
-    NUMBER_PAGES = int(re.search(r"of&nbsp;([0-9]*)", post).group(1))
+        return self.number_pages
 
-    return POST_DATA['selectedTerm']
+    def url_page_tuple(self):
+        return ((SOC_URL + str(x), x) for x in range(1, self.number_pages + 1))
 
+    def iter_pages(self, teacher_email_map, workers=WORKERS, run=None):
+        '''Yields the list of class strings of each page of the last search, in page order. Pages
+           are checkpointed in run, a checkpoint.Run, if given.'''
 
-def get_data(url_page_tuple):
-    '''Parses the data of all pages.'''
+        return parse_pages(self.fetch_pages(workers, run), teacher_email_map, self.number_pages)
 
-    # Cache NUMBER_PAGES & SESSION to avoid calls to global vars.
-    master = []
-    total = NUMBER_PAGES
-    s = SESSION
+    def fetch_pages(self, workers=WORKERS, run=None):
+        '''Yields (page number, raw HTML) pairs for every page of the last search, in page order.
+           Pages are checkpointed in run, a checkpoint.Run, if given.'''
 
-    # Teacher name email mappings.
-    teacher_email_map = {}
+        if run is not None:
+            return checkpointed_pages(self.url_page_tuple(), run, workers, self.session)
+
+        return fetch_pages(self.url_page_tuple(), workers, session=self.session)
+
+
+def setup(term=None, subjects=None):
+    '''Makes the context of a quarter with the subjects selected and searches it for its
+       number of pages. Defaults to the most recent quarter and every subject.'''
+
+    # The quarter to parse, ex: "SP18".
+    term = term or get_quarters()[0]
+
+    # The subjects to parse, ex: ['CSE', 'ANTH'].
+    subjects = subjects or get_subjects()['selectedSubjects']
+
+    context = ScrapeContext(term, subjects)
+    context.search()
+
+    return context
 
-    for url, page in url_page_tuple:
-        # Occasionally, the first call will fail.
-        try:
-            post = s.get(url, stream=True)
-        except requests.exceptions.HTTPError:
-            post = s.get(url, stream=True)
 
-        # Parse the response into HTML and look only for tr tags.
-        tr_elements = BeautifulSoup(post.content, 'lxml').findAll('tr')
+def search_key(post_data):
+    '''A short name for a search, the same from one run to the next.'''
 
-        # This will contain all the classes for a single page.
-        page_list = []
+    return hashlib.sha1(json.dumps(post_data, sort_keys=True).encode('utf_8')).hexdigest()
+
+
+def count_pages(post_data, session=None):
+    '''Submits a search and returns how many pages of results it has. The pages the session
+       fetches next are cached under the search, as their urls are the same for every search.'''
+
+    session = session or SESSION
+    response = session.post(SOC_URL, data=post_data, stream=True)
+    session.headers[httpcache.CACHE_KEY_HEADER] = search_key(post_data)
+
+    # Otherwise an error page would look like a search without results.
+    response.raise_for_status()
+
+    post = str(response.content)
+    match = re.search(r"of&nbsp;([0-9]*)", post)
+
+    # Subjects without any classes this quarter have no pages.
+    return int(match.group(1)) if match else 0
+
+
+def fetch_page(url, session=None):
+    '''Fetches a single page of results and returns its raw HTML. Raises requests' HTTPError
+       if the page couldn't be fetched.'''
+
+    session = session or SESSION
+
+    # Paced and retried by controller.CONTROLLER, under the http cache.
+    post = session.get(url, stream=True)
+
+    # An error page once retries run out would parse as a page without classes. Raising instead
+    # keeps it out of the checkpoint, so resuming the run fetches it again.
+    post.raise_for_status()
+
+    return post.content
+
+
+def extract_rows_bs4(content, teacher_email_map, current_dept=None):
+    '''Reference extractor. Builds the whole BeautifulSoup tree of a page and pulls the
+       class strings out of its tr tags.'''
+
+    # Parse the response into HTML and look only for tr tags.
+    tr_elements = BeautifulSoup(content, 'lxml').findAll('tr')
+
+    # This will contain all the classes for a single page.
+    page_list = []
+
+    for item in tr_elements:
+        parsed_text = str(" ".join(item.text.split()).encode('utf_8'))
+
+        # Changes department if tr_element looks like a department header.
+        try:
+            current_dept = str(
+                re.search(r'\((.*?)\)', item.td.h2.text).group(1))
+        except AttributeError:
+            pass
 
-        for item in tr_elements:
-            parsed_text = str(" ".join(item.text.split()).encode('utf_8'))
+        # The header of each class: units, department, course number, etc..
+        if 'Units' in parsed_text:
+            page_list.append(' NXC')
+            page_list.append(current_dept + " " + parsed_text.partition(' Prereq')[0])
 
-            # Changes department if tr_element looks like a department header.
+        # Exam Information & Section information (and Email).
+        else:
             try:
-                current_dept = str(
-                    re.search(r'\((.*?)\)', item.td.h2.text).group(1))
-            except AttributeError:
+                item_class = item['class'][0]
+
+                if 'nonenrtxt' == item_class and any(x in parsed_text for x in ('FI', 'MI')):
+                    page_list.append('****' + parsed_text)
+
+                elif 'sectxt' == item_class and 'Cancelled' not in parsed_text:
+                    page_list.append('....' + parsed_text)
+
+                    # Check for an email add it to mapping.
+                    try:
+                        for i in item.findAll('a'):
+                            teacher_email_map[i.text.strip()] = i['href'][7:].strip()
+                    except TypeError:
+                        pass
+
+            except KeyError:
                 pass
 
-            # The header of each class: units, department, course number, etc..
-            if 'Units' in parsed_text:
-                page_list.append(' NXC')
-                page_list.append(current_dept + " " + parsed_text.partition(' Prereq')[0])
+    return page_list, current_dept
 
-            # Exam Information & Section information (and Email).
-            else:
-                try:
-                    item_class = item['class'][0]
 
-                    if 'nonenrtxt' == item_class and any(x in parsed_text for x in ('FI', 'MI')):
-                        page_list.append('****' + parsed_text)
+def decode_page(content):
+    '''A page as unicode, decoded like BeautifulSoup does. Pages without a charset are tried as
+       utf-8 first, which is quicker than BeautifulSoup guessing.'''
 
-                    elif 'sectxt' == item_class and 'Cancelled' not in parsed_text:
-                        page_list.append('....' + parsed_text)
+    if EncodingDetector.find_declared_encoding(content, is_html=True) is None:
+        try:
+            return content.decode('utf_8_sig')
+        except UnicodeDecodeError:
+            pass
 
-                        # Check for an email add it to mapping.
-                        try:
-                            for i in item.findAll('a'):
-                                teacher_email_map[i.text.strip()] = i['href'][7:].strip()
-                        except TypeError:
-                            pass
+    return UnicodeDammit(content, is_html=True).unicode_markup
 
-                except KeyError:
-                    pass
+
+def extract_rows_lxml(content, teacher_email_map, current_dept=None):
+    '''Fast extractor. Walks the lxml tree directly and produces exactly the same class
+       strings as extract_rows_bs4 without building a BeautifulSoup tree. Pages are decoded
+       the same way too, so pages without a charset keep their utf-8 names.'''
+
+    # This will contain all the classes for a single page.
+    page_list = []
+    dept_regex = DEPT_REGEX
+
+    # lxml reads bytes without a charset as Latin-1.
+    if isinstance(content, bytes):
+        content = decode_page(content)
+
+    for item in lxml_html.fromstring(content).iter('tr'):
+        parsed_text = str(" ".join(item.text_content().split()).encode('utf_8'))
+
+        # Changes department if tr_element looks like a department header.
+        td = item.find('.//td')
+        h2 = td.find('.//h2') if td is not None else None
+
+        if h2 is not None:
+            match = dept_regex.search(h2.text_content())
+
+            if match:
+                current_dept = str(match.group(1))
+
+        # The header of each class: units, department, course number, etc..
+        if 'Units' in parsed_text:
+            page_list.append(' NXC')
+            page_list.append(current_dept + " " + parsed_text.partition(' Prereq')[0])
+            continue
+
+        # Exam Information & Section information (and Email).
+        item_class = item.get('class')
+
+        if not item_class:
+            continue
+
+        item_class = item_class.split()[0]
+
+        if 'nonenrtxt' == item_class and any(x in parsed_text for x in ('FI', 'MI')):
+            page_list.append('****' + parsed_text)
+
+        elif 'sectxt' == item_class and 'Cancelled' not in parsed_text:
+            page_list.append('....' + parsed_text)
+
+            # Check for an email add it to mapping. Stops at the first link without one.
+            for i in item.iter('a'):
+                href = i.get('href')
+
+                if href is None:
+                    break
+
+                teacher_email_map[i.text_content().strip()] = href[7:].strip()
+
+    return page_list, current_dept
+
+
+# Available extractors. bs4 is the reference the others must match.
+EXTRACTORS = {'bs4': extract_rows_bs4, 'lxml': extract_rows_lxml}
+
+
+def parse_page(content, teacher_email_map, current_dept=None, extractor=None):
+    '''Parses the HTML of a single page into its list of class strings. Also returns the
+       department last seen so a class continuing on the next page keeps its department.'''
+
+    return EXTRACTORS[extractor or EXTRACTOR](content, teacher_email_map, current_dept)
+
+
+def fetch_pages(url_page_tuple, workers=WORKERS, buffer_size=BUFFER_SIZE, session=None):
+    '''Yields (page number, raw HTML) pairs in page order. Pages are fetched by a pool of
+       worker threads, but never more than buffer_size pages ahead of the page being consumed.'''
+
+    if workers <= 1:
+        for url, page in url_page_tuple:
+            yield page, fetch_page(url, session)
+        return
+
+    pool = ThreadPool(workers)
+    pending = deque()
+
+    try:
+        for url, page in url_page_tuple:
+            pending.append((page, pool.apply_async(fetch_page, (url, session))))
+
+            # Wait on the oldest request once the window is full.
+            if len(pending) >= buffer_size:
+                page, result = pending.popleft()
+                yield page, result.get()
+
+        while pending:
+            page, result = pending.popleft()
+            yield page, result.get()
+    finally:
+        pool.terminate()
+
+
+def checkpointed_pages(url_page_tuple, run, workers=WORKERS, session=None):
+    '''fetch_pages, but pages saved in run, a checkpoint.Run, are read back instead of fetched
+       and every page fetched is saved there before it is yielded.'''
+
+    url_page_tuple = list(url_page_tuple)
+    saved = run.pages()
+
+    # Pages still missing, fetched in page order alongside the saved ones.
+    fetched = fetch_pages([(url, page) for url, page in url_page_tuple if page not in saved], workers, session=session)
+
+    for _, page in url_page_tuple:
+        if page in saved:
+            yield page, run.load_page(page)
+        else:
+            page, content = next(fetched)
+            run.save_page(page, content)
+
+            yield page, content
+
+
+def iter_pages(url_page_tuple, teacher_email_map, workers=WORKERS, total=None, session=None):
+    '''Yields the list of class strings of each page as soon as it arrives, in page order.
+       Fills teacher_email_map as it goes. total is only used to print progress.'''
+
+    return parse_pages(fetch_pages(url_page_tuple, workers, session=session), teacher_email_map, total)
+
+
+def parse_pages(pages, teacher_email_map, total=None):
+    '''Yields the list of class strings of each page in the (page number, raw HTML) pairs from
+       fetch_pages or checkpointed_pages.'''
+
+    current_dept = None
+
+    for page, content in pages:
+        page_list, current_dept = parse_page(content, teacher_email_map, current_dept)
 
         print("Completed Page {} of {}".format(page, total))
-        master.append(page_list)
+        yield page_list
+
+
+def get_data(url_page_tuple, workers=WORKERS, session=None):
+    '''Parses the data of all pages.'''
+
+    # Teacher name email mappings.
+    teacher_email_map = {}
+
+    master = list(iter_pages(url_page_tuple, teacher_email_map, workers, session=session))
 
     return teacher_email_map, master
 
 
-def format_list(lst):
-    '''Formats the result list into the one we want.'''
+def extract_page(content):
+    '''parse_page for a worker process. Classes before the page's first department header get
+       PENDING_DEPT. Returns the class strings, the last department or PENDING_DEPT, and the emails.'''
 
-    # Flattens list of lists into list.
-    parsed = (item for sublist in lst for item in sublist)
+    teacher_email_map = {}
+    page_list, current_dept = parse_page(content, teacher_email_map, PENDING_DEPT)
 
-    # Groups list into lists of lists based on a delimiter word.
-    regrouped = (list(y) for x, y in itertools.groupby(
-        parsed, lambda z: z == ' NXC') if not x)
+    return page_list, current_dept, teacher_email_map
 
-    # Sorts list based on sorting criteria.
-    non_canceled = (x for x in regrouped if 'Cancelled' not in x)
 
-    # Gets rid of classes without 6-digit identifications.
-    return (x for x in non_canceled if re.findall(r"\D(\d{6})\D", str(x)))
+def stitch_pages(results, teacher_email_map, current_dept=None):
+    '''Puts extract_page results back together in page order: fills in the departments each page
+       continued from the one before it and merges the emails. Yields each page's class strings.'''
 
+    for page_list, last_dept, page_emails in results:
+        if any(item.startswith(PENDING_DEPT) for item in page_list):
+            page_list = [current_dept + item[len(PENDING_DEPT):] if item.startswith(PENDING_DEPT) else item
+                         for item in page_list]
 
-def parse_list(results):
-    '''Parses the list elements into their readable values to store.'''
+        if last_dept != PENDING_DEPT:
+            current_dept = last_dept
 
-    parsed = []
+        teacher_email_map.update(page_emails)
 
-    for lst in results:
-        # Components of a class.
-        header = {}
-        final = {}
-        midterm = {}
-        seats = {}
-        all_sections = {}
-        counter = 0
-
-        number_regex = re.compile(r'\d+')
-
-        for item in lst:
-            # Find class information.
-            if 'Units' in item:
-                c_department = item.partition(' ')[0]
-                num_loc = number_regex.search(item).start()
-                c_number = item[num_loc:].partition(' ')[0]
-                temp = item.partition('( ')
-
-                # Department, Course Number, Name, and Units.
-                header["department"] = c_department
-                header["course number"] = c_number
-                header["course name"] = temp[0][len(
-                    c_number) + 1 + num_loc: -1]
-                header["units"] = temp[2].partition(')')[0]
-
-                # Restrictions.
-                header["restrictions"] = "No Restrictions"
-
-                if num_loc != len(c_department) + 1:
-                    header["restrictions"] = item[len(
-                        c_department) + 1: num_loc - 1]
-
-            # Finds Section Info.
-            if '....' in item:
-                section = {}
-
-                counter += 1
-
-                number_regex = re.compile(r'\d+')
-                days_regex = re.compile(r'[A-Z][^A-Z]*')
-                num_loc = number_regex.search(item).start()
-
-                to_parse = item.split(' ')
-                # section_num = "section " + str(counter)
-
-                # ID.
-                if num_loc == 4:
-                    section["id"] = item[4:10].strip()
-                    to_parse = to_parse[1:]
-                else:
-                    section["id"] = 'Blank'
-                    to_parse[0] = to_parse[0][4:]
-
-                # Meeting type and Section.
-                section["meeting type"] = to_parse[0]
-                section["number"] = to_parse[1]
-
-                # Readjust the list.
-                to_parse = to_parse[2:]
-
-                # Days: so MWF would have separate entries, M, W, F. Max = 5, assumed Blank.
-                if to_parse[0] != 'TBA':
-                    temp = days_regex.findall(to_parse[0])
-                    section["day 1"] = 'Blank'
-                    section["day 2"] = 'Blank'
-                    section["day 3"] = 'Blank'
-                    section["day 4"] = 'Blank'
-                    section["day 5"] = 'Blank'
-
-                    # Changes whatever is available.
-                    try:
-                        section["day 1"] = temp[0]
-                        section["day 2"] = temp[1]
-                        section["day 3"] = temp[2]
-                        section["day 4"] = temp[3]
-                        section["day 5"] = temp[4]
-                    except IndexError:
-                        pass
+        yield page_list
 
-                    to_parse = to_parse[1:]
-                else:
-                    pass
 
-                # The times. Assume TBA.
-                section["start time"] = "TBA"
-                section["end time"] = "TBA"
-                section["start time am"] = True
-                section["end time am"] = True
+def parse_course_batch(batch):
+    '''Parses a batch of classes into sections.Course records, in a worker process.'''
 
-                if to_parse[0] != 'TBA':
-                    time_tuples = to_parse[0].partition('-')[::2]
+    return [sections.parse_course(lst) for lst in batch]
 
-                    section["start time"] = time_tuples[0][:-1]
-                    section["end time"] = time_tuples[1][:-1]
 
-                    section["start time am"] = False if time_tuples[0][-1] != "a" else True
-                    section["end time am"] = False if time_tuples[1][-1] != "a" else True
+def batches(iterable, size):
+    '''Yields lists of up to size items from iterable.'''
 
-                    to_parse = to_parse[1:]
+    iterator = iter(iterable)
 
-                # Adjust list because time was given, but not building or room.
-                if (len(to_parse) > 1) and (to_parse[0] == to_parse[1] == 'TBA'):
-                    to_parse = to_parse[1:]
+    while True:
+        batch = list(itertools.islice(iterator, size))
 
-                # The Building. Assume Blank.
-                section["building"] = 'Blank'
+        if not batch:
+            return
 
-                if to_parse[0] != 'TBA':
-                    section["building"] = to_parse[0]
-                    to_parse = to_parse[1:]
+        yield batch
 
-                # The Room.
-                section["room"] = to_parse[0] if to_parse[0] != 'TBA' else 'Blank'
 
-                # Readjust the list.
-                to_parse = ' '.join(to_parse[1:])
+def parse_pages_in_processes(contents, teacher_email_map, processes=None, validator=None):
+    '''Yields the sections.Course record of every class in the raw pages, in order, using a pool
+       of processes. Pages are extracted by the workers and stitched together here, then classes
+       are sent back in batches to be parsed. Create it before any threads start, ex: before
+       fetching, as the workers are forked. With a validate.Validator, only the classes it
+       lets through are yielded.'''
 
-                # Find position of first number in string.
-                try:
-                    num_loc = number_regex.search(to_parse).start()
-                except AttributeError:
-                    num_loc = 0
-
-                # Assume Blank.
-                section["name"] = 'Blank'
-                section["seats taken"] = 'Blank'
-                section["seats available"] = 'Blank'
-
-                # Note for seat enrollments:
-                # A. WAITLIST FULL, the seats taken is the amount over plus the seats available.
-                # B. UNLIMITED seats, the seats taken is max integer.
-                # C. None of those, the seats taken is a positive interger.
-
-                # Handles Teacher, Seats Taken, and Seats Offered.
-                if 'FULL' in to_parse:
-                    temp = to_parse.find('FULL')
-
-                    if temp != 0:
-                        if 'Staff' in to_parse:
-                            section["name"] = 'Staff'
-                        else:
-                            section["name"] = to_parse[:temp - 1]
-
-                    # Adjust String.
-                    to_parse = to_parse[temp:]
-
-                    taken = int(to_parse[to_parse.find(
-                        '(') + 1:to_parse.find(')')])
-                    taken += int(to_parse[(to_parse.find(')') + 2):])
-
-                    # Seat Information: Amount of seats taken (WAITLIST Full).
-                    seat_tracking = (taken, int(to_parse[(to_parse.find(')') + 2):]))
-                    section["seats taken"] = taken
-                    section["seats available"] = int(to_parse[(to_parse.find(')') + 2):])
-
-                elif 'Unlim' in to_parse:
-                    if 'Staff ' in to_parse:
-                        section["name"] = 'Staff'
-                    else:
-                        section["name"] = to_parse[:to_parse.find('Unlim') - 1]
-
-                    # Seat information. -1 indicates unlimited seats.
-                    seat_tracking = (sys.maxint, sys.maxint)
-                    section["seats taken"] = sys.maxint
-                    section["seats available"] = sys.maxint
-
-                # Name and seat information.
-                elif num_loc != 0:
-                    section["name"] = to_parse[:num_loc].strip()
-
-                    temp = to_parse[num_loc:].strip().split(' ')
-
-                    # Amount of seats taken (has seats left over.
-                    seat_tracking = (int(temp[0]), int(temp[1]))
-                    section["seats taken"] = int(temp[0])
-                    section["seats available"] = int(temp[1])
-
-                # Just staff and no seat information.
-                elif to_parse.strip() == 'Staff':
-                    section["name"] = 'Staff'
-
-                # Name and no seat information. Blanks for both the seat information.
-                elif num_loc == 0 and ',' in to_parse:
-                    section["name"] = to_parse.strip()
-
-                # No name but seat info - think discussion sections without teacher name.
-                elif num_loc == 0 and to_parse:
-                    try:
-                        temp = to_parse.split(' ')
-
-                        seat_tracking = (int(temp[0]), int(temp[1]))
-                        section["seats taken"] = int(temp[0])
-                        section["seats available"] = int(temp[1])
-
-                    except IndexError:
-                        print("ERROR")
-                        sys.exit()
-
-                # Add section to all_section dictionary.
-                all_sections[counter] = section
-
-            # Finds Final / Midterm Info.
-            if '****' in item:
-                exam = item.split(' ')
-                exam_info = {}
-
-                # Handle Timing, day, seats, and location. NOTE: section is really a substitute key for the day of the final.
-                exam_info["number"] = exam[1]
-                exam_info["day 1"] = exam[2]
-                exam_info["building"] = 'Blank'
-                exam_info["room"] = 'Blank'
-                exam_info["seats taken"] = 'Blank'
-                exam_info["seats available"] = 'Blank'
-
-                if (len(exam) == 6):
-                    exam_info["building"] = exam[4]
-                    exam_info["room"] = exam[5]
-
-                # Assume they are problematic and then change them if not.
-                exam_info["start time"] = "TBA"
-                exam_info["end time"] = "TBA"
-                exam_info["start time am"] = True
-                exam_info["end time am"] = True
-
-                # The start and end times.
-                if exam[3] != 'TBA':
-                    time_tuples = exam[3].partition('-')[::2]
-
-                    exam_info["start time"] = time_tuples[0][:-1]
-                    exam_info["end time"] = time_tuples[1][:-1]
-
-                    if time_tuples[0][-1] != "a":
-                        exam_info["start time am"] = False
-                    if time_tuples[1][-1] != "a":
-                        exam_info["end time am"] = False
-
-                if 'FI' in item:
-                    exam_info["meeting type"] ="FI"
-                    final = exam_info
-                else:
-                    exam_info["meeting type"] = "MI"
-                    midterm = exam_info
+    pool = Pool(processes or PROCESSES or None)
 
-        # Uses first 6-digit id as key.
-        key = int(re.findall(r"\D(\d{6})\D", str(lst))[0])
-        seats = {TIMESTAMP: seat_tracking}
+    try:
+        pages = stitch_pages(pool.imap(extract_page, contents), teacher_email_map)
+        classes = batches(format_list(pages), COURSE_BATCH)
 
-        temp = {"section": all_sections, "midterm": midterm}
-        temp["final"] = final
-        temp["seats"] = seats
-        temp["key"] = key
-        temp.update(header)
+        if validator is not None:
+            for batch in pool.imap(validate.parse_batch, classes):
+                for course in validator.validate_parsed(batch):
+                    yield course
+        else:
+            for batch in pool.imap(parse_course_batch, classes):
+                for course in batch:
+                    yield course
+    finally:
+        pool.terminate()
 
-        parsed.append(temp)
 
-    return parsed
+def scrape_subject(context, subject, teacher_email_map):
+    '''Searches a single subject of a quarter and returns the class strings of each of its pages.'''
 
+    subject_context = ScrapeContext(context.term, [subject], context.session)
+    subject_context.search()
 
-def check_collision(lst):
-    '''Compares all keys and makes sure they are unique.'''
+    return list(subject_context.iter_pages(teacher_email_map))
 
-    seen = set()
-    differences = []
 
-    for item in lst:
-        if item["key"] in seen:
-            differences.append(item["key"])
-        else:
-            seen.add(item["key"])
+def fingerprint(pages):
+    '''A hash of every class string of a subject. Changes whenever anything listed does, seats included.'''
+
+    digest = hashlib.sha1()
+
+    for page_list in pages:
+        for item in page_list:
+            digest.update(item if isinstance(item, bytes) else item.encode('utf_8'))
+            digest.update(b'\n')
+
+    return digest.hexdigest()
+
+
+def format_list(lst):
+    '''Formats the result list into the one we want.'''
+
+    # Flattens list of lists into list. Everything here is lazy, so lst can be a generator of
+    # pages and a class split across two pages is regrouped as soon as the second page arrives.
+    parsed = (item for sublist in lst for item in sublist)
+
+    # Groups list into lists of lists based on a delimiter word.
+    regrouped = (list(y) for x, y in itertools.groupby(
+        parsed, lambda z: z == ' NXC') if not x)
+
+    # Sorts list based on sorting criteria.
+    non_canceled = (x for x in regrouped if 'Cancelled' not in x)
+
+    # Gets rid of classes without 6-digit identifications.
+    return (x for x in non_canceled if re.findall(r"\D(\d{6})\D", str(x)))
 
-    # This will print the sizes. If collision, they will be different.
-    print("")
-    print("---Diagonistic Information---")
-    print("  - # of keys: " + str(len(seen) + len(differences)))
-    print("  - # of unique keys: " + str(len(seen)))
-    print("  - Note: We want them to be the same.")
-    print("")
 
-    # This code will print the keys that collided in a list.
-    if differences:
-        print(differences)
-        return True
+def parse_list(results):
+    '''Parses the list elements into their readable values to store.'''
 
-    return False
+    return list(iter_parse_list(results))
+
+
+def iter_parse_list(results):
+    '''Parses each list element into its readable values as soon as it is available.'''
+
+    for lst in results:
+        yield sections.course_to_dict(sections.parse_course(lst), TIMESTAMP)
+
+
+def parse_courses(results):
+    '''Parses each list element into a compact sections.Course record.'''
+
+    return (sections.parse_course(lst) for lst in results)
 
 
 def group_list(lst):
@@ -495,46 +581,62 @@ def group_list(lst):
     return composite
 
 
-def prepare_for_db(dict, teacher_email_mapping):
+def group_courses(courses):
+    """ group_list for sections.Course records: class code -> {number of its first section: record}."""
+
+    composite = defaultdict(dict)
+
+    for course in courses:
+        composite[course.department + " " + course.number][course.sections[0].number] = course
+
+    return composite
+
+
+def prepare_for_db(dict, teacher_email_mapping, catalog=None):
     """ Groups teachers and classes they teach as well as makes some data 
         (course name, department, etc) first level in our db schema for easy access.
-        Also expands restriction codes to full abbreviations."""
-
-    database = firebase.FirebaseApplication(FIREBASE_DB)
+        Also expands restriction codes to full abbreviations. Titles, descriptions and
+        prerequisites come from catalog, a catalog_index.CatalogIndex, loaded if not given."""
 
     # Email and then list of classes.
     grouped_by_teachers = defaultdict(lambda: [set(), set()])
 
+    for _ in iter_prepared(dict, teacher_email_mapping, grouped_by_teachers, catalog):
+        pass
+
+    return dict, finish_teachers(grouped_by_teachers)
+
+
+def iter_prepared(dict, teacher_email_mapping, grouped_by_teachers, catalog=None):
+    """ prepare_for_db one class at a time, yielding (code, class) as soon as each is ready so
+        it can be written out right away. Teachers are added to grouped_by_teachers, a
+        defaultdict(lambda: [set(), set()]), to be finished by finish_teachers."""
+
+    if catalog is None:
+        catalog = catalog_index.load(FIREBASE_DB)
+
     for i in dict:
 
-        first_section = dict[i][dict[i].iterkeys().next()]
+        first_section = dict[i][next(iter(dict[i]))]
         code = first_section['department'] + " " + first_section['course number']
         title = first_section['course name']
         key = first_section['key']
         units = first_section['units'][:-6]
         waitlist = 'true'
 
-        for j in dict[i].keys():
+        for j in list(dict[i].keys()):
             
             if 'day 1' in dict[i][j]['final']:
                 dict[i][j]['final']['days'] = dict[i][j]['final']['day 1'].replace('Th', 'R').replace('Tu', 'T')
                 del dict[i][j]['final']['day 1']
 
             if 'start time am' in dict[i][j]['final']:
-                if not dict[i][j]['final']['start time am']:
-                    start = dict[i][j]['final']['start time'].split(':')
-                    if (int(start[0]) != 12):
-                        dict[i][j]['final']['start time'] = str(int(start[0]) + 12) + ":" + start[1]
-
-                del dict[i][j]['final']['start time am']
+                dict[i][j]['final']['start time'] = sections.to_24_hour(dict[i][j]['final']['start time'],
+                                                                        dict[i][j]['final'].pop('start time am'))
 
             if 'end time am' in dict[i][j]['final']:
-                if not dict[i][j]['final']['end time am']:
-                    end = dict[i][j]['final']['end time'].split(':')
-                    if (int(end[0]) != 12):
-                        dict[i][j]['final']['end time'] = str(int(end[0]) + 12) + ":" + end[1]
-
-                del dict[i][j]['final']['end time am']
+                dict[i][j]['final']['end time'] = sections.to_24_hour(dict[i][j]['final']['end time'],
+                                                                      dict[i][j]['final'].pop('end time am'))
 
             for k in dict[i][j]['section'].keys():
                 name = dict[i][j]['section'][k]['name']
@@ -543,7 +645,7 @@ def prepare_for_db(dict, teacher_email_mapping):
 
                 # Flatten days -------------------------
                 days = []
-                for key, val in dict[i][j]['section'][k].items():
+                for key, val in list(dict[i][j]['section'][k].items()):
                     if 'day' in key:
                         if val is not 'Blank':
                             days.append((int(key[-1:]), val))
@@ -562,20 +664,11 @@ def prepare_for_db(dict, teacher_email_mapping):
                     dict[i][j]['section'][k]['days'] = ''.join(days)
                 # ---------------------------------------
 
-                # Flatten time signatures ---------------
-                if not (dict[i][j]['section'][k]['end time am']):
-                    end = dict[i][j]['section'][k]['end time'].split(':')
-                    if (int(end[0]) != 12):
-                        dict[i][j]['section'][k]['end time'] = str(int(end[0]) + 12) + ":" + end[1]
-
-                if not (dict[i][j]['section'][k]['start time am']):
-                    start = dict[i][j]['section'][k]['start time'].split(':')
-                    if (int(start[0]) != 12):
-                        dict[i][j]['section'][k]['start time'] = str(int(start[0]) + 12) + ":" + start[1]
-
-                # Delete unnecessary keys.
-                del dict[i][j]['section'][k]['start time am']
-                del dict[i][j]['section'][k]['end time am']
+                # Flatten time signatures, dropping the am flags ---------------
+                dict[i][j]['section'][k]['start time'] = sections.to_24_hour(dict[i][j]['section'][k]['start time'],
+                                                                             dict[i][j]['section'][k].pop('start time am'))
+                dict[i][j]['section'][k]['end time'] = sections.to_24_hour(dict[i][j]['section'][k]['end time'],
+                                                                           dict[i][j]['section'][k].pop('end time am'))
                 # ----------------------------------------
 
                 try:
@@ -587,15 +680,16 @@ def prepare_for_db(dict, teacher_email_mapping):
                     grouped_by_teachers[name.replace('.', "")][0].add(dict[i][j]['section'][k]['email'])
                     grouped_by_teachers[name.replace('.', "")][1].add(i)
 
-            first, second = dict[i][j]['seats'][dict[i][j]['seats'].keys()[0]]
+            first, second = next(iter(dict[i][j]['seats'].values()))
 
             if ('restrictions' not in dict[i]):
                 temp = ""
                 for val in dict[i][j]['restrictions'].strip().split(" "):
-                    if val is not '':
+                    # Skips anything that isn't a code, like the words of "No Restrictions".
+                    if val in restrictions:
                         temp += restrictions[val] + ", "
 
-                dict[i]['restrictions'] = temp
+                dict[i]['restrictions'] = temp if temp else "None, "
 
 
             if first < second:
@@ -608,9 +702,7 @@ def prepare_for_db(dict, teacher_email_mapping):
             del dict[i][j]['course name']
             del dict[i][j]['key']
 
-        path = "/catalog/" + str(i)
-
-        val = database.get(path, None)
+        val = catalog.get(i)
 
         try:
             dict[i]['description'] = val['description']
@@ -626,24 +718,127 @@ def prepare_for_db(dict, teacher_email_mapping):
         dict[i]['units'] = units
         dict[i]['dei'] = 'true' if code in DEI else 'false'
 
+        yield i, dict[i]
+
+
+def prepare_courses(grouped, teacher_email_mapping, grouped_by_teachers, catalog=None, sections_table=None):
+    """ Builds each class of the db schema in one go from the sections.Course records of
+        group_courses, yielding (code, class) like iter_prepared. The classes are the same,
+        but parse_list's dictionaries are never made and nothing is changed in place.
+        Teachers are added to grouped_by_teachers, to be finished by finish_teachers. With
+        sections_table, a table.SectionTable of the records, the times and days of each
+        record's sections are turned into text at once."""
+
+    if catalog is None:
+        catalog = catalog_index.load(FIREBASE_DB)
+
+    # The text of every field of every section, as references. Dictionaries are made per class.
+    columns = sections_table.db_columns() if sections_table is not None else None
+
+    section_to_db = sections.section_to_db
+    blank_seats = (sections.BLANK, sections.BLANK)
+
+    # Names that aren't teachers, and each teacher's name without periods.
+    not_teachers = ("", "Staff", "Blank")
+    teachers = {}
+
+    # Restriction codes already expanded, and DEI as a set.
+    expanded = {}
+    dei = set(DEI)
+
+    for code, courses in grouped.items():
+        first = next(iter(courses.values()))
+        prepared = {}
+        waitlist = 'true'
+
+        for number, course in courses.items():
+            prepared_sections = {}
+
+            if sections_table is not None:
+                # Only this record's rows are turned into dictionaries, as the class is prepared.
+                row = sections_table.first[id(course)]
+                db_sections = sections_table.db_sections(row, row + len(course.sections), columns)
+            else:
+                db_sections = [section_to_db(section) for section in course.sections]
+
+            for index, fields in enumerate(db_sections, 1):
+                prepared_sections[index] = fields
+                name = fields['name']
+                email = fields['email'] = teacher_email_mapping.get(name, 'No Email')
+
+                if name not in not_teachers:
+                    teacher = teachers.get(name)
+                    if teacher is None:
+                        teacher = teachers[name] = grouped_by_teachers[name.replace('.', "")]
+
+                    teacher[0].add(email)
+                    teacher[1].add(code)
+
+            seats = course.seats or blank_seats
+
+            if seats[0] < seats[1]:
+                waitlist = 'false'
+
+            # Restrictions are those of the first record.
+            if 'restrictions' not in prepared:
+                prepared['restrictions'] = expanded.get(course.restrictions) or expand_restrictions(course.restrictions, expanded)
+
+            prepared[number] = {"section": prepared_sections, "midterm": sections.exam_to_dict(course.midterm),
+                                "final": sections.final_to_db(course.final), "seats": {TIMESTAMP: seats}}
+
+        val = catalog.get(code)
+
+        try:
+            prepared['description'] = val['description']
+            prepared['prerequisites'] = val['prerequisites']
+            prepared['title'] = val['title']
+        except TypeError:
+            prepared['description'] = '???'
+            prepared['prerequisites'] = '???'
+            prepared['title'] = first.name
+
+        prepared['waitlist'] = waitlist
+        prepared['code'] = code
+        prepared['units'] = first.units[:-6]
+        prepared['dei'] = 'true' if code in dei else 'false'
+
+        yield code, prepared
+
+
+def expand_restrictions(codes, expanded):
+    """ Restriction codes, ex: 'FR SO', as prepare_for_db spells them out, remembered in expanded."""
+
+    text = codes if codes is not None else "No Restrictions"
+    expanded[codes] = "".join(restrictions[val] + ", " for val in text.strip().split(" ") if val in restrictions) or "None, "
+
+    return expanded[codes]
+
+
+def finish_teachers(grouped_by_teachers):
+    """ Turns the sets of emails and classes of each teacher into an email and a list."""
+
     for i in grouped_by_teachers:
         grouped_by_teachers[i][0] = list(grouped_by_teachers[i][0])[0]
         grouped_by_teachers[i][1] = list(grouped_by_teachers[i][1])
 
-    return dict, grouped_by_teachers
+    return grouped_by_teachers
 
 
-def write_to_db(dictionary, quarter):
-    """ Adds data to firebase."""
+def write_to_db(dictionary, quarter, removed=()):
+    """ Adds data to firebase. The classes in removed are deleted."""
 
     print("Writing information to database.")
 
-    database = firebase.FirebaseApplication(FIREBASE_DB)
-
     path = "/quarter/" + quarter + "/"
 
-    for key in dictionary:
-        database.put(path, key, dictionary[key])
+    # Courses go out in batches of upload.BATCH_SIZE, deletions as nulls in the same PATCHes.
+    with upload.BulkWriter(FIREBASE_DB) as writer:
+        writer.put_all(path, dictionary)
+
+        for code in removed:
+            writer.delete(path + code)
+
+    print("  - {} nodes in {} requests".format(writer.nodes, writer.requests))
 
 
 def write_teachers_to_db(dictionary, quarter):
@@ -651,12 +846,76 @@ def write_teachers_to_db(dictionary, quarter):
 
     print("Writing teacher information to database.")
 
-    database = firebase.FirebaseApplication(FIREBASE_DB)
-
     path = "/quarter/" + quarter + " teachers" + "/"
 
-    for key in dictionary:
-        database.put(path, key, dictionary[key])
+    with upload.BulkWriter(FIREBASE_DB) as writer:
+        writer.put_all(path, dictionary)
+
+    print("  - {} nodes in {} requests".format(writer.nodes, writer.requests))
+
+
+def write_changes_to_db(grouped, grouped_by_teachers, quarter, run=None):
+    """ Adds only what changed since the last upload of the quarter to firebase. With run, a
+        checkpoint.Run, batches sent by an earlier attempt at the same changes are skipped."""
+
+    print("Writing changes to database.")
+
+    published = upload.load_snapshot(quarter)
+    document = upload.normalize({"quarter/" + quarter: grouped, "quarter/" + quarter + " teachers": grouped_by_teachers})
+
+    reuse_seat_timestamps(published.get("quarter/" + quarter, {}), document["quarter/" + quarter])
+
+    # Diffs each class and teacher on its own, so even a first upload goes out in batches.
+    changes = {}
+    for path in document:
+        changes.update(upload.diff(published.get(path, {}), document[path], path + '/'))
+
+    # Sorted so every attempt splits the changes into the same batches.
+    paths = sorted(changes)
+    skipped = 0
+
+    with upload.BulkWriter(FIREBASE_DB) as writer:
+        sent = run.batches(checkpoint.digest(changes)) if run is not None else set()
+
+        for number, start in enumerate(range(0, len(paths), writer.batch_size)):
+            batch = paths[start:start + writer.batch_size]
+
+            if number in sent:
+                skipped += len(batch)
+                continue
+
+            for path in batch:
+                writer.put(path, changes[path])
+
+            writer.flush()
+
+            if run is not None:
+                run.finish_batch(number)
+
+    # Only remembered once everything is uploaded, so a failed upload is sent again next time.
+    upload.save_snapshot(quarter, document)
+
+    print("  - {} changes in {} requests ({} KiB)".format(writer.nodes, writer.requests, writer.bytes // 1024))
+
+    if skipped:
+        print("  - {} changes already sent before resuming".format(skipped))
+
+    return writer
+
+
+def reuse_seat_timestamps(published, grouped):
+    '''Keeps the published timestamp of seats that haven't changed. Otherwise every section
+       would be uploaded again just for its new timestamp.'''
+
+    for code in grouped:
+        for number, value in grouped[code].items():
+            if not isinstance(value, dict) or 'seats' not in value:
+                continue
+
+            seats_published = published.get(code, {}).get(number, {}).get('seats')
+
+            if seats_published and list(seats_published.values()) == list(value['seats'].values()):
+                value['seats'] = seats_published
 
 
 def reset_db():
@@ -668,6 +927,9 @@ def reset_db():
 
     database.delete('/quarter', None)
 
+    # Nothing is published anymore, so the next upload must send everything.
+    shutil.rmtree(upload.SNAPSHOT_DIR, ignore_errors=True)
+
 
 def load_fake_data_into_db():
     """ Adds fake data to firebase for testing and implementing new functionality in the front end."""
@@ -691,51 +953,272 @@ def load_fake_data_into_db():
     })
 
 
-def runner(write_to_db_bool, use_json_bool):
-    # Update POST_DATA and sets NUMBER_PAGES to parse.
-    quarter = setup()
+def runner(write_to_db_bool, use_json_bool, track_seats_bool=False, context=None, catalog=None, grouped_path=GROUPED_PATH, resume=False,
+           track_instructors_bool=False):
+    global TIMESTAMP
+
+    # The last run that didn't finish, of the quarter of context if given.
+    run = checkpoint.Run.latest(context and context.term) if resume else None
+
+    if run is not None:
+        # Searched again for a session that can fetch the missing pages.
+        context = ScrapeContext(run.meta['term'], run.meta['subjects'])
+        context.search()
+
+        # Classes were added or dropped since, so the saved pages no longer line up.
+        if context.number_pages != run.meta['number pages']:
+            print("Not resuming {}: it had {} pages, now {}".format(run.id, run.meta['number pages'], context.number_pages))
+            run = None
+        else:
+            # Stamped like the first attempt, so the output is the same.
+            TIMESTAMP = run.meta['timestamp']
+            print("Resuming {} with {} pages saved".format(run.id, len(run.pages())))
+
+    # The quarter, subjects and number of pages to parse. The latest quarter unless given.
+    context = context or setup()
+    quarter = context.term
+
+    # Every page fetched and batch uploaded is checkpointed, so this run can be resumed.
+    if run is None:
+        run = checkpoint.Run.create(quarter, context.subjects, context.number_pages, TIMESTAMP)
 
     # Prints which quarter we are fetching data from and how many pages.
-    print("Fetching data for {} from {} pages\n".format(quarter, NUMBER_PAGES))
+    print("Fetching data for {} from {} pages\n".format(quarter, context.number_pages))
+
+    # Time spent in each stage, requests made and so on, written to metrics.METRICS_DIR at the end.
+    run_metrics = metrics.Metrics('soc', {'quarter': quarter})
+    run_metrics.count('pages', context.number_pages)
+
+    # Teacher name email mappings, filled in as pages are parsed.
+    teacher_email_mapping = {}
+
+    # Checks each class as it is parsed. Broken classes and reused keys are quarantined, not fatal.
+    validator = validate.Validator(quarter, run_metrics=run_metrics)
+
+    # Pages are fetched and parsed at the same time, so they are measured as one stage.
+    with run_metrics.watch(context.session), run_metrics.stage('scrape'):
+        if (PROCESSES):
+            # Pages are parsed by PROCESSES processes as they arrive. The pool starts before fetching does.
+            finished = list(parse_pages_in_processes((content for _, content in context.fetch_pages(run=run)),
+                                                     teacher_email_mapping, validator=validator))
+
+        else:
+            # Streams the data of every page of the quarter.
+            raw_data = context.iter_pages(teacher_email_mapping, run=run)
+
+            # Format list into proper format.
+            formatted_data = format_list(raw_data)
+
+            # Parses and checks each class into a sections.Course record as its page arrives.
+            finished = list(validator.validate(formatted_data))
+
+    validator.close()
+    validator.report()
 
-    # Gets the data using urls. Input is url, page number pairings.
-    teacher_email_mapping, raw_data = get_data(((SOC_URL + str(x), x) for x in range(1, NUMBER_PAGES + 1)))
+    run_metrics.count('records', len(finished))
 
-    # Format list into proper format.
-    formatted_data = format_list(raw_data)
+    if (track_seats_bool and not run.finished_stage('seats')):
+        with run_metrics.stage('seats'):
+            # Adds the seats of every section to their history, without reading the history first.
+            seats.append(seats.record_samples(finished), TIMESTAMP, seats.quarter_path(quarter))
 
-    # Parses items in list into usable portions.
-    finished = parse_list(formatted_data)
+        run.finish_stage('seats')
 
-    # If our unique ID keys aren't for some reason unique, we want to stop.
-    if check_collision(finished):
-        print("ERROR: Hashing algorithm encountered a collision!")
-        sys.exit()
+    if (track_instructors_bool):
+        with run_metrics.stage('instructors'):
+            # Replaces the quarter's classes in the registry of every instructor.
+            instructors.record(quarter, finished, teacher_email_mapping, replace=True)
 
-    # Groups by class.
-    grouped = group_list(finished)
+    with run_metrics.stage('group'):
+        # Every section as columns, so times and days are written out at once.
+        sections_table = table.SectionTable(finished)
+
+        # Groups by class.
+        grouped_courses = group_courses(finished)
 
     print("GROUPED")
 
-    # Groups teachers and classes and prepares the grouped dictionary for upload by modifiying it.
-    grouped, grouped_by_teachers = prepare_for_db(grouped, teacher_email_mapping)
+    # Email and then list of classes.
+    grouped_by_teachers = defaultdict(lambda: [set(), set()])
 
-    print("GROUPED2")
+    # The prepared classes, kept only for the upload so an export alone holds one class at a time.
+    grouped = {}
+
+    with run_metrics.stage('prepare'):
+        # Groups teachers and classes and builds each class of the db schema.
+        prepared = prepare_courses(grouped_courses, teacher_email_mapping, grouped_by_teachers, catalog, sections_table)
 
-    if (use_json_bool):
-        print("Converting to JSON\n")
-        r = json.dumps(grouped)
+        if (write_to_db_bool):
+            prepared = ((code, grouped.setdefault(code, course)) for code, course in prepared)
 
-        with open("grouped.txt", 'w+') as file:
-            file.write(r)
+        if (use_json_bool):
+            # Each class is written out as soon as it is prepared.
+            print("Exporting to {}\n".format(grouped_path))
+            export.dump(prepared, grouped_path)
+        else:
+            for _ in prepared:
+                pass
+
+        grouped_by_teachers = finish_teachers(grouped_by_teachers)
+
+    print("GROUPED2")
 
     if (write_to_db_bool):
-        # Writes the data to the db.
-        write_to_db(grouped, quarter)
+        with run_metrics.stage('upload'):
+            # Writes the class and teacher data that changed since the last run to the db.
+            writer = write_changes_to_db(grouped, grouped_by_teachers, quarter, run)
+
+        run_metrics.count('firebase writes', writer.nodes)
+        run_metrics.count('firebase requests', writer.requests)
+
+    run.finish()
+
+    print("HTTP cache: " + httpcache.CACHE.report())
+    print("Requests by host:\n" + controller.CONTROLLER.report())
+    print(run_metrics.summary())
+    print("Metrics written to " + run_metrics.write())
+
+
+def multi_runner(write_to_db_bool, use_json_bool, track_seats_bool=False, terms=None, track_instructors_bool=False):
+    '''Runs runner for several quarters at once, every quarter in get_quarters unless given.
+       Each quarter has its own ScrapeContext and writes its classes to QUARTER_GROUPED_PATH.'''
+
+    terms = terms or get_quarters()
+    subjects = get_subjects()['selectedSubjects']
+
+    # Loaded once for every quarter.
+    catalog = catalog_index.load(FIREBASE_DB)
+
+    def run(term):
+        context = ScrapeContext(term, subjects)
+        context.search()
+
+        runner(write_to_db_bool, use_json_bool, track_seats_bool, context, catalog, QUARTER_GROUPED_PATH.format(term),
+               track_instructors_bool=track_instructors_bool)
 
-        # Writes the teacher data to the db.
+    pool = ThreadPool(len(terms))
+
+    try:
+        pool.map(run, terms)
+    finally:
+        pool.terminate()
+
+
+def load_incremental_state(path=INCREMENTAL_PATH):
+    '''Loads the fingerprints and teachers of each subject from the last incremental run.'''
+
+    try:
+        with open(path) as file:
+            return json.load(file)
+    except (IOError, ValueError):
+        return {}
+
+
+def save_incremental_state(state, path=INCREMENTAL_PATH):
+    '''Saves the fingerprints and teachers of each subject for the next incremental run.'''
+
+    with open(path, 'w') as file:
+        json.dump(state, file)
+
+
+def merge_teachers(subject_states):
+    '''Combines the teachers of every subject into one mapping of name to [email, courses].'''
+
+    merged = {}
+
+    for subject_state in subject_states.values():
+        for name, (email, courses) in subject_state['teachers'].items():
+            merged.setdefault(name, [email, set()])[1].update(courses)
+
+    return dict((name, [email, sorted(courses)]) for name, (email, courses) in merged.items())
+
+
+def incremental_runner(write_to_db_bool, use_json_bool, subjects=None, track_seats_bool=False, term=None, track_instructors_bool=False):
+    '''Like runner, but searches one subject at a time and only parses, prepares and uploads the
+       subjects whose results changed since the last run. Teachers are uploaded in full, merged
+       from every subject, whenever any subject changed.'''
+
+    context = ScrapeContext(term or get_quarters()[0], subjects or get_subjects()['selectedSubjects'])
+    quarter = context.term
+
+    # Loaded once for every subject.
+    catalog = catalog_index.load(FIREBASE_DB)
+
+    state = load_incremental_state()
+    subject_states = state.setdefault(quarter, {})
+
+    # The prepared classes of every subject that changed, and the classes those no longer list.
+    changed = {}
+    changed_subjects = []
+    removed = []
+
+    # Keys of the changed subjects, shared by their validators so a key reused between subjects is caught.
+    seen_keys = set()
+
+    for subject in context.subjects:
+        teacher_email_mapping = {}
+        pages = scrape_subject(context, subject, teacher_email_mapping)
+        digest = fingerprint(pages)
+
+        if subject in subject_states and subject_states[subject]['fingerprint'] == digest:
+            continue
+
+        # Broken classes of the subject are quarantined and the rest go on.
+        validator = validate.Validator(quarter, keys=seen_keys)
+        finished = list(validator.validate(format_list(pages)))
+        validator.close()
+        validator.report()
+
+        if (track_seats_bool):
+            # Seats of unchanged subjects are unchanged, so only changed subjects add to their history.
+            seats.append(seats.record_samples(finished), TIMESTAMP, seats.quarter_path(quarter))
+
+        if (track_instructors_bool):
+            # Replaces only this subject's classes in the registry.
+            instructors.record(quarter, finished, teacher_email_mapping)
+
+        grouped_by_teachers = defaultdict(lambda: [set(), set()])
+        grouped = dict(prepare_courses(group_courses(finished), teacher_email_mapping, grouped_by_teachers, catalog,
+                                       table.SectionTable(finished)))
+        grouped_by_teachers = finish_teachers(grouped_by_teachers)
+
+        # States saved before codes were kept can't tell what was dropped, until the next change.
+        removed.extend(code for code in subject_states.get(subject, {}).get('codes', []) if code not in grouped)
+
+        changed.update(grouped)
+        changed_subjects.append(subject)
+        subject_states[subject] = {'fingerprint': digest, 'teachers': grouped_by_teachers, 'codes': sorted(grouped)}
+
+    print("{} of {} subjects changed: {}\n".format(len(changed_subjects), len(context.subjects), ", ".join(changed_subjects)))
+
+    if (use_json_bool and changed_subjects):
+        # Only the classes of subjects that changed are replaced. Those no longer listed are dropped.
+        print("Exporting changed classes to {}\n".format(GROUPED_PATH))
+        export.merge(changed.items(), GROUPED_PATH, lambda code: code.partition(' ')[0] in changed_subjects)
+
+    if (write_to_db_bool and changed_subjects):
+        # Writes only the classes of subjects that changed, and deletes those they dropped.
+        write_to_db(changed, quarter, removed)
+
+        # Writes the teacher data of every subject to the db.
+        grouped_by_teachers = merge_teachers(subject_states)
         write_teachers_to_db(grouped_by_teachers, quarter)
 
+        # Keeps the snapshot of write_changes_to_db in step with what was just written.
+        published = upload.load_snapshot(quarter)
+
+        if published:
+            published["quarter/" + quarter].update(upload.normalize(changed))
+
+            for code in removed:
+                published["quarter/" + quarter].pop(code, None)
+            published["quarter/" + quarter + " teachers"] = upload.normalize(grouped_by_teachers)
+            upload.save_snapshot(quarter, published)
+
+    save_incremental_state(state)
+
+    print("HTTP cache: " + httpcache.CACHE.report())
+
 
 def main():
     '''The main function.'''
@@ -745,6 +1228,11 @@ def main():
     fake = False
     write = False
     json = True
+    incremental = False
+    all_quarters = False
+    track_seats = True
+    track_instructors = True
+    resume = False
 
     if (reset):
         reset_db()
@@ -752,8 +1240,14 @@ def main():
     if (fake):
         load_fake_data_into_db()
 
+    elif (incremental):
+        incremental_runner(write, json, track_seats_bool=track_seats, track_instructors_bool=track_instructors)
+
+    elif (all_quarters):
+        multi_runner(write, json, track_seats, track_instructors_bool=track_instructors)
+
     else:
-        runner(write, json)
+        runner(write, json, track_seats, resume=resume, track_instructors_bool=track_instructors)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,208 @@
+'''The sections of a quarter as columns of NumPy arrays, one entry per section, so filtering by
+   time or day and formatting times are done over every section at once instead of one dict at
+   a time. Times stay minutes since midnight and days stay bit masks until they are written
+   out. Created by Aykan Fonseca.'''
+
+# Builtins
+import binascii
+from collections import defaultdict
+
+# Pip install packages.
+import numpy
+
+# Our modules.
+import query
+import sections
+
+# Stands in for a TBA time or unknown seats in the integer columns.
+MISSING = -1
+
+# Values on fewer rows than this get their bit masks ORed together a row at a time.
+SPARSE = 64
+
+# Every time of day as format_clock / format_clock_24 writes it, and every day mask as
+# prepare_for_db writes it, ex: MWF or TR. A time of MISSING is the last entry, TBA.
+CLOCKS_12 = numpy.array([sections.format_clock(minutes)[0] for minutes in range(24 * 60)] + ['TBA'], dtype=object)
+CLOCKS_24 = numpy.array(sections.CLOCKS_24 + ['TBA'], dtype=object)
+DAY_STRINGS = numpy.array(sections.DB_DAYS, dtype=object)
+
+
+def integers(values, dtype):
+    '''An array of values, with MISSING for None.'''
+
+    return numpy.array([MISSING if value is None else value for value in values], dtype=dtype)
+
+
+def bit_mask(selected):
+    '''A boolean array as a bit mask of its rows, bit i for row i, like query.SectionIndex uses.'''
+
+    # Packed with the last row first and padded in front, so the bytes read as one number.
+    padded = numpy.concatenate([numpy.zeros(-len(selected) % 8, dtype=bool), selected[::-1]])
+    packed = numpy.packbits(padded).tobytes()
+
+    return int(binascii.hexlify(packed), 16) if packed else 0
+
+
+def group_masks(values, length, keep=None):
+    '''value -> bit mask of the rows having it, for a list of one value per row. Rows whose value
+       keep is False for are left out. Rare values are ORed in directly, common ones packed.'''
+
+    rows = defaultdict(list)
+
+    for row, value in enumerate(values):
+        if keep is None or keep(value):
+            rows[value].append(row)
+
+    masks = {}
+
+    for value, listed in rows.items():
+        if len(listed) < SPARSE:
+            mask = 0
+            for row in listed:
+                mask |= 1 << row
+        else:
+            selected = numpy.zeros(length, dtype=bool)
+            selected[listed] = True
+            mask = bit_mask(selected)
+
+        masks[value] = mask
+
+    return masks
+
+
+class SectionTable(object):
+    '''Every section of a quarter, from sections.Course records like soc.parse_courses yields,
+       as one array per field (struct of arrays). course holds the index of each section's
+       class in courses. start, end, taken and available are MISSING when TBA or unknown, and
+       days is 0. The text fields are object arrays so they can be selected with the same masks.
+
+       table = SectionTable(soc.parse_courses(soc.format_list(master)))
+       table.sections(table.select(days='TuTh', starts_after='5:00p'))'''
+
+    def __init__(self, courses):
+        self.courses = []
+        rows = []
+
+        # The row of the first section of each class, by the id of its record.
+        self.first = {}
+
+        for course in courses:
+            self.first[id(course)] = len(rows)
+
+            for offset, section in enumerate(course.sections):
+                rows.append((len(self.courses), offset, section))
+
+            self.courses.append(course)
+
+        def column(index):
+            return [section[index] for _, _, section in rows]
+
+        # Where each section is: its class in courses, and its place among the class's sections.
+        self.course = numpy.array([course for course, _, _ in rows], dtype=numpy.int32)
+        self.offset = numpy.array([offset for _, offset, _ in rows], dtype=numpy.int16)
+
+        self.days = numpy.array([days or 0 for days in column(3)], dtype=numpy.uint8)
+        self.start = integers(column(4), numpy.int16)
+        self.end = integers(column(5), numpy.int16)
+        self.taken = integers(column(9), numpy.int64)
+        self.available = integers(column(10), numpy.int64)
+
+        self.id = numpy.array(column(0), dtype=object)
+        self.meeting_type = numpy.array(column(1), dtype=object)
+        self.number = numpy.array(column(2), dtype=object)
+        self.building = numpy.array(column(6), dtype=object)
+        self.room = numpy.array(column(7), dtype=object)
+        self.name = numpy.array(column(8), dtype=object)
+        self.department = numpy.array([course.department for course in self.courses], dtype=object)[self.course]
+
+    def __len__(self):
+        return len(self.course)
+
+    def select(self, days=None, starts_after=None, ends_before=None, department=None):
+        '''A boolean array of the sections meeting on all of days, ex: 'MWF', starting at or after
+           starts_after and ending at or before ends_before, of a department. Times are minutes
+           since midnight or like 5:00p. Sections at TBA times don't match either time.'''
+
+        mask = numpy.ones(len(self), dtype=bool)
+
+        if days is not None:
+            wanted = sections.day_mask(days, strict=True)
+            mask &= (self.days & wanted) == wanted
+
+        if starts_after is not None:
+            mask &= self.start >= query.minutes(starts_after)
+
+        if ends_before is not None:
+            mask &= (self.end != MISSING) & (self.end <= query.minutes(ends_before))
+
+        if department is not None:
+            mask &= self.department == department
+
+        return mask
+
+    def sections(self, mask=None):
+        '''The (course, section) pairs of the sections selected by mask, or of every section.'''
+
+        indexes = numpy.arange(len(self)) if mask is None else numpy.flatnonzero(mask)
+        courses = self.courses
+
+        return [(courses[course], courses[course].sections[offset])
+                for course, offset in zip(self.course[indexes].tolist(), self.offset[indexes].tolist())]
+
+    def start_times(self, hours=24):
+        '''The start of every section as text, ex: 14:00 (or 2:00 with hours=12), TBA if unknown.'''
+
+        return (CLOCKS_24 if hours == 24 else CLOCKS_12)[self.start]
+
+    def end_times(self, hours=24):
+        '''The end of every section as text, like start_times.'''
+
+        return (CLOCKS_24 if hours == 24 else CLOCKS_12)[self.end]
+
+    def day_strings(self):
+        '''The days of every section as prepare_for_db writes them, ex: MWF or TR, - if TBA.'''
+
+        return DAY_STRINGS[self.days]
+
+    def is_open(self):
+        '''Whether each section has seats left, like query.is_open.'''
+
+        known = (self.taken != MISSING) & (self.available != MISSING)
+
+        return known & ((self.taken < self.available) | (self.taken == sections.UNLIMITED))
+
+    def db_columns(self):
+        '''The fields of db_sections of every section, as one list per field, with the times and
+           days turned into text at once. The text is shared from lookup tables, so this holds
+           only references, and a list slices without numpy's cost per call.'''
+
+        blank = sections.BLANK
+
+        def text(column):
+            return [value if value else blank for value in column.tolist()]
+
+        def seats(column):
+            return [value if value != MISSING else blank for value in column.tolist()]
+
+        return (text(self.id), self.meeting_type.tolist(), self.number.tolist(), text(self.building), text(self.room),
+                [value if value is not None else blank for value in self.name.tolist()], seats(self.taken),
+                seats(self.available), DAY_STRINGS[self.days].tolist(), CLOCKS_24[self.start].tolist(),
+                CLOCKS_24[self.end].tolist())
+
+    def db_sections(self, start=0, stop=None, columns=None):
+        '''The dictionary sections.section_to_db makes of each section from row start up to stop, or
+           of every section, but for its email. columns are those of db_columns, made once and
+           passed again to make a class's sections only when it is, ex: rows first[id(course)] to
+           first[id(course)] + len(course.sections).'''
+
+        return [{"id": section_id, "meeting type": meeting_type, "number": number,
+                 "building": building, "room": room, "name": name,
+                 "seats taken": taken, "seats available": available,
+                 "days": days, "start time": start_time, "end time": end_time}
+                for section_id, meeting_type, number, building, room, name, taken, available, days, start_time, end_time in
+                zip(*[column[start:stop] for column in columns or self.db_columns()])]
+
+    def minutes(self):
+        '''How long every section meets each day, 0 if TBA.'''
+
+        return numpy.where(self.start == MISSING, 0, self.end - self.start)
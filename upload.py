@@ -0,0 +1,158 @@
+'''Writes many firebase nodes in a handful of requests instead of one each. Created by Aykan Fonseca.'''
+
+# Builtins
+import json
+import os
+import time
+
+# Pip install packages.
+import requests
+
+# Our modules.
+import controller
+
+# Nodes sent in one request.
+BATCH_SIZE = 500
+
+# Where the last document published for each quarter is kept.
+SNAPSHOT_DIR = 'snapshots'
+
+
+class BulkWriter(object):
+    '''Collects writes and sends them as multi-location PATCH requests to the firebase REST api.
+       Each key of a PATCH is a full path and its node is replaced, like a put, so a batch can be
+       sent again after a failure without changing the result. Writing None removes a node.
+       All requests share one pooled connection and go through request_controller, or the shared
+       controller.CONTROLLER, which paces them and sends them again on connection errors,
+       timeouts, 429s and 5xx, after Retry-After when firebase gives one.
+
+       with BulkWriter(FIREBASE_DB) as writer:
+           writer.put('/quarter/WI19/CSE 100', course)'''
+
+    def __init__(self, dsn, batch_size=BATCH_SIZE, request_controller=None):
+        self.url = dsn.rstrip('/') + '/.json'
+        self.batch_size = batch_size
+        self.pending = {}
+
+        adapter = controller.ControlledAdapter(request_controller, pool_connections=1, pool_maxsize=1)
+        self.session = requests.Session()
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+
+        # What was sent so far: nodes, requests, bytes and seconds of each request, retries included.
+        self.nodes = 0
+        self.requests = 0
+        self.bytes = 0
+        self.latencies = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        # Only send what's left if nothing went wrong.
+        if exc_type is None:
+            self.flush()
+
+        self.session.close()
+
+    def put(self, path, value):
+        '''Replaces the node at path. Sent once batch_size nodes are waiting.'''
+
+        self.pending[path.strip('/')] = value
+
+        if len(self.pending) >= self.batch_size:
+            self.flush()
+
+    def delete(self, path):
+        '''Removes the node at path.'''
+
+        self.put(path, None)
+
+    def put_all(self, path, dictionary):
+        '''Replaces every child of path given in dictionary, leaving the other children alone.'''
+
+        for key in dictionary:
+            self.put(path.rstrip('/') + '/' + key, dictionary[key])
+
+    def flush(self):
+        '''Sends everything waiting as one request.'''
+
+        if not self.pending:
+            return
+
+        body = json.dumps(self.pending).encode('utf_8')
+        start = time.time()
+
+        try:
+            # Retried by the controller. What is still failing after that, or a client error like
+            # a bad path, which won't go away by sending again, is raised.
+            self.session.patch(self.url, data=body).raise_for_status()
+        finally:
+            self.latencies.append(time.time() - start)
+            self.requests += 1
+            self.bytes += len(body)
+
+        self.nodes += len(self.pending)
+        self.pending = {}
+
+
+def normalize(value):
+    '''The value as it comes back from firebase: string keys, lists for tuples.'''
+
+    return json.loads(json.dumps(value))
+
+
+def diff(old, new, path=''):
+    '''The writes that turn old into new, as {path: value}. Unchanged nodes are left out and
+       removed nodes are None. Both must be normalized. A path never appears along with one of
+       its ancestors, so the writes can go in one multi-location PATCH.'''
+
+    changes = {}
+
+    if isinstance(old, dict) and isinstance(new, dict):
+        for key in new:
+            if key not in old:
+                changes[path + key] = new[key]
+            elif old[key] != new[key]:
+                changes.update(diff(old[key], new[key], path + key + '/'))
+
+        for key in old:
+            if key not in new:
+                changes[path + key] = None
+
+    elif old != new:
+        changes[path.rstrip('/')] = new
+
+    return changes
+
+
+def snapshot_path(quarter):
+    return os.path.join(SNAPSHOT_DIR, quarter + '.json')
+
+
+def load_snapshot(quarter):
+    '''The last document published for a quarter, or an empty one.'''
+
+    try:
+        with open(snapshot_path(quarter)) as file:
+            return json.load(file)
+    except (IOError, ValueError):
+        return {}
+
+
+def save_snapshot(quarter, document):
+    '''Saves the document just published for a quarter. Written to a new file first so an
+       interrupted save never leaves half a snapshot behind.'''
+
+    # Several quarters may get here at once.
+    try:
+        os.makedirs(SNAPSHOT_DIR)
+    except OSError:
+        pass
+
+    path = snapshot_path(quarter)
+
+    with open(path + '.tmp', 'w') as file:
+        json.dump(document, file)
+
+    os.rename(path + '.tmp', path)
@@ -0,0 +1,277 @@
+'''Checks every class as soon as it is parsed, instead of the whole quarter after. A class that
+   can't be parsed, has a broken record or reuses a key is set aside in a quarantine file with
+   the strings it was parsed from, and the run goes on without it. Once the parser is fixed, the
+   quarantine can be replayed without scraping again. Created by Aykan Fonseca.'''
+
+# Builtins
+import json
+import os
+import time
+from collections import Counter
+
+# Our modules.
+import sections
+
+# Where the classes set aside for a quarter are kept, one per line.
+QUARANTINE_PATH = 'quarantine/{}.ndjson'
+
+# What the parser raises on a class it doesn't understand.
+PARSE_ERRORS = (ValueError, IndexError, KeyError, AttributeError, TypeError)
+
+# Minutes in a day and day masks, as times index sections.CLOCKS_24 and days sections.DB_DAYS.
+DAY_MINUTES = len(sections.CLOCKS_24)
+DAY_MASKS = len(sections.DB_DAYS)
+
+
+def entry_id(key, lines):
+    '''What tells quarantined classes apart: their key and the strings they were parsed from.'''
+
+    return key, json.dumps(lines, sort_keys=True)
+
+
+def parse(lst):
+    '''sections.parse_course, with the error instead of raising it: (course, None) or (None, error).'''
+
+    try:
+        return sections.parse_course(lst), None
+    except PARSE_ERRORS as error:
+        return None, '{}: {}'.format(type(error).__name__, error)
+
+
+def parse_batch(batch):
+    '''parse for a batch of classes, in a worker process, as (course, error, strings). The strings
+       of every class are sent back, as a class can still be quarantined for its record or key
+       once it is back, and the quarantine needs them for replay.'''
+
+    results = []
+
+    for lst in batch:
+        course, error = parse(lst)
+        results.append((course, error, lst))
+
+    return results
+
+
+def section_problems(section):
+    '''What is wrong with a parsed section, as (kind, message) pairs.'''
+
+    found = []
+
+    if not section.meeting_type or not section.number:
+        found.append(('bad section', 'no meeting type or number'))
+
+    if section.days is not None and not 0 <= section.days < DAY_MASKS:
+        found.append(('bad days', 'days {!r} in {}'.format(section.days, section.number)))
+
+    if section.start is not None and not 0 <= section.start <= section.end < DAY_MINUTES:
+        found.append(('bad times', 'from {!r} to {!r} in {}'.format(section.start, section.end, section.number)))
+
+    if any(seats is not None and seats < 0 for seats in (section.taken, section.available)):
+        found.append(('bad seats', '{!r} of {!r} in {}'.format(section.taken, section.available, section.number)))
+
+    return found
+
+
+def problems(course):
+    '''What is wrong with a parsed class, as (kind, message) pairs, so it can't be grouped or
+       written to the db. Empty if nothing is.'''
+
+    found = []
+
+    if not isinstance(course.key, int):
+        found.append(('bad key', 'key {!r}'.format(course.key)))
+
+    if course.department is None or course.number is None:
+        found.append(('missing header', 'no department or course number'))
+
+    if not course.sections:
+        found.append(('no sections', 'no section lines'))
+
+    for section in course.sections:
+        _, meeting_type, number, days, start, end, _, _, _, taken, available = section
+
+        # Sound sections, nearly all of them, take this one test.
+        if not (meeting_type and number and (days is None or 0 <= days < DAY_MASKS)
+                and (start is None or 0 <= start <= end < DAY_MINUTES)
+                and (taken is None or taken >= 0) and (available is None or available >= 0)):
+            found.extend(section_problems(section))
+
+    return found
+
+
+class Validator(object):
+    '''Checks the classes of a quarter one at a time, as they are parsed: every record must be
+       sound and its key must not have been seen before. A class failing either is written to
+       the quarantine file straight away and dropped. Anomalies are counted by kind, and added
+       to run_metrics, a metrics.Metrics, if given. keys are those already let through; a set
+       is shared, not copied, so validators of several subjects catch keys reused between them.
+       mode is how the quarantine file is opened, 'ab' to add to it or 'wb' to start it over.
+
+       validator = Validator('FA19')
+       finished = list(validator.validate(format_list(pages)))'''
+
+    def __init__(self, quarter, path=None, run_metrics=None, keys=(), mode='ab'):
+        self.quarter = quarter
+        self.path = path or QUARANTINE_PATH.format(quarter)
+        self.run_metrics = run_metrics
+        self.mode = mode
+
+        # Keys of the classes let through, by this validator and any sharing the set.
+        self.seen = keys if isinstance(keys, set) else set(keys)
+        self.passed = 0
+
+        self.anomalies = Counter()
+        self.quarantined = 0
+        self.file = None
+
+        # entry_id of every class in the file, so one quarantined again by a rerun is written once.
+        self.written = set()
+
+    def check(self, lst, course=None, error=None):
+        '''The parsed class if it is sound, or None once it is quarantined. course and error are
+           what parse gives for lst. Classes are parsed here if neither is given.'''
+
+        if course is None and error is None:
+            course, error = parse(lst)
+
+        if error is not None:
+            found = [('unparseable', error)]
+        else:
+            found = problems(course)
+
+            if course.key in self.seen:
+                found.append(('duplicate key', 'key {} already seen'.format(course.key)))
+
+        if found:
+            self.quarantine(lst, found, course)
+            return None
+
+        self.seen.add(course.key)
+        self.passed += 1
+
+        return course
+
+    def validate(self, results):
+        '''Yields the sound classes of the strings of every class, ex: format_list's, as each is parsed.'''
+
+        for lst in results:
+            course = self.check(lst)
+
+            if course is not None:
+                yield course
+
+    def validate_parsed(self, results):
+        '''Like validate, for the (course, error, strings) of parse_batch.'''
+
+        for course, error, lst in results:
+            course = self.check(lst, course, error)
+
+            if course is not None:
+                yield course
+
+    def quarantine(self, lst, found, course=None):
+        '''Appends a class and what was found wrong with it to the quarantine file, unless the
+           file already has it, ex: from an earlier run of the same quarter.'''
+
+        for kind, _ in found:
+            self.anomalies[kind] += 1
+
+            if self.run_metrics is not None:
+                self.run_metrics.count('quarantined ' + kind)
+
+        if self.run_metrics is not None:
+            self.run_metrics.count('parse errors')
+
+        if self.file is None:
+            directory = os.path.dirname(self.path)
+
+            if directory and not os.path.isdir(directory):
+                os.makedirs(directory)
+
+            if 'a' in self.mode:
+                self.written.update(entry_id(entry['key'], entry['lines']) for entry in load(self.path))
+
+            self.file = open(self.path, self.mode)
+
+        key = course.key if course is not None else None
+        self.quarantined += 1
+
+        if entry_id(key, lst) in self.written:
+            return
+
+        self.written.add(entry_id(key, lst))
+
+        entry = {'quarter': self.quarter, 'time': int(time.time()), 'key': key,
+                 'problems': [[kind, message] for kind, message in found], 'lines': lst}
+
+        # Written out at once, so a run dying later still leaves it behind.
+        self.file.write((json.dumps(entry) + '\n').encode('utf_8'))
+        self.file.flush()
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+    def report(self):
+        '''Prints how many classes were quarantined and why.'''
+
+        if not self.quarantined:
+            print("Validated {} classes, none quarantined.".format(self.passed))
+            return
+
+        print("Validated {} classes, quarantined {} to {}:".format(self.passed, self.quarantined, self.path))
+
+        for kind, count in sorted(self.anomalies.items()):
+            print("  - {}: {}".format(kind, count))
+
+
+def load(path):
+    '''Yields the entries of a quarantine file.'''
+
+    if not os.path.exists(path):
+        return
+
+    with open(path, 'rb') as file:
+        for line in file:
+            if line.strip():
+                yield json.loads(line.decode('utf_8'))
+
+
+def replay(quarter, keys=(), path=None):
+    '''Parses and checks the quarantined classes of a quarter again, ex: once the parser is fixed.
+       Returns the classes that are sound now, as sections.Course records, and leaves only those
+       that still aren't in the file. keys are those already in the quarter, so classes
+       quarantined for reusing one stay quarantined. The classes returned aren't added to any
+       export or to firebase: replay is for checking a parser fix, and the next run of
+       soc.runner parses them again from the site.'''
+
+    path = path or QUARANTINE_PATH.format(quarter)
+
+    # A class quarantined again by a rerun, before the file skipped it, is only replayed once.
+    entries = []
+    replayed = set()
+
+    for entry in load(path):
+        if entry_id(entry['key'], entry['lines']) not in replayed:
+            replayed.add(entry_id(entry['key'], entry['lines']))
+            entries.append(entry)
+
+    if not entries:
+        return []
+
+    # Classes still failing go to a new file, which replaces the old one. A tmp left by a replay
+    # that died is started over, not added to.
+    validator = Validator(quarter, path + '.tmp', keys=set(keys), mode='wb')
+    recovered = [course for course in (validator.check(entry['lines']) for entry in entries) if course is not None]
+    validator.close()
+
+    if validator.quarantined:
+        os.rename(validator.path, path)
+    else:
+        os.remove(path)
+
+    print("Replayed {} quarantined classes of {}: {} recovered, {} still quarantined.".format(
+        len(entries), quarter, len(recovered), validator.quarantined))
+
+    return recovered
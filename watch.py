@@ -0,0 +1,270 @@
+'''Watches the seats of a few sections without scraping the whole Schedule of Classes. Only the
+   subjects and pages holding the sections are fetched, and each section is polled more often
+   the closer it is to full or the faster its seats are moving. Created by Aykan Fonseca.'''
+
+# Builtins
+import argparse
+import heapq
+import itertools
+import sys
+import time
+from collections import defaultdict
+
+# Our modules.
+import export
+import seats
+import sections
+import soc
+
+# Where runner saves the classes it prepared, used to find the subject of a section id.
+GROUPED_PATH = soc.GROUPED_PATH
+
+# Bounds on how long a section goes between polls, in seconds.
+MIN_INTERVAL = 60
+MAX_INTERVAL = 15 * 60
+
+
+def resolve(targets, grouped_path=GROUPED_PATH):
+    '''Groups targets by subject. Course codes like 'CSE 100' name their subject; section ids are
+       looked up in the classes of a previous run. Returns the subjects and any ids not found.'''
+
+    subjects = defaultdict(set)
+    ids = set()
+
+    for target in targets:
+        if ' ' in target:
+            subjects[target.partition(' ')[0]].add(target)
+        else:
+            ids.add(target)
+
+    if ids:
+        try:
+            # Read a class at a time, so a whole quarter is never in memory.
+            for code, course in export.load(grouped_path):
+                found = ids.intersection(section_ids(course))
+
+                subjects[code.partition(' ')[0]].update(found)
+                ids -= found
+        except (IOError, ValueError):
+            pass
+
+    return subjects, ids
+
+
+def section_ids(value):
+    '''Every section id anywhere inside a class of GROUPED_PATH.'''
+
+    if isinstance(value, dict):
+        if 'id' in value:
+            yield value['id']
+
+        for item in value.values():
+            for section_id in section_ids(item):
+                yield section_id
+
+
+def locate(pages):
+    '''Splits (page number, class strings) pairs into classes like format_list, returning each
+       class as a dictionary along with the pages it was found on.'''
+
+    tagged = ((page, item) for page, page_list in pages for item in page_list)
+
+    for delimiter, group in itertools.groupby(tagged, lambda x: x[1] == ' NXC'):
+        group = list(group)
+        lst = [item for _, item in group]
+
+        if delimiter or 'Cancelled' in lst or not sections.KEY_REGEX.search(str(lst)):
+            continue
+
+        yield set(page for page, _ in group), sections.course_to_dict(sections.parse_course(lst), soc.TIMESTAMP)
+
+
+def next_interval(previous, current, elapsed, min_interval=MIN_INTERVAL, max_interval=MAX_INTERVAL):
+    '''Seconds until a section is polled again. Sections are polled more often the closer they
+       are to full, and at least as often as their seats have been changing since the last poll.'''
+
+    taken, available = current
+
+    # Unlimited or no seat information, nothing to wait for.
+    if taken == sections.UNLIMITED or not available:
+        return max_interval
+
+    fill = min(1.0, float(taken) / available)
+    interval = min_interval + (max_interval - min_interval) * (1 - fill) ** 2
+
+    if previous is not None and elapsed:
+        moved = abs(taken - previous[0]) + abs(available - previous[1])
+
+        if moved:
+            interval = min(interval, elapsed / moved)
+
+    return max(min_interval, min(max_interval, interval))
+
+
+class Watcher(object):
+    '''Polls the sections of a few subjects of a quarter, given as a soc.ScrapeContext, on a schedule.
+       Every section is keyed like seats.section_key and remembers its subject, its pages and its last seats.'''
+
+    def __init__(self, context, subjects, store=None, min_interval=MIN_INTERVAL, max_interval=MAX_INTERVAL):
+        self.context = context
+        self.subjects = subjects
+        self.store = store
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+
+        # Section key -> {'subject', 'code', 'pages', 'seats', 'polled', 'due'}.
+        self.watched = {}
+
+        # (time due, section key), the next section to poll first.
+        self.schedule = []
+
+        # Requests made so far.
+        self.requests = 0
+
+    def search(self, subject):
+        '''Searches a single subject, returning its number of pages.'''
+
+        self.requests += 1
+
+        return soc.count_pages(dict(self.context.post_data, selectedSubjects=[subject]), self.context.session)
+
+    def fetch(self, subject, numbers):
+        '''Fetches some pages of the subject last searched, as runs of consecutive pages so classes
+           split across two pages come back whole.'''
+
+        url_page_tuple = [(soc.SOC_URL + str(x), x) for x in sorted(numbers)]
+        self.requests += len(url_page_tuple)
+
+        pages = []
+        for page, content in soc.fetch_pages(url_page_tuple, session=self.context.session):
+            page_list, _ = soc.parse_page(content, {}, subject)
+            pages.append((page, page_list))
+
+        runs = itertools.groupby(enumerate(pages), lambda x: x[1][0] - x[0])
+
+        for _, run in runs:
+            for found in locate(page for _, page in run):
+                yield found
+
+    def discover(self, subject, now):
+        '''Fetches every page of a subject once to find the pages of its targets.'''
+
+        number_pages = self.search(subject)
+        targets = self.subjects[subject]
+
+        for pages, course in self.fetch(subject, range(1, number_pages + 1)):
+            code = '{} {}'.format(course['department'], course['course number'])
+
+            for key, taken, available in seats.section_samples([course]):
+                if key in targets or code in targets:
+                    self.update(key, subject, code, pages, (taken, available), now)
+
+        missing = [x for x in targets if x not in self.watched and
+                   not any(y['code'] == x for y in self.watched.values())]
+        if missing:
+            print("Not found in {}: {}".format(subject, ", ".join(sorted(missing))))
+
+    def update(self, key, subject, code, pages, current, now):
+        '''Records a section's seats and schedules its next poll.'''
+
+        section = self.watched.get(key)
+
+        if section is None:
+            section = self.watched[key] = {'subject': subject, 'code': code, 'seats': None, 'polled': None}
+            print("Watching {} ({}): {} taken of {}".format(key, code, current[0], current[1]))
+
+        elif section['seats'] != current:
+            print("{} ({}): {} taken of {}, was {} of {}".format(key, code, current[0], current[1], *section['seats']))
+
+        elapsed = now - section['polled'] if section['polled'] is not None else None
+        interval = next_interval(section['seats'], current, elapsed, self.min_interval, self.max_interval)
+        section.update(pages=pages, seats=current, polled=now, due=now + interval)
+
+        heapq.heappush(self.schedule, (section['due'], key))
+
+    def poll(self, subject, keys, now):
+        '''Polls the pages of some sections of a subject. Rediscovers the subject if its pages moved.'''
+
+        number_pages = self.search(subject)
+        numbers = set(page for key in keys for page in self.watched[key]['pages'] if page <= number_pages)
+
+        found = set()
+        for pages, course in self.fetch(subject, numbers):
+            for key, taken, available in seats.section_samples([course]):
+                if key in keys:
+                    self.update(key, subject, self.watched[key]['code'], pages, (taken, available), now)
+                    found.add(key)
+
+        # Classes were added or dropped and shifted the pages, so look again.
+        if found != set(keys):
+            for key in set(keys) - found:
+                del self.watched[key]
+
+            self.discover(subject, now)
+
+        if self.store is not None:
+            self.store.ingest(((key, self.watched[key]['seats'][0], self.watched[key]['seats'][1]) for key in found),
+                              int(time.strftime("%Y%m%d%H%M")))
+
+    def run(self, rounds=None):
+        '''Polls sections as they come due, forever or for a number of rounds.'''
+
+        now = time.time()
+        for subject in sorted(self.subjects):
+            self.discover(subject, now)
+
+        completed = 0
+        while self.schedule and (rounds is None or completed < rounds):
+            due, _ = self.schedule[0]
+            time.sleep(max(0, due - time.time()))
+            now = time.time()
+
+            # Everything due by now, by subject.
+            by_subject = defaultdict(set)
+            while self.schedule and self.schedule[0][0] <= now:
+                due, key = heapq.heappop(self.schedule)
+
+                # Skips sections no longer watched or polled again since this was scheduled.
+                if key in self.watched and self.watched[key]['due'] == due:
+                    by_subject[self.watched[key]['subject']].add(key)
+
+            requests = self.requests
+            for subject in sorted(by_subject):
+                self.poll(subject, by_subject[subject], now)
+
+            completed += 1
+
+            print("Polled {} sections with {} requests\n".format(sum(len(x) for x in by_subject.values()),
+                                                                self.requests - requests))
+
+
+def main():
+    '''The main function.'''
+    print(sys.version)
+
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('targets', nargs='+', help="section ids, ex: 123456, or course codes, ex: 'CSE 100'")
+    parser.add_argument('--grouped', default=GROUPED_PATH, help='classes of a previous run, to find section ids')
+    parser.add_argument('--rounds', type=int, help='stop after this many polls')
+    parser.add_argument('--min-interval', type=float, default=MIN_INTERVAL, help='seconds between polls of a full section')
+    parser.add_argument('--max-interval', type=float, default=MAX_INTERVAL, help='seconds between polls of an empty section')
+    parser.add_argument('--term', help='quarter to watch, ex: FA19. Defaults to the latest')
+    parser.add_argument('--history', help="seat history to add to, '' for none. Defaults to the quarter's")
+    args = parser.parse_args()
+
+    subjects, missing = resolve(args.targets, args.grouped)
+
+    if missing:
+        print("Not in {}, skipping: {}".format(args.grouped, ", ".join(sorted(missing))))
+
+    context = soc.ScrapeContext(args.term or soc.get_quarters()[0], sorted(subjects))
+
+    history = seats.quarter_path(context.term) if args.history is None else args.history
+    store = seats.SeatStore(history) if history else None
+
+    watcher = Watcher(context, subjects, store, args.min_interval, args.max_interval)
+    watcher.run(args.rounds)
+
+
+if __name__ == '__main__':
+    main()